@@ -0,0 +1,362 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import database
+import instrumentation
+
+# Copie en colonnes du grand livre (fichiers Parquet, chargés en tables Arrow) pour les rapports:
+# les agrégations sont exécutées par pyarrow sur des colonnes entières, SQLite ne sert que le transactionnel.
+# La copie est rafraîchie de façon incrémentale: nouveaux paiements par identifiant, opérations modifiées
+# par date_modification. Répertoire surchargeable par la variable VENTES_TERME_ANALYTIQUE.
+REPERTOIRE = os.environ.get('VENTES_TERME_ANALYTIQUE')
+# Lignes lues de SQLite par bloc, et fichiers de paiements au-delà desquels ils sont fusionnés en un seul
+TAILLE_BLOC = 100000
+MAX_FRAGMENTS = 32
+
+SCHEMAS = {
+    'clients': pa.schema([
+        ('id', pa.int64()),
+        ('nom', pa.string()),
+        ('date_creation', pa.string()),
+    ]),
+    'operations': pa.schema([
+        ('id', pa.int64()),
+        ('client_id', pa.int64()),
+        ('valeur_marchandise', pa.float64()),
+        ('taux_benefice', pa.float64()),
+        ('duree_mois', pa.float64()),
+        ('montant_total', pa.float64()),
+        ('total_paye', pa.float64()),
+        ('reste_a_payer', pa.float64()),
+        ('statut', pa.string()),
+        ('en_retard', pa.int64()),
+        ('date_creation', pa.string()),
+        ('date_cloture', pa.string()),
+        ('date_modification', pa.string()),
+    ]),
+    'paiements': pa.schema([
+        ('id', pa.int64()),
+        ('operation_id', pa.int64()),
+        ('client_id', pa.int64()),
+        ('type_paiement', pa.string()),
+        ('montant', pa.float64()),
+        ('date_paiement', pa.string()),
+    ]),
+}
+
+_copie = {}
+_verrou = threading.RLock()
+
+
+def repertoire():
+    return REPERTOIRE or os.path.splitext(database.DB_PATH)[0] + '_analytique'
+
+
+def _chemin(*parties):
+    return os.path.join(repertoire(), *parties)
+
+
+def _fragments():
+    dossier = _chemin('paiements')
+    if not os.path.isdir(dossier):
+        return []
+    return sorted(os.path.join(dossier, f) for f in os.listdir(dossier) if f.endswith('.parquet'))
+
+
+# Écriture atomique: un lecteur (autre processus) ne voit jamais un fichier à moitié écrit
+def _ecrire_parquet(table, chemin):
+    pq.write_table(table, chemin + '.tmp')
+    os.replace(chemin + '.tmp', chemin)
+
+
+def _lire_meta():
+    try:
+        with open(_chemin('meta.json'), encoding='utf-8') as fichier:
+            return json.load(fichier)
+    except (OSError, ValueError):
+        return {}
+
+
+def _ecrire_meta(meta):
+    with open(_chemin('meta.json.tmp'), 'w', encoding='utf-8') as fichier:
+        json.dump(meta, fichier)
+    os.replace(_chemin('meta.json.tmp'), _chemin('meta.json'))
+
+
+# Tables Arrow de la copie (rapports, prévisions), chargées depuis le disque au premier accès du processus
+# et rechargées dès que meta.json diffère de celui d'après lequel elles ont été lues (copie rafraîchie
+# par un autre processus)
+def tables():
+    with _verrou:
+        meta = _lire_meta()
+        if _copie.get('repertoire') != repertoire() or _copie.get('meta') != meta:
+            _copie.clear()
+            _copie.update(repertoire=repertoire(), meta=meta)
+            for table in ('clients', 'operations'):
+                chemin = _chemin(f'{table}.parquet')
+                _copie[table] = pq.read_table(chemin) if os.path.exists(chemin) else SCHEMAS[table].empty_table()
+            fragments = [pq.read_table(f) for f in _fragments()]
+            _copie['paiements'] = pa.concat_tables(fragments) if fragments else SCHEMAS['paiements'].empty_table()
+        return _copie
+
+
+# Connexion de lecture des tables copiées, avec les archives si elles existent, dans une transaction
+# de lecture (instantané cohérent de toutes les tables): produit (connexion, table ou vue par table, date
+# prise avant l'ouverture de l'instantané: toute modification absente de celui-ci est datée au plus tôt
+# de la même seconde)
+@contextmanager
+def _lecture():
+    if os.path.exists(database.chemin_archive()):
+        contexte, sources = database.connexion_archive(), {t: database.VUES_ARCHIVE.get(t, t) for t in SCHEMAS}
+    else:
+        contexte, sources = database.connexion(), {t: t for t in SCHEMAS}
+    with contexte as conn:
+        debut = conn.execute("SELECT datetime('now', 'localtime')").fetchone()[0]
+        conn.execute('BEGIN')
+        try:
+            yield conn, sources, debut
+        finally:
+            conn.rollback()
+
+
+# Lire les lignes de `source` par blocs de TAILLE_BLOC, en table Arrow au schéma de la copie
+def _extraire(conn, source, schema, condition='1', parametres=()):
+    blocs = [pa.Table.from_pandas(bloc, schema=schema, preserve_index=False)
+             for bloc in pd.read_sql_query(f"SELECT {', '.join(schema.names)} FROM {source} WHERE {condition}",
+                                           conn, params=parametres, chunksize=TAILLE_BLOC)]
+    return pa.concat_tables(blocs) if blocs else schema.empty_table()
+
+
+def _compter(conn, source):
+    return conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+
+
+# Mettre la copie à jour depuis SQLite (tout relire si `reconstruire`). Renvoie le nombre de lignes
+# lues et retirées par table.
+@instrumentation.tracer
+def rafraichir(reconstruire=False):
+    with _verrou, _lecture() as (conn, sources, debut_lecture):
+        os.makedirs(_chemin('paiements'), exist_ok=True)
+        if reconstruire or not _lire_meta():
+            for fragment in _fragments():
+                os.remove(fragment)
+            _copie.clear()
+            _copie.update({table: schema.empty_table() for table, schema in SCHEMAS.items()},
+                          repertoire=repertoire(), meta={})
+            copie = _copie
+        else:
+            copie = tables()
+        # Rafraîchissement depuis l'état d'où vient la copie en mémoire
+        meta = copie['meta']
+        bilan = {'reconstruction': not meta}
+
+        # Clients: peu nombreux, relus entièrement
+        copie['clients'] = _extraire(conn, sources['clients'], SCHEMAS['clients'])
+        _ecrire_parquet(copie['clients'], _chemin('clients.parquet'))
+        bilan['clients'] = len(copie['clients'])
+
+        # Opérations modifiées depuis le début de la lecture précédente (dates à la seconde: cette seconde-là
+        # est relue). Toute opération de la base étant alors dans la copie, un nombre de lignes différent
+        # signale des suppressions, retrouvées par les identifiants; tout autre écart fait tout relire.
+        derniere_modification = meta.get('derniere_modification')
+        if derniere_modification is None:
+            modifiees = _extraire(conn, sources['operations'], SCHEMAS['operations'])
+        else:
+            modifiees = _extraire(conn, sources['operations'], SCHEMAS['operations'], 'date_modification >= ?',
+                                  (derniere_modification,))
+        operations = copie['operations']
+        operations = pa.concat_tables([operations.filter(pc.invert(pc.is_in(operations['id'], modifiees['id']))),
+                                       modifiees])
+        existantes = None
+        bilan['operations'] = len(modifiees)
+        bilan['operations_supprimees'] = 0
+        if len(operations) != _compter(conn, sources['operations']):
+            existantes = pa.array([ligne[0] for ligne in conn.execute(f"SELECT id FROM {sources['operations']}")],
+                                  pa.int64())
+            conservees = operations.filter(pc.is_in(operations['id'], existantes))
+            bilan['operations_supprimees'] = len(operations) - len(conservees)
+            operations = conservees
+            if len(operations) != len(existantes):
+                operations = _extraire(conn, sources['operations'], SCHEMAS['operations'])
+                bilan['operations'] = len(operations)
+                bilan['reconstruction'] = True
+        if len(modifiees) or existantes is not None:
+            copie['operations'] = operations
+            _ecrire_parquet(operations, _chemin('operations.parquet'))
+
+        # Paiements: seulement ajoutés, ou supprimés avec leur opération; tout autre écart de nombre
+        # (correction manuelle) fait tout relire
+        dernier_paiement = meta.get('dernier_paiement', 0)
+        paiements = copie['paiements']
+        restants = paiements if existantes is None else paiements.filter(pc.is_in(paiements['operation_id'], existantes))
+        nouveaux = _extraire(conn, sources['paiements'], SCHEMAS['paiements'], 'id > ?', (dernier_paiement,))
+        if len(restants) + len(nouveaux) != _compter(conn, sources['paiements']):
+            for fragment in _fragments():
+                os.remove(fragment)
+            restants = SCHEMAS['paiements'].empty_table()
+            nouveaux = _extraire(conn, sources['paiements'], SCHEMAS['paiements'])
+            dernier_paiement = 0
+            bilan['reconstruction'] = True
+        bilan['paiements_supprimes'] = len(paiements) - len(restants)
+        bilan['paiements'] = len(nouveaux)
+        copie['paiements'] = pa.concat_tables([restants, nouveaux])
+
+        fragments = _fragments()
+        if bilan['paiements_supprimes'] or len(fragments) >= MAX_FRAGMENTS:
+            _ecrire_parquet(copie['paiements'], _chemin('paiements', 'paiements.parquet'))
+            for fragment in fragments:
+                if os.path.basename(fragment) != 'paiements.parquet':
+                    os.remove(fragment)
+        elif len(nouveaux):
+            _ecrire_parquet(nouveaux, _chemin('paiements', f"{dernier_paiement + 1:012d}.parquet"))
+
+        copie['meta'] = {
+            'dernier_paiement': pc.max(copie['paiements']['id']).as_py() if len(copie['paiements']) else 0,
+            'derniere_modification': debut_lecture,
+        }
+        _ecrire_meta(copie['meta'])
+        return bilan
+
+
+def _mois(colonne):
+    return pc.utf8_slice_codeunits(colonne, 0, 7)
+
+
+# Agréger `table` par `cles`; `agregats` associe chaque colonne produite à (colonne source, fonction)
+def _agreger(table, cles, agregats):
+    resultat = table.group_by(cles).aggregate(list(agregats.values()))
+    noms = {f"{colonne}_{fonction}": nom for nom, (colonne, fonction) in agregats.items()}
+    resultat = resultat.rename_columns([noms.get(n, n) for n in resultat.column_names])
+    return resultat.select(cles + list(agregats))
+
+
+# Bénéfice contractuel des opérations par mois de création, avec le taux moyen et la marge (bénéfice / valeur)
+@instrumentation.tracer
+def benefice_par_mois():
+    operations = tables()['operations']
+    table = pa.table({
+        'mois': _mois(operations['date_creation']),
+        'id': operations['id'],
+        'valeur_marchandise': operations['valeur_marchandise'],
+        'montant_total': operations['montant_total'],
+        'benefice': pc.subtract(operations['montant_total'], operations['valeur_marchandise']),
+        'taux_benefice': operations['taux_benefice'],
+    })
+    resultat = _agreger(table, ['mois'], {
+        'nb_operations': ('id', 'count'),
+        'valeur_marchandise': ('valeur_marchandise', 'sum'),
+        'montant_total': ('montant_total', 'sum'),
+        'benefice': ('benefice', 'sum'),
+        'taux_moyen': ('taux_benefice', 'mean'),
+    })
+    resultat = resultat.append_column('marge', pc.divide(resultat['benefice'], resultat['valeur_marchandise']))
+    return resultat.sort_by('mois').to_pandas()
+
+
+# Encaissements par mois de paiement, dont paiements anticipés
+@instrumentation.tracer
+def encaissements_par_mois():
+    paiements = tables()['paiements']
+    table = pa.table({
+        'mois': _mois(paiements['date_paiement']),
+        'id': paiements['id'],
+        'montant': paiements['montant'],
+        'anticipe': pc.if_else(pc.equal(paiements['type_paiement'], 'Anticipé'), paiements['montant'], 0.0),
+    })
+    resultat = _agreger(table, ['mois'], {
+        'nb_paiements': ('id', 'count'),
+        'encaisse': ('montant', 'sum'),
+        'dont_anticipe': ('anticipe', 'sum'),
+    })
+    return resultat.sort_by('mois').to_pandas()
+
+
+# Encaissements et encours par client, des plus gros encaissements aux plus petits
+@instrumentation.tracer
+def encaissements_par_client(limite=None):
+    copie = tables()
+    operations = copie['operations']
+    en_cours = pc.equal(operations['statut'], 'En cours')
+    par_operations = _agreger(pa.table({
+        'client_id': operations['client_id'],
+        'id': operations['id'],
+        'montant_total': operations['montant_total'],
+        'encours': pc.if_else(en_cours, operations['reste_a_payer'], 0.0),
+    }), ['client_id'], {
+        'nb_operations': ('id', 'count'),
+        'montant_total': ('montant_total', 'sum'),
+        'encours': ('encours', 'sum'),
+    })
+    # Date du dernier paiement enregistré (identifiant le plus grand): un maximum d'entiers par groupe
+    # au lieu d'un maximum de chaînes
+    paiements = copie['paiements']
+    par_paiements = _agreger(paiements, ['client_id'], {
+        'nb_paiements': ('id', 'count'),
+        'encaisse': ('montant', 'sum'),
+        'dernier_id': ('id', 'max'),
+    })
+    par_paiements = par_paiements.append_column('dernier_paiement', pc.take(
+        paiements['date_paiement'], pc.index_in(par_paiements['dernier_id'], paiements['id'])))
+    clients = copie['clients'].select(['id', 'nom']).rename_columns(['client_id', 'client_nom'])
+    resultat = (par_operations.join(par_paiements, 'client_id', join_type='left outer')
+                .join(clients, 'client_id', join_type='left outer'))
+    resultat = resultat.select(['client_id', 'client_nom', 'nb_operations', 'montant_total', 'nb_paiements',
+                                'encaisse', 'encours', 'dernier_paiement'])
+    resultat = resultat.sort_by([('encaisse', 'descending'), ('client_id', 'ascending')])
+    if limite is not None:
+        resultat = resultat.slice(0, limite)
+    return resultat.to_pandas()
+
+
+# Répartition des opérations par durée: nombre, part, montants, taux moyen et encours
+@instrumentation.tracer
+def repartition_durees():
+    operations = tables()['operations']
+    table = pa.table({
+        'duree_mois': operations['duree_mois'],
+        'id': operations['id'],
+        'montant_total': operations['montant_total'],
+        'taux_benefice': operations['taux_benefice'],
+        'encours': pc.if_else(pc.equal(operations['statut'], 'En cours'), operations['reste_a_payer'], 0.0),
+    })
+    resultat = _agreger(table, ['duree_mois'], {
+        'nb_operations': ('id', 'count'),
+        'montant_total': ('montant_total', 'sum'),
+        'taux_moyen': ('taux_benefice', 'mean'),
+        'encours': ('encours', 'sum'),
+    })
+    resultat = resultat.append_column('part', pc.divide(pc.cast(resultat['nb_operations'], pa.float64()),
+                                                        max(len(operations), 1)))
+    return resultat.sort_by('duree_mois').to_pandas()
+
+
+# Indicateurs globaux du portefeuille
+@instrumentation.tracer
+def indicateurs():
+    copie = tables()
+    operations, paiements = copie['operations'], copie['paiements']
+    valeur = pc.sum(operations['valeur_marchandise']).as_py() or 0
+    montant_total = pc.sum(operations['montant_total']).as_py() or 0
+    return {
+        'nb_operations': len(operations),
+        'nb_paiements': len(paiements),
+        'taux_moyen': pc.mean(operations['taux_benefice']).as_py(),
+        'marge': (montant_total - valeur) / valeur if valeur else None,
+        'encaisse': pc.sum(paiements['montant']).as_py() or 0,
+    }
+
+
+# Rapports proposés par l'application et la ligne de commande
+RAPPORTS = {
+    'Bénéfice par mois': benefice_par_mois,
+    'Encaissements par mois': encaissements_par_mois,
+    'Encaissements par client': encaissements_par_client,
+    'Répartition des durées': repartition_durees,
+}
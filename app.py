@@ -1,288 +1,195 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from PIL import Image
 import io
-import base64
+import html
+import math
+import os
+import tempfile
+import time
+import zipfile
 
-# Configuration de la base de données
-def init_db():
-    conn = sqlite3.connect('ventes_terme.db')
-    cursor = conn.cursor()
-    
-    # Table des clients
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS clients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nom TEXT NOT NULL UNIQUE,
-            telephone TEXT,
-            description TEXT,
-            date_creation TEXT NOT NULL
-        )
-    ''')
-    
-    # Table des ventes à terme
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS operations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            client_id INTEGER NOT NULL,
-            valeur_marchandise REAL NOT NULL,
-            taux_benefice REAL NOT NULL,
-            duree_mois REAL NOT NULL,
-            date_creation TEXT NOT NULL,
-            statut TEXT DEFAULT 'En cours',
-            montant_total REAL NOT NULL,
-            prochaine_echeance TEXT,
-            FOREIGN KEY (client_id) REFERENCES clients (id)
-        )
-    ''')
-    
-    # Table des paiements
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS paiements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            operation_id INTEGER NOT NULL,
-            client_id INTEGER NOT NULL,
-            type_paiement TEXT NOT NULL,
-            montant REAL NOT NULL,
-            date_paiement TEXT NOT NULL,
-            description TEXT,
-            FOREIGN KEY (operation_id) REFERENCES operations (id),
-            FOREIGN KEY (client_id) REFERENCES clients (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+from database import (
+    init_db, ajouter_client, modifier_client, supprimer_client, get_clients, compter_clients,
+    creer_operation, get_operations, compter_operations, total_montant_operations, modifier_operation,
+    supprimer_operation, enregistrer_paiement, compter_paiements, iter_paiements_par_operation,
+    rechercher_clients, rechercher_operations, generation,
+)
+from echeancier import analyser_portefeuille, construire_echeancier, analyser_echeancier, TRANCHES
+from export_donnees import exporter, EXPORTS, FORMATS
+from import_donnees import importer, COLONNES
+from snapshots import mettre_a_jour_snapshots, get_snapshots
+import analytique
+import ecriture_groupee
+import instrumentation
+import previsions
+import releves
 
-# Fonction pour formater les nombres avec espaces
-def format_number(number):
-    return f"{number:,.0f}".replace(",", " ")
+# Cache des lectures: la clé inclut la génération des données, incrémentée par chaque écriture,
+# et la durée de vie / le nombre d'entrées bornent la mémoire (et couvrent les écritures d'autres processus)
+CACHE_TTL = 300
+CACHE_MAX_ENTREES = 64
 
-# Ajouter un client - CORRIGÉ
-def ajouter_client(nom, telephone, description):
-    conn = sqlite3.connect('ventes_terme.db')
-    cursor = conn.cursor()
-    
-    date_creation = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    try:
-        cursor.execute('''
-            INSERT INTO clients (nom, telephone, description, date_creation)
-            VALUES (?, ?, ?, ?)
-        ''', (nom, telephone, description, date_creation))
-        
-        conn.commit()
-        success = True
-        message = "Client ajouté avec succès!"
-    except sqlite3.IntegrityError:
-        success = False
-        message = "Ce client existe déjà!"
-    finally:
-        conn.close()
-    
-    return success, message
+# Nombre de résultats proposés par les sélecteurs avec recherche
+NB_RESULTATS_RECHERCHE = 20
 
-# Modifier un client
-def modifier_client(client_id, nom, telephone, description):
-    conn = sqlite3.connect('ventes_terme.db')
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute('''
-            UPDATE clients 
-            SET nom = ?, telephone = ?, description = ?
-            WHERE id = ?
-        ''', (nom, telephone, description, client_id))
-        
-        conn.commit()
-        success = True
-        message = "Client modifié avec succès!"
-    except sqlite3.IntegrityError:
-        success = False
-        message = "Ce nom existe déjà!"
-    finally:
-        conn.close()
-    
-    return success, message
+# Les listes sont envoyées au navigateur en un seul élément (tableau ou fragment HTML);
+# au-delà de ce temps de construction et d'envoi, un avertissement est affiché
+MODES_AFFICHAGE = ["Tableau", "Cartes"]
+BUDGET_RENDU_MS = 250
 
-# Supprimer un client
-def supprimer_client(client_id):
-    conn = sqlite3.connect('ventes_terme.db')
-    cursor = conn.cursor()
-    
-    try:
-        # Vérifier si le client a des opérations
-        cursor.execute('SELECT COUNT(*) FROM operations WHERE client_id = ?', (client_id,))
-        if cursor.fetchone()[0] > 0:
-            return False, "Impossible de supprimer: le client a des opérations en cours!"
-        
-        cursor.execute('DELETE FROM clients WHERE id = ?', (client_id,))
-        conn.commit()
-        success = True
-        message = "Client supprimé avec succès!"
-    except Exception as e:
-        success = False
-        message = f"Erreur lors de la suppression: {str(e)}"
-    finally:
-        conn.close()
-    
-    return success, message
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def clients_en_cache(generation, limite=None, offset=0):
+    return get_clients(limite, offset)
 
-# Obtenir tous les clients
-def get_clients():
-    conn = sqlite3.connect('ventes_terme.db')
-    df = pd.read_sql_query("SELECT * FROM clients ORDER BY nom", conn)
-    conn.close()
-    return df
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def nb_clients_en_cache(generation):
+    return compter_clients()
 
-# Créer une opération
-def creer_operation(client_id, valeur_marchandise, taux_benefice, duree_mois):
-    conn = sqlite3.connect('ventes_terme.db')
-    cursor = conn.cursor()
-    
-    # Calcul du montant total
-    montant_total = valeur_marchandise * (1 + taux_benefice * duree_mois)
-    
-    date_creation = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Calcul de la prochaine échéance (1 mois après la création)
-    prochaine_echeance = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
-    
-    cursor.execute('''
-        INSERT INTO operations (client_id, valeur_marchandise, taux_benefice, 
-                              duree_mois, date_creation, montant_total, prochaine_echeance)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (client_id, valeur_marchandise, taux_benefice, duree_mois, 
-          date_creation, montant_total, prochaine_echeance))
-    
-    operation_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    
-    return operation_id, montant_total
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def operations_en_cache(generation, limite=None, offset=0, statut=None):
+    return get_operations(limite, offset, statut)
 
-# Obtenir toutes les opérations
-def get_operations():
-    conn = sqlite3.connect('ventes_terme.db')
-    df = pd.read_sql_query('''
-        SELECT o.*, c.nom as client_nom, c.telephone 
-        FROM operations o 
-        JOIN clients c ON o.client_id = c.id 
-        ORDER BY o.date_creation DESC
-    ''', conn)
-    conn.close()
-    return df
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def nb_operations_en_cache(generation, statut=None):
+    return compter_operations(statut)
 
-# Modifier une opération
-def modifier_operation(operation_id, valeur_marchandise, taux_benefice, duree_mois):
-    conn = sqlite3.connect('ventes_terme.db')
-    cursor = conn.cursor()
-    
-    # Recalculer le montant total
-    montant_total = valeur_marchandise * (1 + taux_benefice * duree_mois)
-    
-    cursor.execute('''
-        UPDATE operations 
-        SET valeur_marchandise = ?, taux_benefice = ?, duree_mois = ?, montant_total = ?
-        WHERE id = ?
-    ''', (valeur_marchandise, taux_benefice, duree_mois, montant_total, operation_id))
-    
-    conn.commit()
-    conn.close()
-    return True, "Opération modifiée avec succès!"
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def total_operations_en_cache(generation):
+    return total_montant_operations()
 
-# Supprimer une opération
-def supprimer_operation(operation_id):
-    conn = sqlite3.connect('ventes_terme.db')
-    cursor = conn.cursor()
-    
-    try:
-        # Supprimer d'abord les paiements associés
-        cursor.execute('DELETE FROM paiements WHERE operation_id = ?', (operation_id,))
-        
-        # Puis supprimer l'opération
-        cursor.execute('DELETE FROM operations WHERE id = ?', (operation_id,))
-        
-        conn.commit()
-        success = True
-        message = "Opération supprimée avec succès!"
-    except Exception as e:
-        success = False
-        message = f"Erreur lors de la suppression: {str(e)}"
-    finally:
-        conn.close()
-    
-    return success, message
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def nb_paiements_en_cache(generation, date_debut, date_fin, client_id, recherche, avec_archive=False):
+    return compter_paiements(date_debut, date_fin, client_id, recherche, avec_archive)
 
-# Enregistrer un paiement
-def enregistrer_paiement(operation_id, client_id, type_paiement, montant, description=""):
-    conn = sqlite3.connect('ventes_terme.db')
-    cursor = conn.cursor()
-    
-    date_paiement = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    try:
-        cursor.execute('''
-            INSERT INTO paiements (operation_id, client_id, type_paiement, montant, date_paiement, description)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (operation_id, client_id, type_paiement, montant, date_paiement, description))
-        
-        # Mettre à jour la prochaine échéance si c'est un paiement ordinaire
-        if type_paiement == "Ordinaire":
-            cursor.execute('SELECT prochaine_echeance FROM operations WHERE id = ?', (operation_id,))
-            result = cursor.fetchone()
-            if result and result[0]:
-                current_date = datetime.strptime(result[0], "%Y-%m-%d")
-                new_date = (current_date + timedelta(days=30)).strftime("%Y-%m-%d")
-                cursor.execute('UPDATE operations SET prochaine_echeance = ? WHERE id = ?', (new_date, operation_id))
-        
-        # Vérifier si l'opération est terminée
-        cursor.execute('SELECT SUM(montant) FROM paiements WHERE operation_id = ?', (operation_id,))
-        total_paye = cursor.fetchone()[0] or 0
-        
-        cursor.execute('SELECT montant_total FROM operations WHERE id = ?', (operation_id,))
-        result = cursor.fetchone()
-        montant_total = result[0] if result else 0
-        
-        if total_paye >= montant_total:
-            cursor.execute('UPDATE operations SET statut = "Terminé" WHERE id = ?', (operation_id,))
-        
-        conn.commit()
-        success = True
-        message = "Paiement enregistré avec succès!"
-    except Exception as e:
-        success = False
-        message = f"Erreur lors de l'enregistrement: {str(e)}"
-    finally:
-        conn.close()
-    
-    return success, message
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def historique_en_cache(generation, date_debut, date_fin, client_id, recherche, limite, offset, avec_archive=False):
+    return list(iter_paiements_par_operation(date_debut, date_fin, client_id, recherche, limite=limite, offset=offset,
+                                             avec_archive=avec_archive))
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def retards_en_cache(generation, date_reference):
+    return analyser_portefeuille(date_reference)
+
+# Les instantanés du jour sont complétés au plus une fois par génération des données
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def tendances_en_cache(generation, jour, depuis):
+    mettre_a_jour_snapshots()
+    return get_snapshots(depuis)
+
+# La copie en colonnes des rapports est rafraîchie au plus une fois par génération des données;
+# chaque rapport renvoie aussi son temps de calcul
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def copie_analytique_en_cache(generation):
+    return analytique.rafraichir()
 
-# Obtenir les paiements d'une opération
-def get_paiements_operation(operation_id):
-    conn = sqlite3.connect('ventes_terme.db')
-    df = pd.read_sql_query('''
-        SELECT p.*, c.nom as client_nom 
-        FROM paiements p 
-        JOIN clients c ON p.client_id = c.id 
-        WHERE p.operation_id = ?
-        ORDER BY p.date_paiement DESC
-    ''', conn, params=(operation_id,))
-    conn.close()
-    return df
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def rapport_en_cache(generation, nom):
+    copie_analytique_en_cache(generation)
+    debut = time.perf_counter()
+    rapport = analytique.RAPPORTS[nom]()
+    return rapport, (time.perf_counter() - debut) * 1000
 
-# Obtenir le total des paiements pour une opération
-def get_total_paiements(operation_id):
-    conn = sqlite3.connect('ventes_terme.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT SUM(montant) FROM paiements WHERE operation_id = ?', (operation_id,))
-    result = cursor.fetchone()
-    total = result[0] if result and result[0] else 0
-    conn.close()
-    return total
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def indicateurs_en_cache(generation):
+    copie_analytique_en_cache(generation)
+    return analytique.indicateurs()
+
+# Les modèles de prévision ont leur propre cache (réajustés après assez de nouveaux paiements)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def previsions_en_cache(generation, horizon):
+    return previsions.prevoir(horizon)
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def recherche_clients_en_cache(generation, texte, limite):
+    return rechercher_clients(texte, limite)
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTREES, show_spinner=False)
+def recherche_operations_en_cache(generation, texte, limite):
+    return rechercher_operations(texte, limite)
+
+# Fonction pour formater les nombres avec espaces
+def format_number(number):
+    return f"{number:,.0f}".replace(",", " ")
+
+# Version colonne de format_number, appliquée à toute une Series
+def format_colonne(serie):
+    return serie.fillna(0).map("{:,.0f}".format).str.replace(",", " ", regex=False)
+
+# Texte échappé pour un fragment HTML, avec une valeur par défaut pour les cellules vides
+def texte_colonne(serie, defaut=""):
+    texte = serie.astype(object).where(serie.notna() & (serie != ""), defaut).astype(str)
+    return texte.map(html.escape).str.replace("\n", "<br>", regex=False)
+
+# Fragment HTML unique des cartes d'opérations en cours, construit colonne par colonne
+def html_operations(operations):
+    cartes = (
+        "<div class='operation-en-cours'><h3>👤 " + texte_colonne(operations['client_nom'])
+        + " - 📞 " + texte_colonne(operations['telephone'], "N/A") + "</h3>"
+        + "<p><strong>💵 Valeur marchandise:</strong> " + format_colonne(operations['valeur_marchandise']) + "</p>"
+        + "<p><strong>📈 Taux bénéfice:</strong> " + (operations['taux_benefice'] * 100).map("{:g}".format) + "%</p>"
+        + "<p><strong>⏰ Durée:</strong> " + operations['duree_mois'].map("{:g}".format) + " mois</p>"
+        + "<p><strong>💰 Montant total:</strong> " + format_colonne(operations['montant_total']) + "</p>"
+        + "<p><strong>💳 Total payé:</strong> " + format_colonne(operations['total_paye']) + "</p>"
+        + "<p><strong>⚖️ Reste à payer:</strong> " + format_colonne(operations['reste_a_payer']) + "</p>"
+        + "<p><strong>📅 Prochaine échéance:</strong> " + texte_colonne(operations['prochaine_echeance']) + "</p>"
+        + "<p><strong>🎯 Prochain paiement:</strong> " + format_colonne(operations['prochain_paiement']) + "</p></div>"
+    )
+    return "".join(cartes)
+
+# Fragment HTML unique de l'historique: un titre par opération suivi des cartes de ses paiements
+def html_paiements(paiements):
+    premier = ~paiements['operation_id'].duplicated()
+    titres = ("<h3>🔢 Opération #" + paiements['operation_id'].astype(str) + " - 👤 "
+              + texte_colonne(paiements['client_nom']) + "</h3>").where(premier, "")
+    cartes = (
+        titres + "<div class='card'>"
+        + "<p><strong>💳 Type:</strong> " + texte_colonne(paiements['type_paiement']) + "</p>"
+        + "<p><strong>💰 Montant:</strong> " + format_colonne(paiements['montant']) + "</p>"
+        + "<p><strong>📅 Date:</strong> " + texte_colonne(paiements['date_paiement']) + "</p>"
+        + "<p><strong>📝 Description:</strong> " + texte_colonne(paiements['description'], "Aucune") + "</p></div>"
+    )
+    return "".join(cartes)
+
+# Afficher une liste en un seul élément selon le mode choisi, et mesurer le temps de rendu
+# par rapport au budget
+def afficher_liste(df, mode, construire_html, colonnes, column_config):
+    debut = time.perf_counter()
+    if mode == "Cartes":
+        st.markdown(construire_html(df), unsafe_allow_html=True)
+    else:
+        st.dataframe(df[colonnes], column_config=column_config, hide_index=True, use_container_width=True)
+    duree_ms = (time.perf_counter() - debut) * 1000
+    if duree_ms > BUDGET_RENDU_MS:
+        st.warning(f"Rendu de {len(df)} lignes en {duree_ms:.0f} ms (budget {BUDGET_RENDU_MS} ms): "
+                   "réduisez le nombre de lignes par page.")
+    else:
+        st.caption(f"{len(df)} lignes rendues en {duree_ms:.0f} ms")
+
+# Sélecteur de page pour les listes paginées: renvoie l'offset de la page choisie
+def choisir_page(nb_lignes, taille_page, key):
+    nb_pages = max(1, -(-nb_lignes // taille_page))
+    if st.session_state.get(key, 1) > nb_pages:
+        st.session_state[key] = nb_pages
+    page = st.number_input(f"Page (sur {nb_pages})", min_value=1, max_value=nb_pages, value=1, step=1, key=key)
+    return (page - 1) * taille_page
+
+# Panneau de débogage: durée de chaque section de la page et de chaque accès aux données, avec son SQL
+def afficher_debogage(evenements):
+    with st.sidebar.expander("🐞 INSTRUMENTATION", expanded=True):
+        evenements = pd.DataFrame(evenements, columns=['type', 'nom', 'duree_ms', 'lignes', 'profondeur', 'nb_sql', 'sql'])
+        sections = evenements[evenements['type'] == 'section']
+        requetes = evenements[evenements['type'] == 'requete']
+        st.caption(f"Page rendue en {sections['duree_ms'].sum():.0f} ms, dont {len(requetes)} accès aux données "
+                   f"({requetes.loc[requetes['profondeur'] == 0, 'duree_ms'].sum():.0f} ms) hors cache")
+        st.dataframe(sections[['nom', 'duree_ms']], hide_index=True, use_container_width=True,
+                     column_config={"nom": "Section", "duree_ms": st.column_config.NumberColumn("ms", format="%.1f")})
+        if not requetes.empty:
+            st.dataframe(
+                requetes.assign(sql=requetes['sql'].map(" ; ".join))[['nom', 'duree_ms', 'lignes', 'nb_sql', 'sql']],
+                hide_index=True, use_container_width=True,
+                column_config={"nom": "Fonction", "duree_ms": st.column_config.NumberColumn("ms", format="%.1f"),
+                               "lignes": "Lignes", "nb_sql": "Instructions", "sql": "SQL"},
+            )
 
 # Interface Streamlit
 def main():
@@ -293,10 +200,18 @@ def main():
     
     """)
     
+    # Instrumentation (mode débogage) pour ce passage du script
+    instrumentation.activer(st.session_state.get('debogage', instrumentation.ACTIF_PAR_DEFAUT))
+    instrumentation.demarrer(st.session_state.get('current_page', "Accueil"))
+    
     # Initialisation de la base de données
+    instrumentation.section("Initialisation")
     init_db()
+    if ecriture_groupee.ACTIVE_PAR_DEFAUT:
+        ecriture_groupee.demarrer()
     
     # Navigation avec boutons colorés
+    instrumentation.section("Barre latérale")
     st.sidebar.markdown("<h1 style='text-align: center; color: #FFD700;'>💰 GESTION COMMERCIALE</h1>", unsafe_allow_html=True)
     
     col1, col2 = st.sidebar.columns(2)
@@ -310,6 +225,20 @@ def main():
             st.session_state.current_page = "Opérations"
         if st.button("💳 PAIEMENTS", use_container_width=True, key="paiements_btn"):
             st.session_state.current_page = "Paiements"
+    if st.sidebar.button("📁 DONNÉES", use_container_width=True, key="donnees_btn"):
+        st.session_state.current_page = "Données"
+    col3, col4 = st.sidebar.columns(2)
+    with col3:
+        if st.button("📈 RAPPORTS", use_container_width=True, key="rapports_btn"):
+            st.session_state.current_page = "Rapports"
+    with col4:
+        if st.button("🔮 PRÉVISIONS", use_container_width=True, key="previsions_btn"):
+            st.session_state.current_page = "Prévisions"
+    
+    # Nombre de lignes par page des listes
+    taille_page = st.sidebar.selectbox("Lignes par page", options=[25, 50, 100, 200], index=1, key="taille_page")
+    mode_affichage = st.sidebar.radio("Affichage des listes", options=MODES_AFFICHAGE, horizontal=True, key="mode_affichage")
+    st.sidebar.checkbox("🐞 Mode débogage", value=instrumentation.ACTIF_PAR_DEFAUT, key="debogage")
     
     # Initialiser la page courante
     if 'current_page' not in st.session_state:
@@ -318,39 +247,41 @@ def main():
     # PAGE ACCUEIL
     if st.session_state.current_page == "Accueil":
         st.markdown("<h1 style='text-align: center; color: #FFD700;'>🏠 TABLEAU DE BORD</h1>", unsafe_allow_html=True)
+        instrumentation.section("Accueil: opérations en cours")
         
-        operations = get_operations()
-        operations_en_cours = operations[operations['statut'] == 'En cours']
+        nb_en_cours = nb_operations_en_cache(generation(), 'En cours')
         
-        if not operations_en_cours.empty:
-            st.markdown(f"<h2 style='color: #FF6B6B;'>📋 {len(operations_en_cours)} OPÉRATIONS EN COURS</h2>", unsafe_allow_html=True)
-            
-            for _, op in operations_en_cours.iterrows():
-                total_paye = get_total_paiements(op['id'])
-                reste_a_payer = op['montant_total'] - total_paye
-                
-                st.markdown(f"""
-                <div class='operation-en-cours'>
-                    <h3>👤 {op['client_nom']} - 📞 {op['telephone'] or 'N/A'}</h3>
-                    <p><strong>💵 Valeur marchandise:</strong> {format_number(op['valeur_marchandise'])}</p>
-                    <p><strong>📈 Taux bénéfice:</strong> {op['taux_benefice']*100}%</p>
-                    <p><strong>⏰ Durée:</strong> {op['duree_mois']} mois</p>
-                    <p><strong>💰 Montant total:</strong> {format_number(op['montant_total'])}</p>
-                    <p><strong>💳 Total payé:</strong> {format_number(total_paye)}</p>
-                    <p><strong>⚖️ Reste à payer:</strong> {format_number(reste_a_payer)}</p>
-                    <p><strong>📅 Prochaine échéance:</strong> {op['prochaine_echeance']}</p>
-                    <p><strong>🎯 Prochain paiement:</strong> {format_number(op['montant_total'] / op['duree_mois'])}</p>
-                </div>
-                """, unsafe_allow_html=True)
+        if nb_en_cours > 0:
+            st.markdown(f"<h2 style='color: #FF6B6B;'>📋 {nb_en_cours} OPÉRATIONS EN COURS</h2>", unsafe_allow_html=True)
+            offset = choisir_page(nb_en_cours, taille_page, "page_accueil")
+            operations_en_cours = operations_en_cache(generation(), taille_page, offset, 'En cours')
+            afficher_liste(
+                operations_en_cours, mode_affichage, html_operations,
+                ['client_nom', 'telephone', 'valeur_marchandise', 'taux_benefice', 'duree_mois', 'montant_total',
+                 'total_paye', 'reste_a_payer', 'prochaine_echeance', 'prochain_paiement'],
+                {
+                    "client_nom": "👤 Client",
+                    "telephone": "📞 Téléphone",
+                    "valeur_marchandise": st.column_config.NumberColumn("💵 Valeur", format="%.0f"),
+                    "taux_benefice": st.column_config.NumberColumn("📈 Taux", format="percent"),
+                    "duree_mois": "⏰ Durée (mois)",
+                    "montant_total": st.column_config.NumberColumn("💰 Total", format="%.0f"),
+                    "total_paye": st.column_config.NumberColumn("💳 Payé", format="%.0f"),
+                    "reste_a_payer": st.column_config.NumberColumn("⚖️ Reste", format="%.0f"),
+                    "prochaine_echeance": "📅 Échéance",
+                    "prochain_paiement": st.column_config.NumberColumn("🎯 Prochain paiement", format="%.0f"),
+                },
+            )
         else:
             st.info("Aucune opération en cours")
         
         # Métriques globales
+        instrumentation.section("Accueil: métriques")
         st.markdown("<h2 style='color: #4ECDC4;'>📊 MÉTRIQUES GLOBALES</h2>", unsafe_allow_html=True)
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            total_montant = operations['montant_total'].sum() if not operations.empty else 0
+            total_montant = total_operations_en_cache(generation())
             st.markdown(f"""
             <div class='metric-card'>
                 <h3>💰 TOTAL</h3>
@@ -362,33 +293,81 @@ def main():
             st.markdown(f"""
             <div class='metric-card'>
                 <h3>📈 EN COURS</h3>
-                <h2>{len(operations_en_cours)}</h2>
+                <h2>{nb_en_cours}</h2>
             </div>
             """, unsafe_allow_html=True)
         
         with col3:
-            operations_terminees = operations[operations['statut'] == 'Terminé'] if not operations.empty else pd.DataFrame()
             st.markdown(f"""
             <div class='metric-card'>
                 <h3>✅ TERMINÉES</h3>
-                <h2>{len(operations_terminees)}</h2>
+                <h2>{nb_operations_en_cache(generation(), 'Terminé')}</h2>
             </div>
             """, unsafe_allow_html=True)
         
         with col4:
-            clients_count = len(get_clients())
+            clients_count = nb_clients_en_cache(generation())
             st.markdown(f"""
             <div class='metric-card'>
                 <h3>👥 CLIENTS</h3>
                 <h2>{clients_count}</h2>
             </div>
             """, unsafe_allow_html=True)
+        
+        # Retards de paiement et balance âgée
+        instrumentation.section("Accueil: retards")
+        st.markdown("<h2 style='color: #FF6B6B;'>⏰ RETARDS DE PAIEMENT</h2>", unsafe_allow_html=True)
+        retards, balance = retards_en_cache(generation(), pd.Timestamp.now().strftime("%Y-%m-%d"))
+        
+        for col, tranche in zip(st.columns(len(TRANCHES)), TRANCHES):
+            with col:
+                st.markdown(f"""
+                <div class='metric-card'>
+                    <h3>📆 {tranche}</h3>
+                    <h2>{format_number(balance[tranche])}</h2>
+                </div>
+                """, unsafe_allow_html=True)
+        
+        if retards.empty:
+            st.success("Aucune échéance en retard")
+        else:
+            st.dataframe(
+                retards.head(taille_page)[['operation_id', 'client_nom', 'telephone', 'montant_retard',
+                                           'echeances_en_retard', 'jours_retard']],
+                column_config={
+                    "operation_id": "N°",
+                    "client_nom": "Client",
+                    "telephone": "Téléphone",
+                    "montant_retard": st.column_config.NumberColumn("En retard", format="%.0f"),
+                    "echeances_en_retard": "Échéances",
+                    "jours_retard": "Jours de retard",
+                },
+                hide_index=True, use_container_width=True,
+            )
+        
+        # Tendances, lues depuis les instantanés quotidiens pré-agrégés
+        instrumentation.section("Accueil: tendances")
+        st.markdown("<h2 style='color: #4ECDC4;'>📈 TENDANCES</h2>", unsafe_allow_html=True)
+        periodes = {"3 mois": 90, "1 an": 365, "3 ans": 3 * 365}
+        periode = st.radio("Période", options=list(periodes), index=1, horizontal=True, key="periode_tendances")
+        aujourd_hui = pd.Timestamp.now().normalize()
+        depuis = (aujourd_hui - pd.Timedelta(days=periodes[periode])).strftime("%Y-%m-%d")
+        tendances = tendances_en_cache(generation(), aujourd_hui.strftime("%Y-%m-%d"), depuis).set_index('jour')
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**💰 Encours et encaissements cumulés**")
+            st.line_chart(tendances[['encours', 'encaisse_cumul']])
+        with col2:
+            st.markdown("**📋 Opérations ouvertes et terminées**")
+            st.line_chart(tendances[['nb_ouvertes', 'nb_terminees']])
     
     # PAGE CLIENTS
     elif st.session_state.current_page == "Clients":
         st.markdown("<h1 style='text-align: center; color: #FFD700;'>👥 GESTION DES CLIENTS</h1>", unsafe_allow_html=True)
         
         # Ajouter client
+        instrumentation.section("Clients: ajout")
         with st.expander("➕ AJOUTER UN CLIENT", expanded=True):
             with st.form("ajouter_client_form", clear_on_submit=True):
                 nom = st.text_input("Nom complet *", placeholder="Nom et prénom")
@@ -406,47 +385,56 @@ def main():
                         st.error("Le nom est obligatoire!")
         
         # Liste des clients
+        instrumentation.section("Clients: liste")
         st.markdown("<h2 style='color: #FF6B6B;'>📋 LISTE DES CLIENTS</h2>", unsafe_allow_html=True)
-        clients = get_clients()
+        nb_clients = nb_clients_en_cache(generation())
         
-        if not clients.empty:
-            for _, client in clients.iterrows():
-                with st.expander(f"👤 {client['nom']} - 📞 {client['telephone'] or 'N/A'}"):
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        if st.button(f"✏️ MODIFIER", key=f"mod_{client['id']}"):
-                            st.session_state.edit_client = client['id']
-                    
-                    with col2:
-                        if st.button(f"❌ SUPPRIMER", key=f"del_{client['id']}"):
-                            success, message = supprimer_client(client['id'])
+        if nb_clients > 0:
+            offset = choisir_page(nb_clients, taille_page, "page_clients")
+            clients = clients_en_cache(generation(), taille_page, offset)
+            
+            selection = st.dataframe(
+                clients[['nom', 'telephone', 'description', 'date_creation']],
+                column_config={"nom": "Nom", "telephone": "Téléphone", "description": "Description", "date_creation": "Créé le"},
+                hide_index=True, use_container_width=True,
+                on_select="rerun", selection_mode="single-row", key=f"table_clients_{offset}",
+            )
+            
+            if selection.selection.rows:
+                client = clients.iloc[selection.selection.rows[0]]
+                st.markdown(f"**👤 {client['nom']}** - 📞 {client['telephone'] or 'N/A'}")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button(f"✏️ MODIFIER", key=f"mod_{client['id']}"):
+                        st.session_state.edit_client = client['id']
+                
+                with col2:
+                    if st.button(f"❌ SUPPRIMER", key=f"del_{client['id']}"):
+                        success, message = supprimer_client(client['id'])
+                        if success:
+                            st.success(message)
+                            st.rerun()
+                        else:
+                            st.error(message)
+                
+                # Modification du client
+                if 'edit_client' in st.session_state and st.session_state.edit_client == client['id']:
+                    with st.form(f"modifier_client_{client['id']}"):
+                        new_nom = st.text_input("Nom", value=client['nom'])
+                        new_tel = st.text_input("Téléphone", value=client['telephone'] or "")
+                        new_desc = st.text_area("Description", value=client['description'] or "")
+                        
+                        if st.form_submit_button("💾 SAUVEGARDER"):
+                            success, message = modifier_client(client['id'], new_nom, new_tel, new_desc)
                             if success:
                                 st.success(message)
+                                del st.session_state.edit_client
                                 st.rerun()
                             else:
                                 st.error(message)
-                    
-                    with col3:
-                        st.write(f"**📅 Créé le:** {client['date_creation']}")
-                    
-                    st.write(f"**📝 Description:** {client['description'] or 'Aucune'}")
-                    
-                    # Modification du client
-                    if 'edit_client' in st.session_state and st.session_state.edit_client == client['id']:
-                        with st.form(f"modifier_client_{client['id']}"):
-                            new_nom = st.text_input("Nom", value=client['nom'])
-                            new_tel = st.text_input("Téléphone", value=client['telephone'] or "")
-                            new_desc = st.text_area("Description", value=client['description'] or "")
-                            
-                            if st.form_submit_button("💾 SAUVEGARDER"):
-                                success, message = modifier_client(client['id'], new_nom, new_tel, new_desc)
-                                if success:
-                                    st.success(message)
-                                    del st.session_state.edit_client
-                                    st.rerun()
-                                else:
-                                    st.error(message)
+            else:
+                st.caption("Sélectionnez un client dans la liste pour le modifier ou le supprimer.")
         else:
             st.info("Aucun client enregistré")
     
@@ -454,44 +442,63 @@ def main():
     elif st.session_state.current_page == "Opérations":
         st.markdown("<h1 style='text-align: center; color: #FFD700;'>📊 GESTION DES OPÉRATIONS</h1>", unsafe_allow_html=True)
         
-        clients = get_clients()
-        
         # Ajouter opération
+        instrumentation.section("Opérations: création")
         with st.expander("➕ NOUVELLE OPÉRATION", expanded=True):
+            recherche_client = st.text_input("🔍 Rechercher un client", key="op_recherche_client", placeholder="Nom, téléphone ou description...")
+            clients = recherche_clients_en_cache(generation(), recherche_client, NB_RESULTATS_RECHERCHE)
+            
             if clients.empty:
-                st.warning("Aucun client disponible. Veuillez d'abord créer un client.")
+                if recherche_client:
+                    st.warning("Aucun client ne correspond à la recherche.")
+                else:
+                    st.warning("Aucun client disponible. Veuillez d'abord créer un client.")
             else:
+                noms_clients = dict(zip(clients['id'], clients['nom']))
                 with st.form("ajouter_operation_form", clear_on_submit=True):
-                    client_sel = st.selectbox("Client *", options=clients['nom'].tolist())
+                    client_id = st.selectbox("Client *", options=list(noms_clients), format_func=noms_clients.get)
                     valeur = st.number_input("Valeur marchandise *", min_value=0, step=1000, value=1000000)
                     taux = st.number_input("Taux bénéfice (%) *", min_value=0, step=1, value=8) / 100
                     duree = st.number_input("Durée (mois) *", min_value=0.0, step=0.5, value=6.0, format="%.1f")
                     
                     if st.form_submit_button("✅ CRÉER L'OPÉRATION"):
-                        client_id = clients[clients['nom'] == client_sel].iloc[0]['id']
                         op_id, montant_total = creer_operation(client_id, valeur, taux, duree)
                         st.success(f"Opération #{op_id} créée! Montant total: {format_number(montant_total)}")
         
         # Liste des opérations
+        instrumentation.section("Opérations: liste")
         st.markdown("<h2 style='color: #FF6B6B;'>📋 LISTE DES OPÉRATIONS</h2>", unsafe_allow_html=True)
-        operations = get_operations()
+        nb_operations = nb_operations_en_cache(generation())
         
-        if not operations.empty:
-            for _, op in operations.iterrows():
-                total_paye = get_total_paiements(op['id'])
-                css_class = "operation-termine" if op['statut'] == 'Terminé' else "operation-en-cours"
-                
-                st.markdown(f"""
-                <div class='{css_class}'>
-                    <h3>🔢 #{op['id']} - 👤 {op['client_nom']} - 🏷️ {op['statut']}</h3>
-                    <p><strong>💵 Valeur:</strong> {format_number(op['valeur_marchandise'])}</p>
-                    <p><strong>📈 Taux:</strong> {op['taux_benefice']*100}%</p>
-                    <p><strong>⏰ Durée:</strong> {op['duree_mois']} mois</p>
-                    <p><strong>💰 Total:</strong> {format_number(op['montant_total'])}</p>
-                    <p><strong>💳 Payé:</strong> {format_number(total_paye)}</p>
-                    <p><strong>📅 Créé le:</strong> {op['date_creation']}</p>
-                </div>
-                """, unsafe_allow_html=True)
+        if nb_operations > 0:
+            offset = choisir_page(nb_operations, taille_page, "page_operations")
+            operations = operations_en_cache(generation(), taille_page, offset)
+            
+            selection = st.dataframe(
+                operations[['id', 'client_nom', 'statut', 'valeur_marchandise', 'taux_benefice', 'duree_mois',
+                            'montant_total', 'total_paye', 'reste_a_payer', 'prochaine_echeance', 'en_retard',
+                            'date_creation']].astype({'en_retard': bool}),
+                column_config={
+                    "id": "N°",
+                    "client_nom": "Client",
+                    "statut": "Statut",
+                    "valeur_marchandise": st.column_config.NumberColumn("Valeur", format="%.0f"),
+                    "taux_benefice": st.column_config.NumberColumn("Taux", format="percent"),
+                    "duree_mois": st.column_config.NumberColumn("Durée (mois)", format="%.1f"),
+                    "montant_total": st.column_config.NumberColumn("Total", format="%.0f"),
+                    "total_paye": st.column_config.NumberColumn("Payé", format="%.0f"),
+                    "reste_a_payer": st.column_config.NumberColumn("Reste", format="%.0f"),
+                    "prochaine_echeance": "Échéance",
+                    "en_retard": st.column_config.CheckboxColumn("⚠️ Retard", help="Au dernier traitement de nuit"),
+                    "date_creation": "Créé le",
+                },
+                hide_index=True, use_container_width=True,
+                on_select="rerun", selection_mode="single-row", key=f"table_operations_{offset}",
+            )
+            
+            if selection.selection.rows:
+                op = operations.iloc[selection.selection.rows[0]]
+                st.markdown(f"**🔢 #{op['id']} - 👤 {op['client_nom']} - 🏷️ {op['statut']}**")
                 
                 col1, col2, col3 = st.columns(3)
                 with col1:
@@ -509,12 +516,27 @@ def main():
                     if st.button(f"💳 PAIEMENTS", key=f"pay_op_{op['id']}"):
                         st.session_state.view_payments = op['id']
                 
+                with st.expander("📆 ÉCHÉANCIER"):
+                    echeances = analyser_echeancier(construire_echeancier(operations.iloc[[selection.selection.rows[0]]]))
+                    st.dataframe(
+                        echeances[['rang', 'date_echeance', 'montant', 'montant_paye', 'reste', 'jours_retard']],
+                        column_config={
+                            "rang": "Échéance",
+                            "date_echeance": st.column_config.DateColumn("Date"),
+                            "montant": st.column_config.NumberColumn("Montant", format="%.0f"),
+                            "montant_paye": st.column_config.NumberColumn("Payé", format="%.0f"),
+                            "reste": st.column_config.NumberColumn("Reste", format="%.0f"),
+                            "jours_retard": "Jours de retard",
+                        },
+                        hide_index=True, use_container_width=True,
+                    )
+                
                 # Modification opération
                 if 'edit_op' in st.session_state and st.session_state.edit_op == op['id']:
                     with st.form(f"modifier_operation_{op['id']}"):
-                        new_valeur = st.number_input("Valeur marchandise", value=op['valeur_marchandise'], min_value=0, step=1000)
-                        new_taux = st.number_input("Taux bénéfice (%)", value=op['taux_benefice']*100, min_value=0, step=1) / 100
-                        new_duree = st.number_input("Durée (mois)", value=op['duree_mois'], min_value=0.0, step=0.5, format="%.1f")
+                        new_valeur = st.number_input("Valeur marchandise", value=float(op['valeur_marchandise']), min_value=0.0, step=1000.0)
+                        new_taux = st.number_input("Taux bénéfice (%)", value=float(op['taux_benefice'])*100, min_value=0.0, step=1.0) / 100
+                        new_duree = st.number_input("Durée (mois)", value=float(op['duree_mois']), min_value=0.0, step=0.5, format="%.1f")
                         
                         if st.form_submit_button("💾 SAUVEGARDER"):
                             success, message = modifier_operation(op['id'], new_valeur, new_taux, new_duree)
@@ -524,6 +546,8 @@ def main():
                                 st.rerun()
                             else:
                                 st.error(message)
+            else:
+                st.caption("Sélectionnez une opération dans la liste pour la modifier, la supprimer ou voir ses paiements.")
         else:
             st.info("Aucune opération enregistrée")
     
@@ -531,20 +555,22 @@ def main():
     elif st.session_state.current_page == "Paiements":
         st.markdown("<h1 style='text-align: center; color: #FFD700;'>💳 GESTION DES PAIEMENTS</h1>", unsafe_allow_html=True)
         
-        operations = get_operations()
-        clients = get_clients()
-        
         # Ajouter paiement
+        instrumentation.section("Paiements: saisie")
         with st.expander("➕ NOUVEAU PAIEMENT", expanded=True):
+            recherche_op = st.text_input("🔍 Rechercher une opération", key="pay_recherche_op", placeholder="Client ou n° d'opération...")
+            operations = recherche_operations_en_cache(generation(), recherche_op, NB_RESULTATS_RECHERCHE)
+            
             if operations.empty:
                 st.warning("Aucune opération disponible.")
             else:
+                libelles_operations = {
+                    op['id']: f"#{op['id']} - {op['client_nom']} - {format_number(op['montant_total'])}"
+                    for _, op in operations.iterrows()
+                }
                 with st.form("ajouter_paiement_form", clear_on_submit=True):
                     # Sélection opération
-                    op_options = [f"#{op['id']} - {op['client_nom']} - {format_number(op['montant_total'])}" 
-                                for _, op in operations.iterrows()]
-                    op_sel = st.selectbox("Opération *", options=op_options)
-                    op_id = int(op_sel.split(' - ')[0].replace('#', ''))
+                    op_id = st.selectbox("Opération *", options=list(libelles_operations), format_func=libelles_operations.get)
                     
                     # Type de paiement
                     type_paiement = st.radio("Type de paiement *", ["Ordinaire", "Anticipé"])
@@ -554,7 +580,9 @@ def main():
                     montant_ordinaire = op_info['montant_total'] / op_info['duree_mois']
                     
                     if type_paiement == "Ordinaire":
-                        montant = st.number_input("Montant *", min_value=0, value=int(montant_ordinaire), step=1000)
+                        # Mensualité arrondie à l'unité supérieure (sans dépasser le reste à payer)
+                        montant = st.number_input("Montant *", min_value=0, step=1000, value=math.ceil(
+                            max(min(montant_ordinaire, op_info['reste_a_payer']), 0)))
                     else:
                         montant = st.number_input("Montant *", min_value=0, step=1000)
                     
@@ -569,21 +597,238 @@ def main():
                             st.error(message)
         
         # Liste des paiements
+        instrumentation.section("Paiements: historique")
         st.markdown("<h2 style='color: #FF6B6B;'>📋 HISTORIQUE DES PAIEMENTS</h2>", unsafe_allow_html=True)
         
-        for _, op in operations.iterrows():
-            paiements = get_paiements_operation(op['id'])
-            if not paiements.empty:
-                st.markdown(f"<h3>🔢 Opération #{op['id']} - 👤 {op['client_nom']}</h3>", unsafe_allow_html=True)
-                for _, pay in paiements.iterrows():
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            date_debut = st.date_input("Du", value=None, key="hist_debut")
+        with col2:
+            date_fin = st.date_input("Au", value=None, key="hist_fin")
+        with col3:
+            recherche_client = st.text_input("🔍 Client", key="hist_recherche_client", placeholder="Nom ou téléphone...")
+        with col4:
+            recherche_description = st.text_input("🔍 Description", key="hist_recherche_description", placeholder="Référence, mode de paiement...")
+        
+        client_id_filtre = None
+        if recherche_client:
+            clients = recherche_clients_en_cache(generation(), recherche_client, NB_RESULTATS_RECHERCHE)
+            if clients.empty:
+                st.warning("Aucun client ne correspond à la recherche.")
+                client_id_filtre = -1
+            else:
+                noms_clients = dict(zip(clients['id'], clients['nom']))
+                client_id_filtre = st.selectbox("Client", options=list(noms_clients), format_func=noms_clients.get, key="hist_client")
+        
+        avec_archive = st.checkbox("🗄️ Inclure les paiements archivés", key="hist_archive")
+        nb_paiements = nb_paiements_en_cache(generation(), date_debut, date_fin, client_id_filtre, recherche_description,
+                                             avec_archive)
+        offset = choisir_page(nb_paiements, taille_page, "hist_page")
+        
+        if nb_paiements == 0:
+            st.info("Aucun paiement enregistré")
+        
+        historique = historique_en_cache(generation(), date_debut, date_fin, client_id_filtre, recherche_description,
+                                         taille_page, offset, avec_archive)
+        if historique:
+            afficher_liste(
+                pd.concat([paiements for _, paiements in historique], ignore_index=True), mode_affichage,
+                html_paiements,
+                ['operation_id', 'client_nom', 'type_paiement', 'montant', 'date_paiement', 'description'],
+                {
+                    "operation_id": "🔢 Opération",
+                    "client_nom": "👤 Client",
+                    "type_paiement": "💳 Type",
+                    "montant": st.column_config.NumberColumn("💰 Montant", format="%.0f"),
+                    "date_paiement": "📅 Date",
+                    "description": "📝 Description",
+                },
+            )
+    
+    # PAGE DONNÉES
+    elif st.session_state.current_page == "Données":
+        st.markdown("<h1 style='text-align: center; color: #FFD700;'>📁 IMPORT / EXPORT DES DONNÉES</h1>", unsafe_allow_html=True)
+        instrumentation.section("Données")
+        
+        with st.expander("📥 IMPORTER UN FICHIER CSV / EXCEL", expanded=True):
+            type_import = st.selectbox("Type de données *", options=list(COLONNES), format_func=str.capitalize)
+            colonnes = COLONNES[type_import]
+            st.caption(f"Colonnes obligatoires: {', '.join(colonnes['obligatoires'])} — "
+                       f"optionnelles: {', '.join(colonnes['optionnelles'])}")
+            fichier = st.file_uploader("Fichier *", type=["csv", "xlsx", "xls"])
+            
+            if st.button("✅ IMPORTER", disabled=fichier is None):
+                try:
+                    with st.spinner("Import en cours..."):
+                        nb_importees, erreurs = importer(type_import, fichier, fichier.name)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.success(f"{format_number(nb_importees)} ligne(s) importée(s)")
+                    if not erreurs.empty:
+                        st.error(f"{format_number(len(erreurs))} ligne(s) rejetée(s)")
+                        st.dataframe(erreurs.head(1000), hide_index=True, use_container_width=True)
+                        st.download_button("⬇️ RAPPORT D'ERREURS", erreurs.to_csv(index=False),
+                                           file_name=f"erreurs_import_{type_import}.csv", mime="text/csv")
+        
+        with st.expander("📤 EXPORTER LES DONNÉES", expanded=True):
+            col1, col2 = st.columns(2)
+            with col1:
+                table_export = st.selectbox("Données", options=list(EXPORTS), format_func=str.capitalize, key="export_table")
+                format_export = st.radio("Format", options=FORMATS, horizontal=True, key="export_format")
+            with col2:
+                export_debut = st.date_input("Du", value=None, key="export_debut")
+                export_fin = st.date_input("Au", value=None, key="export_fin")
+            export_archive = st.checkbox("🗄️ Inclure les archives", key="export_archive")
+            
+            if st.button("📤 PRÉPARER L'EXPORT"):
+                nom_fichier = f"{table_export}.{format_export}"
+                with tempfile.TemporaryDirectory() as dossier:
+                    chemin = os.path.join(dossier, nom_fichier)
+                    with st.spinner("Export en cours..."):
+                        nb_lignes = exporter(table_export, chemin, format_export, export_debut, export_fin,
+                                             avec_archive=export_archive)
+                    with open(chemin, 'rb') as f:
+                        contenu = f.read()
+                st.success(f"{format_number(nb_lignes)} ligne(s) exportée(s)")
+                st.download_button("⬇️ TÉLÉCHARGER", contenu, file_name=nom_fichier)
+        
+        with st.expander("🧾 RELEVÉS MENSUELS DES CLIENTS"):
+            dernier_mois = pd.Period(pd.Timestamp.now(), freq='M') - 1
+            col1, col2 = st.columns(2)
+            with col1:
+                mois_releves = st.selectbox("Mois", options=[str(dernier_mois - i) for i in range(12)],
+                                            key="releves_mois")
+            with col2:
+                formats_releves = st.multiselect("Formats", options=releves.FORMATS, default=["html"],
+                                                 key="releves_formats")
+            
+            if st.button("🧾 GÉNÉRER LES RELEVÉS", disabled=not formats_releves):
+                nom_archive = f"releves_{mois_releves}.zip"
+                with tempfile.TemporaryDirectory() as dossier:
+                    with st.spinner("Génération des relevés..."):
+                        nb_releves, nb_fichiers = releves.generer_releves(dossier, mois_releves, formats_releves)
+                    tampon = io.BytesIO()
+                    with zipfile.ZipFile(tampon, 'w', zipfile.ZIP_DEFLATED) as archive:
+                        for nom in sorted(os.listdir(dossier)):
+                            archive.write(os.path.join(dossier, nom), nom)
+                st.success(f"{format_number(nb_releves)} relevé(s) générés ({format_number(nb_fichiers)} fichier(s))")
+                st.download_button("⬇️ TÉLÉCHARGER LES RELEVÉS", tampon.getvalue(), file_name=nom_archive,
+                                   mime="application/zip")
+    
+    # PAGE RAPPORTS
+    elif st.session_state.current_page == "Rapports":
+        st.markdown("<h1 style='text-align: center; color: #FFD700;'>📈 RAPPORTS</h1>", unsafe_allow_html=True)
+        instrumentation.section("Rapports: indicateurs")
+        
+        indicateurs = indicateurs_en_cache(generation())
+        cartes = [
+            ("📋 OPÉRATIONS", format_number(indicateurs['nb_operations'])),
+            ("💳 PAIEMENTS", format_number(indicateurs['nb_paiements'])),
+            ("💰 ENCAISSÉ", format_number(indicateurs['encaisse'])),
+            ("📈 TAUX MOYEN", f"{(indicateurs['taux_moyen'] or 0) * 100:.2f} %"),
+            ("💵 MARGE", f"{(indicateurs['marge'] or 0) * 100:.1f} %"),
+        ]
+        for col, (titre, valeur) in zip(st.columns(len(cartes)), cartes):
+            with col:
+                st.markdown(f"""
+                <div class='metric-card'>
+                    <h3>{titre}</h3>
+                    <h2>{valeur}</h2>
+                </div>
+                """, unsafe_allow_html=True)
+        
+        instrumentation.section("Rapports: rapport")
+        nom_rapport = st.selectbox("Rapport", options=list(analytique.RAPPORTS), key="rapport")
+        rapport, duree_ms = rapport_en_cache(generation(), nom_rapport)
+        st.caption(f"{format_number(len(rapport))} ligne(s) calculée(s) en {duree_ms:.1f} ms sur la copie en colonnes")
+        
+        if rapport.empty:
+            st.info("Aucune donnée")
+        else:
+            # Graphique des mesures principales par mois, durée ou client (les plus gros clients seulement)
+            graphiques = {
+                'Bénéfice par mois': ('mois', ['valeur_marchandise', 'benefice']),
+                'Encaissements par mois': ('mois', ['encaisse', 'dont_anticipe']),
+                'Encaissements par client': ('client_nom', ['encaisse', 'encours']),
+                'Répartition des durées': ('duree_mois', ['nb_operations']),
+            }
+            abscisse, mesures = graphiques[nom_rapport]
+            if abscisse == 'client_nom':
+                rapport_graphique = rapport.head(NB_RESULTATS_RECHERCHE)
+            else:
+                rapport_graphique = rapport
+            st.bar_chart(rapport_graphique.set_index(abscisse)[mesures])
+            st.dataframe(
+                rapport.head(1000),
+                column_config={
+                    "client_id": "N°",
+                    "client_nom": "👤 Client",
+                    "duree_mois": "⏰ Durée (mois)",
+                    "valeur_marchandise": st.column_config.NumberColumn("💵 Valeur", format="%.0f"),
+                    "montant_total": st.column_config.NumberColumn("💰 Total", format="%.0f"),
+                    "benefice": st.column_config.NumberColumn("📈 Bénéfice", format="%.0f"),
+                    "taux_moyen": st.column_config.NumberColumn("📈 Taux moyen", format="percent"),
+                    "marge": st.column_config.NumberColumn("💵 Marge", format="percent"),
+                    "encaisse": st.column_config.NumberColumn("💳 Encaissé", format="%.0f"),
+                    "dont_anticipe": st.column_config.NumberColumn("⏩ Dont anticipé", format="%.0f"),
+                    "encours": st.column_config.NumberColumn("⚖️ Encours", format="%.0f"),
+                    "part": st.column_config.NumberColumn("Part", format="percent"),
+                },
+                hide_index=True, use_container_width=True,
+            )
+    
+    # PAGE PRÉVISIONS
+    elif st.session_state.current_page == "Prévisions":
+        st.markdown("<h1 style='text-align: center; color: #FFD700;'>🔮 PRÉVISIONS DES ENCAISSEMENTS</h1>", unsafe_allow_html=True)
+        instrumentation.section("Prévisions")
+        
+        horizon = st.slider("Horizon (mois)", min_value=3, max_value=24, value=previsions.HORIZON_MOIS, key="horizon_previsions")
+        with st.spinner("Calcul des prévisions..."):
+            prevues, bilan = previsions_en_cache(generation(), horizon)
+        moteur = "Prophet" if bilan['moteur'] == 'prophet' else "régression linéaire (Prophet non installé)"
+        st.caption(f"Modèle: {moteur} — {len(bilan['reajustes'])} segment(s) réajusté(s) à ce calcul")
+        
+        if prevues.empty:
+            st.info("Aucune donnée")
+        else:
+            par_mois = prevues.groupby('mois')[['attendu', 'prevision', 'prevision_basse', 'prevision_haute']].sum()
+            col1, col2, col3 = st.columns(3)
+            cartes = [
+                (col1, "📅 DÛ CONTRACTUEL", par_mois['attendu'].sum()),
+                (col2, "🔮 PRÉVISION", par_mois['prevision'].sum()),
+                (col3, "📆 CE MOIS-CI", par_mois['prevision'].iloc[0]),
+            ]
+            for col, titre, valeur in cartes:
+                with col:
                     st.markdown(f"""
-                    <div class='card'>
-                        <p><strong>💳 Type:</strong> {pay['type_paiement']}</p>
-                        <p><strong>💰 Montant:</strong> {format_number(pay['montant'])}</p>
-                        <p><strong>📅 Date:</strong> {pay['date_paiement']}</p>
-                        <p><strong>📝 Description:</strong> {pay['description'] or 'Aucune'}</p>
+                    <div class='metric-card'>
+                        <h3>{titre}</h3>
+                        <h2>{format_number(valeur)}</h2>
                     </div>
                     """, unsafe_allow_html=True)
+            
+            st.markdown("**💰 Encaissements mensuels prévus (intervalle à 80 %) et dû selon les échéanciers**")
+            st.line_chart(par_mois)
+            
+            st.markdown("<h2 style='color: #4ECDC4;'>📋 PAR DURÉE DE CONTRAT</h2>", unsafe_allow_html=True)
+            st.dataframe(
+                prevues.assign(segment=prevues['segment'].map("{:g} mois".format)),
+                column_config={
+                    "mois": "📅 Mois",
+                    "segment": "⏰ Durée",
+                    "attendu": st.column_config.NumberColumn("📅 Dû", format="%.0f"),
+                    "prevision": st.column_config.NumberColumn("🔮 Prévision", format="%.0f"),
+                    "prevision_basse": st.column_config.NumberColumn("⬇️ Basse", format="%.0f"),
+                    "prevision_haute": st.column_config.NumberColumn("⬆️ Haute", format="%.0f"),
+                },
+                hide_index=True, use_container_width=True,
+            )
+    
+    # Temps des sections et des accès aux données de ce passage, écrits dans le journal
+    evenements = instrumentation.terminer()
+    if st.session_state.get('debogage'):
+        afficher_debogage(evenements)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+import analytique
+import database
+import echeancier
+import export_donnees
+import generateur
+import previsions
+import releves
+import snapshots
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+PAGES = ["Accueil", "Clients", "Opérations", "Paiements", "Données", "Rapports", "Prévisions"]
+TAILLE_PAGE = 50
+# Modules dont le temps de démarrage (import dans un interpréteur neuf) est mesuré: scripts de traitement et application
+MODULES_DEMARRAGE = ['database', 'traitement_nuit', 'cli', 'app']
+
+
+def _nb_lignes(resultat):
+    if isinstance(resultat, (pd.DataFrame, pd.Series, list)):
+        return len(resultat)
+    if isinstance(resultat, tuple):
+        lignes = [n for n in map(_nb_lignes, resultat) if n is not None]
+        return sum(lignes) if lignes else None
+    return None
+
+
+# Mesurer `fonction`: durées de `repetitions` appels, puis pic mémoire Python (tracemalloc) sur un appel de plus
+def mesurer(nom, fonction, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        durees.append((time.perf_counter() - debut) * 1000)
+
+    tracemalloc.start()
+    try:
+        fonction()
+        pic = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'nom': nom,
+        'repetitions': repetitions,
+        'min_ms': round(min(durees), 3),
+        'mediane_ms': round(statistics.median(durees), 3),
+        'max_ms': round(max(durees), 3),
+        'pic_memoire_ko': round(pic / 1024, 1),
+        'lignes': _nb_lignes(resultat),
+    }
+
+
+# Lectures utilisées par les pages de app.py, avec les paramètres d'un affichage courant
+def lectures(repertoire):
+    operation = database.get_operations(1, 0, 'En cours')
+    operation_id = int(operation['id'].iloc[0]) if not operation.empty else 1
+    client_id = int(operation['client_id'].iloc[0]) if not operation.empty else 1
+    ouvertes = database.get_operations(statut='En cours')
+    aujourd_hui = pd.Timestamp.now()
+    depuis = (aujourd_hui - pd.Timedelta(days=365)).strftime("%Y-%m-%d")
+    return {
+        'get_clients(page)': lambda: database.get_clients(TAILLE_PAGE, 0),
+        'compter_clients': database.compter_clients,
+        'get_operations(page)': lambda: database.get_operations(TAILLE_PAGE, 0),
+        'get_operations(en cours, page)': lambda: database.get_operations(TAILLE_PAGE, 0, 'En cours'),
+        'get_operations(toutes)': database.get_operations,
+        'compter_operations': database.compter_operations,
+        'compter_operations(en cours)': lambda: database.compter_operations('En cours'),
+        'total_montant_operations': database.total_montant_operations,
+        'compter_paiements': database.compter_paiements,
+        'compter_paiements(client)': lambda: database.compter_paiements(client_id=client_id),
+        'compter_paiements(recherche)': lambda: database.compter_paiements(recherche="virement"),
+        'iter_paiements_par_operation(page)': lambda: list(
+            database.iter_paiements_par_operation(limite=TAILLE_PAGE, offset=0)),
+        'iter_paiements_par_operation(periode)': lambda: list(
+            database.iter_paiements_par_operation(depuis, aujourd_hui.date(), limite=TAILLE_PAGE, offset=0)),
+        'get_paiements_operation': lambda: database.get_paiements_operation(operation_id),
+        'rechercher_clients': lambda: database.rechercher_clients("client", 20),
+        'rechercher_operations': lambda: database.rechercher_operations("client", 20),
+        'construire_echeancier(en cours)': lambda: echeancier.construire_echeancier(ouvertes),
+        'analyser_portefeuille': lambda: echeancier.analyser_portefeuille(aujourd_hui.strftime("%Y-%m-%d")),
+        'mettre_a_jour_snapshots': snapshots.mettre_a_jour_snapshots,
+        'get_snapshots(1 an)': lambda: snapshots.get_snapshots(depuis),
+        'exporter(paiements, csv)': lambda: export_donnees.exporter(
+            'paiements', os.path.join(repertoire, 'paiements.csv')),
+        'analytique.rafraichir': analytique.rafraichir,
+        **{f"analytique: {nom}": rapport for nom, rapport in analytique.RAPPORTS.items()},
+        'previsions.prevoir': previsions.prevoir,
+        'generer_releves(html)': lambda: releves.generer_releves(os.path.join(repertoire, 'releves'), processus=1),
+    }
+
+
+# Écritures de l'interface, appelées sur des données créées pour le benchmark
+def ecritures():
+    compteur = iter(range(10 ** 9))
+    operation = database.get_operations(1, 0, 'En cours')
+    operation_id, client_id = int(operation['id'].iloc[0]), int(operation['client_id'].iloc[0])
+
+    def cycle_client():
+        nom = f"Benchmark {next(compteur)}"
+        database.ajouter_client(nom, "+222 00000000", "benchmark")
+        nouveau = database.rechercher_clients(nom, 1)['id'].iloc[0]
+        database.modifier_client(int(nouveau), nom + " bis", "+222 00000001", "benchmark")
+        database.supprimer_client(int(nouveau))
+
+    def cycle_operation():
+        database.creer_operation(client_id, 100000, 0.08, 6)
+        nouvelle = int(database.get_operations(1, 0)['id'].iloc[0])
+        database.modifier_operation(nouvelle, 120000, 0.08, 6)
+        database.supprimer_operation(nouvelle)
+
+    return {
+        'ajouter/modifier/supprimer client': cycle_client,
+        'creer/modifier/supprimer operation': cycle_operation,
+        'enregistrer_paiement': lambda: database.enregistrer_paiement(operation_id, client_id, "Anticipé", 1, "benchmark"),
+    }
+
+
+# Rendu complet de chaque page par le banc de test de Streamlit (sans navigateur)
+def pages():
+    from streamlit.testing.v1 import AppTest
+
+    def rendre(page):
+        at = AppTest.from_file(APP, default_timeout=600)
+        at.session_state['current_page'] = page
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"Page {page}: {at.exception[0].value}")
+        return list(at.main)
+
+    return {f"page {page}": (lambda page=page: rendre(page)) for page in PAGES}
+
+
+# Démarrage à froid: import de chaque module dans un nouvel interpréteur (indépendant de la taille de la base)
+def demarrages():
+    def importer(module):
+        subprocess.run([sys.executable, '-c', f"import {module}"], cwd=os.path.dirname(APP), capture_output=True,
+                       check=True)
+
+    return {f"import {module}": (lambda module=module: importer(module)) for module in MODULES_DEMARRAGE}
+
+
+def _version():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(APP)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Générer une base de chaque taille puis mesurer lectures, écritures et pages;
+# renvoie le rapport (dictionnaire sérialisable en JSON)
+def executer(tailles, repetitions=5, graine=42, avec_pages=True):
+    rapport = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'version': _version(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'pandas': pd.__version__,
+        'repetitions': repetitions,
+        'resultats': [],
+    }
+    for nom, fonction in demarrages().items():
+        mesure = mesurer(nom, fonction, repetitions)
+        mesure.update(taille=None, type='import')
+        rapport['resultats'].append(mesure)
+        print(f"{'import':8} {nom:45} {mesure['mediane_ms']:10.1f} ms")
+    for taille in tailles:
+        with tempfile.TemporaryDirectory() as repertoire:
+            database.configurer_db(os.path.join(repertoire, 'benchmark.db'))
+            database.init_db()
+            debut = time.perf_counter()
+            nb_clients, nb_operations, nb_paiements = generateur.generer(generateur.TAILLES.get(taille) or int(taille),
+                                                                          graine)
+            print(f"[{taille}] {nb_clients} clients, {nb_operations} opérations, {nb_paiements} paiements "
+                  f"générés en {time.perf_counter() - debut:.1f} s")
+
+            # Requêtes critiques dont le plan parcourt une table entière (voir database.REQUETES_CRITIQUES)
+            rapport.setdefault('parcours_complets', {})[taille] = database.verifier_plans_requetes()
+
+            groupes = [('lecture', lectures(repertoire)), ('ecriture', ecritures())]
+            if avec_pages:
+                groupes.append(('page', pages()))
+            for type_mesure, fonctions in groupes:
+                for nom, fonction in fonctions.items():
+                    mesure = mesurer(nom, fonction, repetitions)
+                    mesure.update(taille=taille, type=type_mesure, clients=nb_clients,
+                                  operations=nb_operations, paiements=nb_paiements)
+                    rapport['resultats'].append(mesure)
+                    print(f"[{taille}] {type_mesure:8} {nom:45} {mesure['mediane_ms']:10.1f} ms "
+                          f"{mesure['pic_memoire_ko']:10.0f} Ko")
+            database.fermer_connexions()
+    return rapport
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mesurer les temps et la mémoire des accès aux données et des pages")
+    parser.add_argument('tailles', nargs='*', default=['10k'],
+                        help="Nombres approximatifs de paiements, ou tailles prédéfinies: " + ", ".join(generateur.TAILLES))
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--graine', type=int, default=42)
+    parser.add_argument('--sans-pages', action='store_true', help="Ne pas mesurer le rendu des pages")
+    parser.add_argument('--sortie', default='benchmark.json', help="Fichier JSON des résultats")
+    args = parser.parse_args()
+
+    rapport = executer(args.tailles, args.repetitions, args.graine, not args.sans_pages)
+    with open(args.sortie, 'w', encoding='utf-8') as fichier:
+        json.dump(rapport, fichier, ensure_ascii=False, indent=2)
+    print(f"Résultats: {args.sortie}")
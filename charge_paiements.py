@@ -0,0 +1,148 @@
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import database
+import ecriture_groupee
+
+# Test de charge de l'enregistrement des paiements: plusieurs processus de caissiers enregistrent
+# des paiements au débit cible sur les mêmes opérations, puis la base est vérifiée: aucun paiement
+# acquitté perdu, soldes et échéances cohérents avec les paiements réellement enregistrés.
+
+
+def _preparer(nb_operations):
+    database.init_db()
+    database.ajouter_client("Client charge", None, "test de charge")
+    client_id = database.rechercher_clients("Client charge", 1)['id'].iloc[0]
+    for _ in range(nb_operations):
+        # Montant assez élevé pour que les opérations restent en cours pendant le test
+        database.creer_operation(int(client_id), 1e9, 0.1, 12)
+    with database.connexion() as conn:
+        return {op_id: (client_id, echeance) for op_id, client_id, echeance in conn.execute(
+            "SELECT id, client_id, prochaine_echeance FROM operations")}
+
+
+# Un caissier: `nb` paiements espacés régulièrement à partir de `depart` (horloge commune aux processus)
+def _caissier(operations, nb, intervalle, depart, graine):
+    rng = random.Random(graine)
+    acquittes = []
+    erreurs = []
+    latences = []
+    for i in range(nb):
+        attente = depart + i * intervalle - time.time()
+        if attente > 0:
+            time.sleep(attente)
+        op_id = rng.choice(list(operations))
+        type_paiement = rng.choice(["Ordinaire", "Ordinaire", "Anticipé"])
+        montant = rng.randint(1, 1000)
+        debut = time.perf_counter()
+        succes, message = database.enregistrer_paiement(op_id, operations[op_id][0], type_paiement, montant,
+                                                        f"charge {graine}-{i}")
+        latences.append((time.perf_counter() - debut) * 1000)
+        if succes:
+            acquittes.append((op_id, type_paiement, montant))
+        else:
+            erreurs.append(message)
+    return acquittes, erreurs, latences
+
+
+# Un processus: `threads` caissiers (sessions de l'application), avec ou sans écrivain groupé
+def _processus(chemin, operations, threads, nb, intervalle, depart, graine, groupe):
+    database.configurer_db(chemin)
+    if groupe:
+        ecriture_groupee.demarrer()
+    try:
+        with ThreadPoolExecutor(threads) as executeur:
+            resultats = list(executeur.map(
+                lambda i: _caissier(operations, nb, intervalle, depart + i * intervalle / threads, graine * threads + i),
+                range(threads)))
+    finally:
+        ecriture_groupee.arreter()
+        database.fermer_connexions()
+    return tuple([x for r in resultats for x in r[k]] for k in range(3))
+
+
+# Comparer la base aux paiements acquittés par les caissiers; renvoie la liste des incohérences
+def _verifier(operations, acquittes):
+    attendus = dict.fromkeys(operations, 0.0)
+    for op_id, type_paiement, montant in acquittes:
+        attendus[op_id] += montant
+
+    anomalies = []
+    with database.connexion() as conn:
+        nb_paiements = conn.execute("SELECT COUNT(*) FROM paiements").fetchone()[0]
+        if nb_paiements != len(acquittes):
+            anomalies.append(f"{nb_paiements} paiements en base pour {len(acquittes)} acquittés")
+        for op_id, total in attendus.items():
+            echeance, total_paye, reste, montant_total, duree, somme = conn.execute('''
+                SELECT o.prochaine_echeance, o.total_paye, o.reste_a_payer, o.montant_total, o.duree_mois,
+                       (SELECT COALESCE(SUM(montant), 0) FROM paiements WHERE operation_id = o.id)
+                FROM operations o WHERE o.id = ?
+            ''', (op_id,)).fetchone()
+            # Une échéance de plus par échéance entièrement couverte par le total payé (jusqu'à la dernière)
+            couvertes = min(int((total + database.TOLERANCE_SOLDE) * duree / montant_total), math.ceil(duree) - 1)
+            echeance_attendue = conn.execute("SELECT date(?, ?)", (
+                operations[op_id][1], f"+{database.JOURS_PAR_ECHEANCE * couvertes} days")).fetchone()[0]
+            if echeance != echeance_attendue:
+                anomalies.append(f"opération {op_id}: échéance {echeance}, attendue {echeance_attendue}")
+            if abs(total_paye - total) > database.TOLERANCE_SOLDE or abs(somme - total) > database.TOLERANCE_SOLDE:
+                anomalies.append(f"opération {op_id}: total payé {total_paye} / {somme}, attendu {total}")
+            if abs(reste - (montant_total - total)) > database.TOLERANCE_SOLDE:
+                anomalies.append(f"opération {op_id}: reste à payer {reste} incohérent")
+    return anomalies
+
+
+def executer(processus, threads, debit, duree, nb_operations, chemin, groupe=False):
+    database.configurer_db(chemin)
+    operations = _preparer(nb_operations)
+    caissiers = processus * threads
+    nb_par_caissier = max(1, int(debit * duree / caissiers))
+    intervalle = caissiers / debit
+    depart = time.time() + 1
+
+    with ProcessPoolExecutor(processus) as executeur:
+        futures = [executeur.submit(_processus, chemin, operations, threads, nb_par_caissier, intervalle,
+                                    depart + i * intervalle / caissiers, i, groupe) for i in range(processus)]
+        resultats = [f.result() for f in futures]
+    ecoule = time.time() - depart
+
+    acquittes = [a for r in resultats for a in r[0]]
+    erreurs = [e for r in resultats for e in r[1]]
+    latences = sorted(l for r in resultats for l in r[2])
+    anomalies = _verifier(operations, acquittes)
+    debit_obtenu = len(acquittes) / ecoule
+
+    print(f"{len(acquittes)} paiement(s) acquitté(s), {len(erreurs)} erreur(s) en {ecoule:.1f} s: "
+          f"{debit_obtenu:.0f} paiements/s (cible {debit})")
+    print(f"Latence: médiane {statistics.median(latences):.1f} ms, "
+          f"p99 {latences[int(len(latences) * 0.99) - 1]:.1f} ms, max {latences[-1]:.1f} ms")
+    for message in sorted(set(erreurs))[:10]:
+        print(f"  erreur: {message}")
+    for anomalie in anomalies[:20]:
+        print(f"  incohérence: {anomalie}")
+    return not erreurs and not anomalies and debit_obtenu >= 0.95 * debit
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Test de charge multi-processus de l'enregistrement des paiements")
+    parser.add_argument('--processus', type=int, default=4, help="Nombre de processus")
+    parser.add_argument('--threads', type=int, default=1, help="Caissiers simultanés par processus")
+    parser.add_argument('--groupe', action='store_true', help="Écriture groupée des paiements (ecriture_groupee)")
+    parser.add_argument('--debit', type=float, default=200, help="Paiements par seconde visés, tous processus confondus")
+    parser.add_argument('--duree', type=float, default=10, help="Durée du test en secondes")
+    parser.add_argument('--operations', type=int, default=20,
+                        help="Nombre d'opérations visées (peu nombreuses: mêmes lignes modifiées en concurrence)")
+    parser.add_argument('--db', help="Base neuve à créer (par défaut: une base temporaire)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as repertoire:
+        chemin = args.db or os.path.join(repertoire, 'charge.db')
+        reussi = executer(args.processus, args.threads, args.debit, args.duree, args.operations, chemin, args.groupe)
+    print("OK" if reussi else "ÉCHEC")
+    sys.exit(0 if reussi else 1)
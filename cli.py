@@ -0,0 +1,179 @@
+import argparse
+from datetime import date
+
+import analytique
+import database
+import export_donnees
+import generateur
+import import_donnees
+import instrumentation
+import previsions
+import releves
+import snapshots
+import traitement_nuit
+
+
+# Recalculer les soldes des opérations depuis la table paiements
+def commande_reconcilier(args):
+    corrigees = database.reconcilier_soldes()
+    print(f"{corrigees} opération(s) corrigée(s)")
+
+
+# Importer un fichier CSV/Excel; les lignes rejetées sont listées ou écrites dans --erreurs
+def commande_importer(args):
+    importees, erreurs = import_donnees.importer(args.type, args.fichier, taille_lot=args.taille_lot)
+    print(f"{importees} ligne(s) importée(s), {len(erreurs)} rejetée(s)")
+    if erreurs.empty:
+        return
+    if args.erreurs:
+        erreurs.to_csv(args.erreurs, index=False)
+        print(f"Rapport d'erreurs: {args.erreurs}")
+    else:
+        print(erreurs.to_string(index=False))
+
+
+# Exporter une table vers CSV/Parquet, par blocs
+def commande_exporter(args):
+    nb_lignes = export_donnees.exporter(args.table, args.destination, args.format, args.du, args.au, args.taille_bloc,
+                                        args.avec_archive)
+    print(f"{nb_lignes} ligne(s) exportée(s) vers {args.destination}")
+
+
+# Compléter (ou reconstruire) les instantanés quotidiens du portefeuille
+def commande_snapshots(args):
+    nb_jours = snapshots.mettre_a_jour_snapshots(reconstruire=args.reconstruire)
+    print(f"{nb_jours} jour(s) calculé(s)")
+
+
+# Déplacer les opérations terminées anciennes et leurs paiements vers la base d'archive
+def commande_archiver(args):
+    nb_operations, nb_paiements = database.archiver(args.age_jours, args.taille_lot)
+    print(f"{nb_operations} opération(s) et {nb_paiements} paiement(s) archivés dans {database.chemin_archive()}")
+
+
+# Traitement de nuit: soldes, statuts, échéances et retards de toutes les opérations, puis instantanés
+def commande_nuit(args):
+    jour = date.fromisoformat(args.date) if args.date else None
+    modifiees = traitement_nuit.executer(jour, args.taille_lot)
+    print(f"{modifiees['soldes']} solde(s) corrigé(s), {modifiees['statuts']} statut(s) modifié(s), "
+          f"{modifiees['echeances']} échéance(s) avancée(s), {modifiees['retards']} indicateur(s) de retard modifié(s)")
+    if not args.sans_snapshots:
+        nb_jours = snapshots.mettre_a_jour_snapshots()
+        print(f"{nb_jours} jour(s) d'instantanés calculé(s)")
+
+
+# Remplir la base avec un registre synthétique (tests de charge, benchmarks)
+def commande_generer(args):
+    taille = generateur.TAILLES.get(args.taille) or int(args.taille)
+    nb_clients, nb_operations, nb_paiements = generateur.generer(taille, args.graine)
+    print(f"{nb_clients} client(s), {nb_operations} opération(s), {nb_paiements} paiement(s) générés")
+
+
+# Rafraîchir la copie en colonnes utilisée par les rapports, et afficher les rapports si demandé
+def commande_analytique(args):
+    bilan = analytique.rafraichir(args.reconstruire)
+    print(f"{'Copie reconstruite' if bilan['reconstruction'] else 'Copie mise à jour'} dans {analytique.repertoire()}: "
+          f"{bilan['operations']} opération(s) et {bilan['paiements']} paiement(s) lus, "
+          f"{bilan['operations_supprimees']} opération(s) et {bilan['paiements_supprimes']} paiement(s) retirés")
+    if args.rapports:
+        for nom, rapport in analytique.RAPPORTS.items():
+            print(f"\n{nom}\n{rapport().to_string(index=False)}")
+
+
+# Prévoir les encaissements mensuels (modèles réajustés seulement si nécessaire, ou si --reajuster)
+def commande_previsions(args):
+    prevues, bilan = previsions.prevoir(args.horizon, args.reajuster, args.processus)
+    print(f"Modèle: {bilan['moteur']}, {len(bilan['reajustes'])} segment(s) réajusté(s)")
+    par_mois = prevues.groupby('mois')[['attendu', 'prevision', 'prevision_basse', 'prevision_haute']].sum()
+    print(par_mois.round(0).to_string())
+
+
+# Générer les relevés mensuels de tous les clients concernés, rendus en parallèle
+def commande_releves(args):
+    nb_releves, nb_fichiers = releves.generer_releves(args.dossier, args.mois, args.format, args.processus,
+                                                      args.taille_lot)
+    print(f"{nb_releves} relevé(s) générés ({nb_fichiers} fichier(s)) dans {args.dossier}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Commandes d'administration de la base des ventes à terme")
+    parser.add_argument('--db', help="Chemin de la base (par défaut: VENTES_TERME_DB ou ventes_terme.db)")
+    commandes = parser.add_subparsers(dest='commande', required=True)
+
+    reconcilier = commandes.add_parser('reconcilier', help="Reconstruire total_paye et reste_a_payer depuis les paiements")
+    reconcilier.set_defaults(fonction=commande_reconcilier)
+
+    importer = commandes.add_parser('importer', help="Importer des clients, opérations ou paiements depuis un CSV/Excel")
+    importer.add_argument('type', choices=list(import_donnees.COLONNES))
+    importer.add_argument('fichier')
+    importer.add_argument('--taille-lot', type=int, default=import_donnees.TAILLE_LOT)
+    importer.add_argument('--erreurs', help="Fichier CSV où écrire les lignes rejetées")
+    importer.set_defaults(fonction=commande_importer)
+
+    exporter = commandes.add_parser('exporter', help="Exporter clients, opérations ou paiements en CSV/Parquet")
+    exporter.add_argument('table', choices=list(export_donnees.EXPORTS))
+    exporter.add_argument('destination')
+    exporter.add_argument('--format', choices=export_donnees.FORMATS,
+                          help="Par défaut, déduit de l'extension de la destination")
+    exporter.add_argument('--du', help="Date de début (AAAA-MM-JJ)")
+    exporter.add_argument('--au', help="Date de fin incluse (AAAA-MM-JJ)")
+    exporter.add_argument('--taille-bloc', type=int, default=export_donnees.TAILLE_BLOC)
+    exporter.add_argument('--avec-archive', action='store_true',
+                          help="Inclure les opérations et paiements archivés")
+    exporter.set_defaults(fonction=commande_exporter)
+
+    instantanes = commandes.add_parser('snapshots', help="Compléter les instantanés quotidiens du portefeuille")
+    instantanes.add_argument('--reconstruire', action='store_true',
+                             help="Recalculer tout l'historique (après modification ou suppression d'opérations)")
+    instantanes.set_defaults(fonction=commande_snapshots)
+
+    archiver = commandes.add_parser('archiver', help="Archiver les opérations terminées et leurs paiements")
+    archiver.add_argument('--age-jours', type=int, default=database.ARCHIVE_AGE_JOURS,
+                          help="Ancienneté minimale de clôture, en jours")
+    archiver.add_argument('--taille-lot', type=int, default=database.ARCHIVE_TAILLE_LOT,
+                          help="Opérations archivées par transaction")
+    archiver.set_defaults(fonction=commande_archiver)
+
+    nuit = commandes.add_parser('nuit', help="Traitement de nuit: soldes, statuts, échéances et retards")
+    nuit.add_argument('--date', help="Date de référence des retards (AAAA-MM-JJ, par défaut aujourd'hui)")
+    nuit.add_argument('--taille-lot', type=int, default=traitement_nuit.TAILLE_LOT,
+                      help="Opérations traitées par transaction")
+    nuit.add_argument('--sans-snapshots', action='store_true', help="Ne pas compléter les instantanés quotidiens")
+    nuit.set_defaults(fonction=commande_nuit)
+
+    generer = commandes.add_parser('generer', help="Générer un registre synthétique déterministe")
+    generer.add_argument('taille', help="Nombre approximatif de paiements, ou taille prédéfinie: "
+                                        + ", ".join(generateur.TAILLES))
+    generer.add_argument('--graine', type=int, default=42, help="Graine du générateur aléatoire")
+    generer.set_defaults(fonction=commande_generer)
+
+    copie = commandes.add_parser('analytique', help="Rafraîchir la copie en colonnes des rapports")
+    copie.add_argument('--reconstruire', action='store_true', help="Relire toute la base au lieu des seules modifications")
+    copie.add_argument('--rapports', action='store_true', help="Afficher ensuite tous les rapports")
+    copie.set_defaults(fonction=commande_analytique)
+
+    prevision = commandes.add_parser('previsions', help="Prévoir les encaissements mensuels")
+    prevision.add_argument('--horizon', type=int, default=previsions.HORIZON_MOIS, help="Nombre de mois prévus")
+    prevision.add_argument('--reajuster', action='store_true', help="Réajuster tous les modèles")
+    prevision.add_argument('--processus', type=int, help="Processus d'ajustement (par défaut: un par cœur)")
+    prevision.set_defaults(fonction=commande_previsions)
+
+    releve = commandes.add_parser('releves', help="Générer les relevés mensuels des clients")
+    releve.add_argument('dossier', help="Dossier de destination des relevés")
+    releve.add_argument('--mois', help="Mois des relevés (AAAA-MM, par défaut le mois précédent)")
+    releve.add_argument('--format', nargs='+', choices=releves.FORMATS, default=['html'])
+    releve.add_argument('--processus', type=int, help="Processus de rendu (par défaut: un par cœur, 1: sans pool)")
+    releve.add_argument('--taille-lot', type=int, default=releves.TAILLE_LOT, help="Clients lus et rendus par lot")
+    releve.set_defaults(fonction=commande_releves)
+
+    args = parser.parse_args(argv)
+    if args.db:
+        database.configurer_db(args.db)
+    database.init_db()
+    instrumentation.demarrer(f"cli {args.commande}")
+    args.fonction(args)
+    instrumentation.terminer()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1091 @@
+import functools
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import instrumentation
+
+# Configuration de la connexion (chemin surchargeable par la variable VENTES_TERME_DB)
+DB_PATH = os.environ.get('VENTES_TERME_DB', 'ventes_terme.db')
+POOL_TAILLE = int(os.environ.get('VENTES_TERME_POOL', '8'))
+BUSY_TIMEOUT_MS = 5000
+# Nouvelles tentatives d'une transaction d'écriture quand la base reste verrouillée au-delà du busy_timeout
+TENTATIVES_ECRITURE = 5
+ATTENTE_TENTATIVE_S = 0.05
+
+# Reste à payer en dessous duquel une opération est soldée (arrondis des montants en flottants)
+TOLERANCE_SOLDE = 0.005
+
+# Une échéance tous les 30 jours à partir de la création
+JOURS_PAR_ECHEANCE = 30
+# Montants saisis en unités entières (mensualités arrondies): les échéances sont couvertes à
+# TOLERANCE_ECHEANCE unité près par échéance du contrat
+TOLERANCE_ECHEANCE = 1
+# Prochaine échéance d'après les montants payés (paramètres :jours et :tolerance): première échéance non
+# entièrement couverte, les paiements étant imputés aux plus anciennes d'abord comme dans l'échéancier
+# (echeancier.construire_echeancier); la dernière une fois toutes couvertes
+SQL_PROCHAINE_ECHEANCE = f'''
+    date(date_creation, '+' || (:jours * (MIN(CAST((total_paye + :tolerance + {TOLERANCE_ECHEANCE} * duree_mois)
+                                                  * duree_mois / montant_total AS INTEGER),
+                                             CAST(duree_mois AS INTEGER) + (duree_mois > CAST(duree_mois AS INTEGER)) - 1)
+                                         + 1)) || ' days')
+'''
+
+# Ancienneté de clôture (jours) au-delà de laquelle une opération terminée est archivée, et opérations
+# archivées par transaction
+ARCHIVE_AGE_JOURS = 365
+ARCHIVE_TAILLE_LOT = 5000
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-32000",     # ~32 Mo de cache de pages par connexion
+    "PRAGMA mmap_size=268435456",   # 256 Mo lus via mmap
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+)
+
+# Pool de connexions partagé entre les threads (sessions Streamlit, scripts)
+_pool = queue.LifoQueue(maxsize=POOL_TAILLE)
+_pool_lock = threading.Lock()
+
+
+# Génération des données: incrémentée à chaque écriture, sert de clé d'invalidation aux caches de lecture
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def generation():
+    return _generation
+
+
+def invalider_cache():
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+# Décorateur des fonctions d'écriture: invalide les caches après chaque appel
+def ecriture(fonction):
+    @functools.wraps(fonction)
+    def enveloppe(*args, **kwargs):
+        try:
+            return fonction(*args, **kwargs)
+        finally:
+            invalider_cache()
+    return enveloppe
+
+
+# Changer la base utilisée (les connexions ouvertes sur l'ancienne sont fermées)
+def configurer_db(chemin):
+    global DB_PATH
+    with _pool_lock:
+        DB_PATH = chemin
+    fermer_connexions()
+    invalider_cache()
+
+
+# Fermer toutes les connexions disponibles dans le pool
+def fermer_connexions():
+    while True:
+        try:
+            _, conn = _pool.get_nowait()
+        except queue.Empty:
+            break
+        conn.close()
+
+
+def _ouvrir_connexion(chemin):
+    conn = sqlite3.connect(chemin, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+# Connexion hors pool, gardée par un thread qui en a l'usage exclusif (écrivain groupé)
+def ouvrir_connexion_dediee(chemin=None):
+    return _ouvrir_connexion(chemin or DB_PATH)
+
+
+# Emprunter une connexion du pool le temps d'un bloc `with`
+@contextmanager
+def connexion():
+    chemin = DB_PATH
+    conn = None
+    while conn is None:
+        try:
+            chemin_conn, conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = _ouvrir_connexion(chemin)
+            break
+        if chemin_conn != chemin:
+            conn.close()
+            conn = None
+
+    conn.set_trace_callback(instrumentation.rappel_sql())
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        if chemin != DB_PATH:
+            conn.close()
+        else:
+            try:
+                _pool.put_nowait((chemin, conn))
+            except queue.Full:
+                conn.close()
+
+
+def _base_verrouillee(erreur):
+    message = str(erreur).lower()
+    return 'locked' in message or 'busy' in message
+
+
+# Exécuter travail(conn) dans une transaction BEGIN IMMEDIATE: le verrou d'écriture est pris dès le début,
+# sans lecture suivie d'une écriture concurrente. Recommencée avec une attente croissante (bornée à
+# `tentatives`) si la base reste verrouillée. Renvoie le résultat de travail(conn).
+# `conn`: connexion dédiée à utiliser plutôt qu'une connexion du pool.
+def transaction_immediate(travail, tentatives=TENTATIVES_ECRITURE, conn=None):
+    for tentative in range(tentatives):
+        try:
+            with connexion() if conn is None else nullcontext(conn) as conn_tx:
+                try:
+                    conn_tx.execute('BEGIN IMMEDIATE')
+                    resultat = travail(conn_tx)
+                    conn_tx.commit()
+                    return resultat
+                finally:
+                    if conn_tx.in_transaction:
+                        conn_tx.rollback()
+        except sqlite3.OperationalError as e:
+            if not _base_verrouillee(e) or tentative == tentatives - 1:
+                raise
+        time.sleep(ATTENTE_TENTATIVE_S * 2 ** tentative * (0.5 + random.random()))
+
+
+# Base d'archive des opérations terminées et de leurs paiements (VENTES_TERME_ARCHIVE, par défaut
+# à côté de la base: ventes_terme_archive.db)
+def chemin_archive():
+    return os.environ.get('VENTES_TERME_ARCHIVE') or os.path.splitext(DB_PATH)[0] + '_archive.db'
+
+
+TABLES_ARCHIVEES = ('operations', 'paiements')
+
+INDEX_ARCHIVE = (
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_operations_client ON operations (client_id)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_operations_date ON operations (date_creation)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_paiements_operation ON paiements (operation_id, date_paiement)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_paiements_client ON paiements (client_id, date_paiement)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_paiements_date ON paiements (date_paiement)',
+)
+
+# Vues temporaires (propres à la connexion) réunissant base courante et archive, par table ou vue courante
+VUES_ARCHIVE = {
+    'operations': 'toutes_operations',
+    'paiements': 'tous_paiements',
+    'v_operations_soldes': 'v_toutes_operations_soldes',
+}
+
+
+def _colonnes(conn, schema, table):
+    return [ligne[1:5] for ligne in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+# Tables de l'archive créées d'après celles de la base courante, puis complétées des colonnes
+# ajoutées depuis par les migrations
+def _preparer_archive(conn):
+    for table in TABLES_ARCHIVEES:
+        colonnes_archive = {c[0] for c in _colonnes(conn, 'archive', table)}
+        if not colonnes_archive:
+            sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                               (table,)).fetchone()[0]
+            conn.execute(sql.replace(f'CREATE TABLE {table}', f'CREATE TABLE archive.{table}', 1))
+            continue
+        for nom, type_colonne, non_nul, defaut in _colonnes(conn, 'main', table):
+            if nom not in colonnes_archive:
+                conn.execute(f'ALTER TABLE archive.{table} ADD COLUMN {nom} {type_colonne}'
+                             + (' NOT NULL' if non_nul else '') + (f' DEFAULT {defaut}' if defaut is not None else ''))
+    for instruction in INDEX_ARCHIVE:
+        conn.execute(instruction)
+
+
+# Emprunter une connexion du pool avec l'archive attachée (schéma archive) et les vues VUES_ARCHIVE
+@contextmanager
+def connexion_archive():
+    with connexion() as conn:
+        # Déjà attachée si un détachement précédent a échoué (curseur encore ouvert)
+        if 'archive' not in [ligne[1] for ligne in conn.execute('PRAGMA database_list')]:
+            conn.execute('ATTACH DATABASE ? AS archive', (chemin_archive(),))
+        try:
+            if any({c[0] for c in _colonnes(conn, 'main', t)} - {c[0] for c in _colonnes(conn, 'archive', t)}
+                   for t in TABLES_ARCHIVEES):
+                conn.execute('BEGIN IMMEDIATE')
+                _preparer_archive(conn)
+                conn.commit()
+            for vue in VUES_ARCHIVE.values():
+                conn.execute(f'DROP VIEW IF EXISTS temp.{vue}')
+            for table in TABLES_ARCHIVEES:
+                colonnes = ', '.join(c[0] for c in _colonnes(conn, 'main', table))
+                conn.execute(f'''
+                    CREATE TEMP VIEW {VUES_ARCHIVE[table]} AS
+                    SELECT {colonnes} FROM main.{table} UNION ALL SELECT {colonnes} FROM archive.{table}
+                ''')
+            conn.execute('''
+                CREATE TEMP VIEW v_toutes_operations_soldes AS
+                SELECT o.*, c.nom AS client_nom, c.telephone,
+                       MAX(MIN(o.montant_total / o.duree_mois, o.reste_a_payer), 0) AS prochain_paiement
+                FROM toutes_operations o
+                JOIN clients c ON o.client_id = c.id
+            ''')
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                for vue in VUES_ARCHIVE.values():
+                    conn.execute(f'DROP VIEW IF EXISTS temp.{vue}')
+                conn.execute('DETACH DATABASE archive')
+            except sqlite3.OperationalError:
+                pass
+
+
+# Connexion de lecture, avec l'archive si demandé: produit (connexion, table ou vue à lire)
+@contextmanager
+def connexion_lecture(table, avec_archive=False):
+    if not avec_archive:
+        with connexion() as conn:
+            yield conn, table
+    else:
+        with connexion_archive() as conn:
+            yield conn, VUES_ARCHIVE.get(table, table)
+
+
+# Migrations du schéma, dans l'ordre: la migration n fait passer PRAGMA user_version de n-1 à n
+MIGRATIONS = [
+    # 1 - Schéma initial
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS clients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT NOT NULL UNIQUE,
+            telephone TEXT,
+            description TEXT,
+            date_creation TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS operations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id INTEGER NOT NULL,
+            valeur_marchandise REAL NOT NULL,
+            taux_benefice REAL NOT NULL,
+            duree_mois REAL NOT NULL,
+            date_creation TEXT NOT NULL,
+            statut TEXT DEFAULT 'En cours',
+            montant_total REAL NOT NULL,
+            prochaine_echeance TEXT,
+            FOREIGN KEY (client_id) REFERENCES clients (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS paiements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation_id INTEGER NOT NULL,
+            client_id INTEGER NOT NULL,
+            type_paiement TEXT NOT NULL,
+            montant REAL NOT NULL,
+            date_paiement TEXT NOT NULL,
+            description TEXT,
+            FOREIGN KEY (operation_id) REFERENCES operations (id),
+            FOREIGN KEY (client_id) REFERENCES clients (id)
+        )
+        ''',
+        # Vue des opérations avec leurs soldes, calculés en une seule agrégation
+        '''
+        CREATE VIEW IF NOT EXISTS v_operations_soldes AS
+        SELECT o.*, c.nom AS client_nom, c.telephone,
+               COALESCE(p.total_paye, 0) AS total_paye,
+               o.montant_total - COALESCE(p.total_paye, 0) AS reste_a_payer,
+               MAX(MIN(o.montant_total / o.duree_mois, o.montant_total - COALESCE(p.total_paye, 0)), 0)
+                   AS prochain_paiement
+        FROM operations o
+        JOIN clients c ON o.client_id = c.id
+        LEFT JOIN (
+            SELECT operation_id, SUM(montant) AS total_paye
+            FROM paiements
+            GROUP BY operation_id
+        ) p ON p.operation_id = o.id
+        ''',
+    ),
+    # 2 - Index des chemins d'accès fréquents
+    (
+        'CREATE INDEX IF NOT EXISTS idx_paiements_operation ON paiements (operation_id, date_paiement, montant)',
+        'CREATE INDEX IF NOT EXISTS idx_paiements_client ON paiements (client_id, date_paiement)',
+        'CREATE INDEX IF NOT EXISTS idx_paiements_date ON paiements (date_paiement)',
+        'CREATE INDEX IF NOT EXISTS idx_operations_client ON operations (client_id)',
+        'CREATE INDEX IF NOT EXISTS idx_operations_statut ON operations (statut, date_creation)',
+        'CREATE INDEX IF NOT EXISTS idx_operations_date ON operations (date_creation)',
+    ),
+    # 3 - Soldes tenus à jour sur operations par triggers, dans la transaction de chaque paiement
+    (
+        'ALTER TABLE operations ADD COLUMN total_paye REAL NOT NULL DEFAULT 0',
+        'ALTER TABLE operations ADD COLUMN reste_a_payer REAL NOT NULL DEFAULT 0',
+        '''
+        UPDATE operations SET total_paye = COALESCE(
+            (SELECT SUM(montant) FROM paiements p WHERE p.operation_id = operations.id), 0)
+        ''',
+        'UPDATE operations SET reste_a_payer = montant_total - total_paye',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_paiements_insert AFTER INSERT ON paiements
+        BEGIN
+            UPDATE operations
+            SET total_paye = total_paye + NEW.montant, reste_a_payer = reste_a_payer - NEW.montant
+            WHERE id = NEW.operation_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_paiements_delete AFTER DELETE ON paiements
+        BEGIN
+            UPDATE operations
+            SET total_paye = total_paye - OLD.montant, reste_a_payer = reste_a_payer + OLD.montant
+            WHERE id = OLD.operation_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_paiements_update AFTER UPDATE OF montant, operation_id ON paiements
+        BEGIN
+            UPDATE operations
+            SET total_paye = total_paye - OLD.montant, reste_a_payer = reste_a_payer + OLD.montant
+            WHERE id = OLD.operation_id;
+            UPDATE operations
+            SET total_paye = total_paye + NEW.montant, reste_a_payer = reste_a_payer - NEW.montant
+            WHERE id = NEW.operation_id;
+        END
+        ''',
+        # La vue lit désormais les soldes stockés au lieu d'agréger paiements
+        'DROP VIEW IF EXISTS v_operations_soldes',
+        '''
+        CREATE VIEW v_operations_soldes AS
+        SELECT o.*, c.nom AS client_nom, c.telephone,
+               MAX(MIN(o.montant_total / o.duree_mois, o.reste_a_payer), 0) AS prochain_paiement
+        FROM operations o
+        JOIN clients c ON o.client_id = c.id
+        ''',
+    ),
+    # 4 - Index plein texte (FTS5, contenu externe) sur les clients et les descriptions de paiements
+    (
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS clients_fts USING fts5(
+            nom, telephone, description,
+            content='clients', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_clients_fts_insert AFTER INSERT ON clients
+        BEGIN
+            INSERT INTO clients_fts (rowid, nom, telephone, description)
+            VALUES (NEW.id, NEW.nom, NEW.telephone, NEW.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_clients_fts_delete AFTER DELETE ON clients
+        BEGIN
+            INSERT INTO clients_fts (clients_fts, rowid, nom, telephone, description)
+            VALUES ('delete', OLD.id, OLD.nom, OLD.telephone, OLD.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_clients_fts_update AFTER UPDATE OF nom, telephone, description ON clients
+        BEGIN
+            INSERT INTO clients_fts (clients_fts, rowid, nom, telephone, description)
+            VALUES ('delete', OLD.id, OLD.nom, OLD.telephone, OLD.description);
+            INSERT INTO clients_fts (rowid, nom, telephone, description)
+            VALUES (NEW.id, NEW.nom, NEW.telephone, NEW.description);
+        END
+        ''',
+        "INSERT INTO clients_fts (clients_fts) VALUES ('rebuild')",
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS paiements_fts USING fts5(
+            description,
+            content='paiements', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_paiements_fts_insert AFTER INSERT ON paiements
+        BEGIN
+            INSERT INTO paiements_fts (rowid, description) VALUES (NEW.id, NEW.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_paiements_fts_delete AFTER DELETE ON paiements
+        BEGIN
+            INSERT INTO paiements_fts (paiements_fts, rowid, description) VALUES ('delete', OLD.id, OLD.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_paiements_fts_update AFTER UPDATE OF description ON paiements
+        BEGIN
+            INSERT INTO paiements_fts (paiements_fts, rowid, description) VALUES ('delete', OLD.id, OLD.description);
+            INSERT INTO paiements_fts (rowid, description) VALUES (NEW.id, NEW.description);
+        END
+        ''',
+        "INSERT INTO paiements_fts (paiements_fts) VALUES ('rebuild')",
+    ),
+    # 5 - Date de clôture des opérations et instantanés quotidiens du portefeuille
+    (
+        'ALTER TABLE operations ADD COLUMN date_cloture TEXT',
+        '''
+        UPDATE operations SET date_cloture = COALESCE(
+            (SELECT MAX(date_paiement) FROM paiements p WHERE p.operation_id = operations.id), date_creation)
+        WHERE statut = 'Terminé'
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_operations_cloture ON operations (date_cloture)',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_operations_cloture AFTER UPDATE OF statut ON operations
+        WHEN NEW.statut IS NOT OLD.statut
+        BEGIN
+            UPDATE operations
+            SET date_cloture = CASE WHEN NEW.statut = 'Terminé' THEN datetime('now', 'localtime') END
+            WHERE id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS snapshots_quotidiens (
+            jour TEXT PRIMARY KEY,
+            encours REAL NOT NULL,
+            encaisse_jour REAL NOT NULL,
+            encaisse_cumul REAL NOT NULL,
+            nouvelles_operations INTEGER NOT NULL,
+            montant_nouvelles_operations REAL NOT NULL,
+            nb_ouvertes INTEGER NOT NULL,
+            nb_terminees INTEGER NOT NULL,
+            montant_retard REAL,
+            date_calcul TEXT NOT NULL
+        )
+        ''',
+    ),
+    # 6 - Indicateur de retard des opérations, tenu à jour par le traitement de nuit
+    (
+        'ALTER TABLE operations ADD COLUMN en_retard INTEGER NOT NULL DEFAULT 0',
+        'CREATE INDEX IF NOT EXISTS idx_operations_retard ON operations (en_retard) WHERE en_retard = 1',
+    ),
+    # 7 - Date de dernière modification des opérations (rafraîchissement incrémental de la copie analytique)
+    (
+        'ALTER TABLE operations ADD COLUMN date_modification TEXT',
+        "UPDATE operations SET date_modification = datetime('now', 'localtime')",
+        'CREATE INDEX IF NOT EXISTS idx_operations_modification ON operations (date_modification)',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_operations_modification_insert AFTER INSERT ON operations
+        BEGIN
+            UPDATE operations SET date_modification = datetime('now', 'localtime') WHERE id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_operations_modification_update AFTER UPDATE ON operations
+        WHEN NEW.date_modification IS OLD.date_modification
+        BEGIN
+            UPDATE operations SET date_modification = datetime('now', 'localtime') WHERE id = NEW.id;
+        END
+        ''',
+    ),
+    # 8 - Date de clôture fournie dans l'UPDATE du statut conservée (paiements historiques importés)
+    (
+        'DROP TRIGGER IF EXISTS trg_operations_cloture',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_operations_cloture AFTER UPDATE OF statut ON operations
+        WHEN NEW.statut IS NOT OLD.statut
+         AND NOT (NEW.statut = 'Terminé' AND NEW.date_cloture IS NOT OLD.date_cloture)
+        BEGIN
+            UPDATE operations
+            SET date_cloture = CASE WHEN NEW.statut = 'Terminé' THEN datetime('now', 'localtime') END
+            WHERE id = NEW.id;
+        END
+        ''',
+    ),
+]
+
+# Bases déjà migrées par ce processus
+_bases_migrees = set()
+
+
+# Configuration de la base de données: applique une seule fois par processus les migrations manquantes
+def init_db():
+    chemin = DB_PATH
+    if chemin in _bases_migrees:
+        return
+
+    with _pool_lock, connexion() as conn:
+        if chemin in _bases_migrees:
+            return
+
+        # Verrou d'écriture pris avant de lire la version: deux processus ne migrent pas en même temps
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for instructions in MIGRATIONS[version:]:
+            for instruction in instructions:
+                conn.execute(instruction)
+        if version < len(MIGRATIONS):
+            conn.execute(f'PRAGMA user_version = {len(MIGRATIONS)}')
+        conn.commit()
+
+        _bases_migrees.add(chemin)
+
+
+# Version du schéma de la base courante
+def version_schema():
+    with connexion() as conn:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+# Requêtes des chemins chauds, contrôlées par verifier_plans_requetes()
+REQUETES_CRITIQUES = {
+    'paiements_operation': (
+        'SELECT * FROM paiements WHERE operation_id = ? ORDER BY date_paiement DESC', (1,)),
+    'total_paiements': ('SELECT total_paye FROM operations WHERE id = ?', (1,)),
+    'operations_client': ('SELECT COUNT(*) FROM operations WHERE client_id = ?', (1,)),
+    'operations_statut': (
+        "SELECT * FROM operations WHERE statut = 'En cours' ORDER BY date_creation DESC", ()),
+    'operations_soldes': ('SELECT * FROM v_operations_soldes ORDER BY date_creation DESC', ()),
+    'operations_page': (
+        "SELECT * FROM v_operations_soldes WHERE statut = ? ORDER BY date_creation DESC LIMIT 50 OFFSET 0",
+        ('En cours',)),
+    'clients_page': ('SELECT * FROM clients ORDER BY nom LIMIT 50 OFFSET 0', ()),
+    'recherche_operations': (
+        'SELECT * FROM v_operations_soldes WHERE id = ? '
+        'OR client_id IN (SELECT rowid FROM clients_fts WHERE clients_fts MATCH ?)', (1, '"a"*')),
+    'historique_client': (
+        'SELECT * FROM paiements WHERE client_id = ? ORDER BY date_paiement DESC', (1,)),
+    'historique_periode': (
+        "SELECT * FROM paiements WHERE date_paiement >= ? AND date_paiement < date(?, '+1 day')",
+        ('2024-01-01', '2024-12-31')),
+}
+
+
+# EXPLAIN QUERY PLAN des requêtes critiques: renvoie {nom: [étapes en parcours complet de table]}
+# (vide si toutes les requêtes passent par un index)
+def verifier_plans_requetes():
+    scans = {}
+    with connexion() as conn:
+        for nom, (sql, params) in REQUETES_CRITIQUES.items():
+            plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+            complets = [detail for _, _, _, detail in plan
+                        if detail.startswith('SCAN') and 'INDEX' not in detail]
+            if complets:
+                scans[nom] = complets
+    return scans
+
+
+# Ajouter un client - CORRIGÉ
+@ecriture
+@instrumentation.tracer
+def ajouter_client(nom, telephone, description):
+    date_creation = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    with connexion() as conn:
+        try:
+            conn.execute('''
+                INSERT INTO clients (nom, telephone, description, date_creation)
+                VALUES (?, ?, ?, ?)
+            ''', (nom, telephone, description, date_creation))
+
+            conn.commit()
+            success = True
+            message = "Client ajouté avec succès!"
+        except sqlite3.IntegrityError:
+            success = False
+            message = "Ce client existe déjà!"
+
+    return success, message
+
+
+# Modifier un client
+@ecriture
+@instrumentation.tracer
+def modifier_client(client_id, nom, telephone, description):
+    with connexion() as conn:
+        try:
+            conn.execute('''
+                UPDATE clients
+                SET nom = ?, telephone = ?, description = ?
+                WHERE id = ?
+            ''', (nom, telephone, description, client_id))
+
+            conn.commit()
+            success = True
+            message = "Client modifié avec succès!"
+        except sqlite3.IntegrityError:
+            success = False
+            message = "Ce nom existe déjà!"
+
+    return success, message
+
+
+# Supprimer un client
+@ecriture
+@instrumentation.tracer
+def supprimer_client(client_id):
+    with connexion() as conn:
+        cursor = conn.cursor()
+        try:
+            # Vérifier si le client a des opérations
+            cursor.execute('SELECT COUNT(*) FROM operations WHERE client_id = ?', (client_id,))
+            if cursor.fetchone()[0] > 0:
+                return False, "Impossible de supprimer: le client a des opérations en cours!"
+            if os.path.exists(chemin_archive()) and compter_operations_client_archivees(client_id) > 0:
+                return False, "Impossible de supprimer: le client a des opérations archivées!"
+
+            cursor.execute('DELETE FROM clients WHERE id = ?', (client_id,))
+            conn.commit()
+            success = True
+            message = "Client supprimé avec succès!"
+        except Exception as e:
+            success = False
+            message = f"Erreur lors de la suppression: {str(e)}"
+
+    return success, message
+
+
+# Nombre d'opérations archivées d'un client
+def compter_operations_client_archivees(client_id):
+    with connexion_archive() as conn:
+        return conn.execute('SELECT COUNT(*) FROM archive.operations WHERE client_id = ?', (client_id,)).fetchone()[0]
+
+
+# Obtenir les clients (tous, ou une page avec limite/offset)
+@instrumentation.tracer
+def get_clients(limite=None, offset=0):
+    sql = "SELECT * FROM clients ORDER BY nom"
+    params = []
+    if limite is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params = [int(limite), int(offset)]
+    with connexion() as conn:
+        return pd.read_sql_query(sql, conn, params=params)
+
+
+# Nombre total de clients
+@instrumentation.tracer
+def compter_clients():
+    with connexion() as conn:
+        return conn.execute("SELECT COUNT(*) FROM clients").fetchone()[0]
+
+
+# Créer une opération
+@ecriture
+@instrumentation.tracer
+def creer_operation(client_id, valeur_marchandise, taux_benefice, duree_mois):
+    # Calcul du montant total
+    montant_total = valeur_marchandise * (1 + taux_benefice * duree_mois)
+
+    date_creation = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Calcul de la prochaine échéance (1 mois après la création)
+    prochaine_echeance = (datetime.now() + timedelta(days=JOURS_PAR_ECHEANCE)).strftime("%Y-%m-%d")
+
+    with connexion() as conn:
+        cursor = conn.execute('''
+            INSERT INTO operations (client_id, valeur_marchandise, taux_benefice,
+                                  duree_mois, date_creation, montant_total, prochaine_echeance, reste_a_payer)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (client_id, valeur_marchandise, taux_benefice, duree_mois,
+              date_creation, montant_total, prochaine_echeance, montant_total))
+
+        operation_id = cursor.lastrowid
+        conn.commit()
+
+    return operation_id, montant_total
+
+
+# Obtenir les opérations avec total payé, reste à payer et prochain paiement
+# (toutes, ou filtrées par statut et paginées avec limite/offset; archivées comprises avec avec_archive)
+@instrumentation.tracer
+def get_operations(limite=None, offset=0, statut=None, avec_archive=False):
+    sql = "SELECT * FROM {vue}"
+    params = []
+    if statut is not None:
+        sql += " WHERE statut = ?"
+        params.append(statut)
+    sql += " ORDER BY date_creation DESC"
+    if limite is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([int(limite), int(offset)])
+    with connexion_lecture('v_operations_soldes', avec_archive) as (conn, vue):
+        return pd.read_sql_query(sql.format(vue=vue), conn, params=params)
+
+
+# Nombre d'opérations (éventuellement pour un statut)
+@instrumentation.tracer
+def compter_operations(statut=None, avec_archive=False):
+    with connexion_lecture('operations', avec_archive) as (conn, table):
+        if statut is None:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE statut = ?", (statut,)).fetchone()[0]
+
+
+# Montant total de toutes les opérations
+@instrumentation.tracer
+def total_montant_operations():
+    with connexion() as conn:
+        return conn.execute("SELECT COALESCE(SUM(montant_total), 0) FROM operations").fetchone()[0]
+
+
+# Modifier une opération
+@ecriture
+@instrumentation.tracer
+def modifier_operation(operation_id, valeur_marchandise, taux_benefice, duree_mois):
+    # Recalculer le montant total
+    montant_total = valeur_marchandise * (1 + taux_benefice * duree_mois)
+
+    with connexion() as conn:
+        conn.execute('''
+            UPDATE operations
+            SET valeur_marchandise = ?, taux_benefice = ?, duree_mois = ?, montant_total = ?,
+                reste_a_payer = ? - total_paye
+            WHERE id = ?
+        ''', (valeur_marchandise, taux_benefice, duree_mois, montant_total, montant_total, operation_id))
+        conn.commit()
+
+    return True, "Opération modifiée avec succès!"
+
+
+# Supprimer une opération
+@ecriture
+@instrumentation.tracer
+def supprimer_operation(operation_id):
+    with connexion() as conn:
+        try:
+            # Supprimer d'abord les paiements associés
+            conn.execute('DELETE FROM paiements WHERE operation_id = ?', (operation_id,))
+
+            # Puis supprimer l'opération
+            conn.execute('DELETE FROM operations WHERE id = ?', (operation_id,))
+
+            conn.commit()
+            success = True
+            message = "Opération supprimée avec succès!"
+        except Exception as e:
+            success = False
+            message = f"Erreur lors de la suppression: {str(e)}"
+
+    return success, message
+
+
+# Insérer un paiement dans la transaction ouverte de `conn`. Le trigger met à jour les soldes, puis
+# échéance (d'après les échéances couvertes par le total payé) et statut sont modifiés en une seule instruction
+def inserer_paiement(conn, operation_id, client_id, type_paiement, montant, description, date_paiement):
+    conn.execute('''
+        INSERT INTO paiements (operation_id, client_id, type_paiement, montant, date_paiement, description)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (operation_id, client_id, type_paiement, montant, date_paiement, description))
+    conn.execute(f'''
+        UPDATE operations
+        SET prochaine_echeance = COALESCE({SQL_PROCHAINE_ECHEANCE}, prochaine_echeance),
+            statut = CASE WHEN reste_a_payer < :tolerance THEN 'Terminé' ELSE statut END
+        WHERE id = :operation_id
+    ''', {'jours': JOURS_PAR_ECHEANCE, 'tolerance': TOLERANCE_SOLDE, 'operation_id': operation_id})
+
+
+# Écrivain groupé (ecriture_groupee) auquel enregistrer_paiement confie les paiements, s'il est démarré
+_ecrivain_paiements = None
+
+
+def utiliser_ecrivain(ecrivain):
+    global _ecrivain_paiements
+    _ecrivain_paiements = ecrivain
+
+
+# Enregistrer un paiement (par l'écrivain groupé s'il est démarré: attend que son lot soit validé)
+@ecriture
+@instrumentation.tracer
+def enregistrer_paiement(operation_id, client_id, type_paiement, montant, description=""):
+    date_paiement = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    ecrivain = _ecrivain_paiements
+    if ecrivain is not None:
+        return ecrivain.soumettre(operation_id, client_id, type_paiement, montant, description, date_paiement).result()
+
+    try:
+        transaction_immediate(lambda conn: inserer_paiement(conn, operation_id, client_id, type_paiement, montant,
+                                                            description, date_paiement))
+        success = True
+        message = "Paiement enregistré avec succès!"
+    except Exception as e:
+        success = False
+        message = f"Erreur lors de l'enregistrement: {str(e)}"
+
+    return success, message
+
+
+# Transformer une saisie libre en requête FTS5 par préfixes: "ali 22" -> "ali"* "22"*
+def requete_fts(texte):
+    return ' '.join(f'"{terme}"*' for terme in re.findall(r'\w+', texte))
+
+
+# Recherche plein texte des clients (nom, téléphone, description), meilleurs résultats d'abord
+@instrumentation.tracer
+def rechercher_clients(texte, limite=10):
+    requete = requete_fts(texte or "")
+    if not requete:
+        return get_clients(limite)
+    with connexion() as conn:
+        return pd.read_sql_query('''
+            SELECT c.*
+            FROM clients_fts f
+            JOIN clients c ON c.id = f.rowid
+            WHERE clients_fts MATCH ?
+            ORDER BY f.rank
+            LIMIT ?
+        ''', conn, params=(requete, int(limite)))
+
+
+# Recherche des opérations par client (plein texte) ou par numéro: opérations en cours d'abord
+@instrumentation.tracer
+def rechercher_operations(texte, limite=10):
+    texte = (texte or "").strip()
+    if not texte:
+        return get_operations(limite, statut='En cours')
+
+    numero = texte.lstrip('#')
+    operation_id = int(numero) if numero.isdigit() else -1
+    with connexion() as conn:
+        return pd.read_sql_query('''
+            SELECT *
+            FROM v_operations_soldes
+            WHERE id = ?
+               OR client_id IN (SELECT rowid FROM clients_fts WHERE clients_fts MATCH ?)
+            ORDER BY id = ? DESC, statut = 'En cours' DESC, date_creation DESC
+            LIMIT ?
+        ''', conn, params=(operation_id, requete_fts(texte) or '""', operation_id, int(limite)))
+
+
+# Insertion en masse de paiements dans la transaction ouverte de `conn` (import).
+# Les triggers ligne à ligne de paiements sont suspendus le temps de l'insertion et leurs effets
+# (soldes des opérations, index plein texte) appliqués ensuite en instructions ensemblistes:
+# toute évolution de ces triggers doit être reportée ici.
+@instrumentation.tracer
+def inserer_paiements_en_masse(conn, lignes):
+    dernier_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM paiements').fetchone()[0]
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'paiements'").fetchall()
+    for nom, _ in triggers:
+        conn.execute(f'DROP TRIGGER {nom}')
+
+    conn.executemany('''
+        INSERT INTO paiements (operation_id, client_id, type_paiement, montant, date_paiement, description)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', lignes)
+    conn.execute('''
+        UPDATE operations
+        SET total_paye = total_paye + nouveaux.total, reste_a_payer = reste_a_payer - nouveaux.total
+        FROM (
+            SELECT operation_id, SUM(montant) AS total
+            FROM paiements
+            WHERE id > ?
+            GROUP BY operation_id
+        ) AS nouveaux
+        WHERE operations.id = nouveaux.operation_id
+    ''', (dernier_id,))
+    conn.execute(
+        'INSERT INTO paiements_fts (rowid, description) SELECT id, description FROM paiements WHERE id > ?',
+        (dernier_id,))
+
+    for _, sql in triggers:
+        conn.execute(sql)
+
+
+# Obtenir les paiements d'une opération
+@instrumentation.tracer
+def get_paiements_operation(operation_id):
+    with connexion() as conn:
+        return pd.read_sql_query('''
+            SELECT p.*, c.nom as client_nom
+            FROM paiements p
+            JOIN clients c ON p.client_id = c.id
+            WHERE p.operation_id = ?
+            ORDER BY p.date_paiement DESC
+        ''', conn, params=(operation_id,))
+
+
+# Clause WHERE (sur l'alias p) et paramètres des filtres de l'historique des paiements
+def _filtres_historique(date_debut=None, date_fin=None, client_id=None, recherche=None):
+    conditions = []
+    params = []
+    if date_debut is not None:
+        conditions.append("p.date_paiement >= ?")
+        params.append(str(date_debut))
+    if date_fin is not None:
+        # Date de fin incluse: tout ce qui précède le lendemain
+        conditions.append("p.date_paiement < date(?, '+1 day')")
+        params.append(str(date_fin))
+    if client_id is not None:
+        conditions.append("p.client_id = ?")
+        params.append(int(client_id))
+    requete = requete_fts(recherche or "")
+    if requete:
+        conditions.append("p.id IN (SELECT rowid FROM paiements_fts WHERE paiements_fts MATCH ?)")
+        params.append(requete)
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+
+# Construire la requête d'historique des paiements (filtres optionnels) sur `table`: paiements, ou tous_paiements
+# avec l'archive (la recherche plein texte ne porte que sur les paiements non archivés)
+def _requete_historique(date_debut=None, date_fin=None, client_id=None, recherche=None, limite=None, offset=0,
+                        table='paiements'):
+    where, params = _filtres_historique(date_debut, date_fin, client_id, recherche)
+    sql = f'''
+        SELECT p.*, c.nom as client_nom
+        FROM {table} p
+        JOIN clients c ON p.client_id = c.id
+        {where}
+        ORDER BY p.operation_id DESC, p.date_paiement DESC
+    '''
+    if limite is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([int(limite), int(offset)])
+    return sql, params
+
+
+# Compter les paiements correspondant aux filtres de l'historique
+@instrumentation.tracer
+def compter_paiements(date_debut=None, date_fin=None, client_id=None, recherche=None, avec_archive=False):
+    with connexion_lecture('paiements', avec_archive) as (conn, table):
+        # Compte direct sur les paiements filtrés: ni jointure ni tri
+        where, params = _filtres_historique(date_debut, date_fin, client_id, recherche)
+        return conn.execute(f"SELECT COUNT(*) FROM {table} p {where}", params).fetchone()[0]
+
+
+# Parcourir l'historique des paiements déjà groupé par opération, en une seule requête
+# lue par blocs: produit des couples (operation_id, DataFrame des paiements)
+@instrumentation.tracer
+def iter_paiements_par_operation(date_debut=None, date_fin=None, client_id=None, recherche=None,
+                                 limite=None, offset=0, taille_bloc=1000, avec_archive=False):
+    with connexion_lecture('paiements', avec_archive) as (conn, table):
+        sql, params = _requete_historique(date_debut, date_fin, client_id, recherche, limite, offset, table)
+        en_attente = None
+        for bloc in pd.read_sql_query(sql, conn, params=params, chunksize=taille_bloc):
+            if en_attente is not None:
+                bloc = pd.concat([en_attente, bloc], ignore_index=True)
+            groupes = list(bloc.groupby('operation_id', sort=False))
+            # La dernière opération du bloc peut continuer dans le bloc suivant
+            for operation_id, paiements in groupes[:-1]:
+                yield int(operation_id), paiements
+            en_attente = groupes[-1][1] if groupes else None
+        if en_attente is not None:
+            yield int(en_attente['operation_id'].iloc[0]), en_attente
+
+
+# Obtenir le total des paiements pour une opération (solde tenu à jour sur operations)
+@instrumentation.tracer
+def get_total_paiements(operation_id):
+    with connexion() as conn:
+        result = conn.execute('SELECT total_paye FROM operations WHERE id = ?', (operation_id,)).fetchone()
+    return result[0] if result and result[0] else 0
+
+
+# Recalculer total_paye et reste_a_payer depuis paiements (écarts d'arrondi flottant sous TOLERANCE_SOLDE
+# ignorés); renvoie le nombre d'opérations corrigées
+@ecriture
+@instrumentation.tracer
+def reconcilier_soldes():
+    with connexion() as conn:
+        cursor = conn.execute('''
+            UPDATE operations
+            SET total_paye = totaux.total, reste_a_payer = operations.montant_total - totaux.total
+            FROM (
+                SELECT o.id, COALESCE(SUM(p.montant), 0) AS total
+                FROM operations o
+                LEFT JOIN paiements p ON p.operation_id = o.id
+                GROUP BY o.id
+            ) AS totaux
+            WHERE totaux.id = operations.id
+              AND (ABS(operations.total_paye - totaux.total) >= :tolerance
+                   OR ABS(operations.reste_a_payer - (operations.montant_total - totaux.total)) >= :tolerance)
+        ''', {'tolerance': TOLERANCE_SOLDE})
+        conn.commit()
+        return cursor.rowcount
+
+
+# Déplacer vers l'archive les opérations terminées depuis plus de `age_jours` jours et leurs paiements,
+# par lots de `taille_lot` opérations. Une transaction portant sur deux fichiers n'est atomique que fichier
+# par fichier (base en WAL): chaque lot est donc d'abord copié dans l'archive (transaction validée), puis
+# supprimé de la base dans une seconde transaction. Un lot interrompu entre les deux est recopié au passage
+# suivant (INSERT OR REPLACE). Renvoie (nombre d'opérations, nombre de paiements archivés)
+@ecriture
+@instrumentation.tracer
+def archiver(age_jours=ARCHIVE_AGE_JOURS, taille_lot=ARCHIVE_TAILLE_LOT):
+    limite = (datetime.now() - timedelta(days=age_jours)).strftime("%Y-%m-%d %H:%M:%S")
+    nb_operations = nb_paiements = 0
+
+    with connexion_archive() as conn:
+        colonnes = {table: ', '.join(c[0] for c in _colonnes(conn, 'main', table)) for table in TABLES_ARCHIVEES}
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS operations_a_archiver (id INTEGER PRIMARY KEY)')
+        selection = "IN (SELECT id FROM temp.operations_a_archiver)"
+
+        def copier_lot(conn):
+            conn.execute('DELETE FROM temp.operations_a_archiver')
+            conn.execute('''
+                INSERT INTO temp.operations_a_archiver
+                SELECT id FROM main.operations
+                WHERE statut = 'Terminé' AND date_cloture < ?
+                ORDER BY id LIMIT ?
+            ''', (limite, taille_lot))
+            conn.execute(f'''
+                INSERT OR REPLACE INTO archive.operations ({colonnes['operations']})
+                SELECT {colonnes['operations']} FROM main.operations WHERE id {selection}
+            ''')
+            conn.execute(f'''
+                INSERT OR REPLACE INTO archive.paiements ({colonnes['paiements']})
+                SELECT {colonnes['paiements']} FROM main.paiements WHERE operation_id {selection}
+            ''')
+
+        def supprimer_lot(conn):
+            # Opérations modifiées depuis la copie (paiement enregistré entre-temps): gardées dans la base,
+            # leur copie est retirée de l'archive et elles seront archivées à nouveau
+            modifiees = [ligne[0] for ligne in conn.execute(f'''
+                SELECT o.id FROM main.operations o JOIN archive.operations a ON a.id = o.id
+                WHERE o.id {selection} AND o.date_modification IS NOT a.date_modification
+                UNION
+                SELECT operation_id FROM main.paiements
+                WHERE operation_id {selection} AND id NOT IN (SELECT id FROM archive.paiements)
+            ''')]
+            if modifiees:
+                conn.executemany('DELETE FROM temp.operations_a_archiver WHERE id = ?', [(i,) for i in modifiees])
+                conn.executemany('DELETE FROM archive.paiements WHERE operation_id = ?', [(i,) for i in modifiees])
+                conn.executemany('DELETE FROM archive.operations WHERE id = ?', [(i,) for i in modifiees])
+            # Opérations supprimées avant leurs paiements: les triggers de solde n'ont alors rien à mettre à jour
+            operations = conn.execute(f'DELETE FROM main.operations WHERE id {selection}').rowcount
+            paiements = conn.execute(f'DELETE FROM main.paiements WHERE operation_id {selection}').rowcount
+            return operations, paiements
+
+        while True:
+            transaction_immediate(copier_lot, conn=conn)
+            if not conn.execute('SELECT COUNT(*) FROM temp.operations_a_archiver').fetchone()[0]:
+                break
+            operations, paiements = transaction_immediate(supprimer_lot, conn=conn)
+            nb_operations += operations
+            nb_paiements += paiements
+        conn.execute('DROP TABLE temp.operations_a_archiver')
+    return nb_operations, nb_paiements
+
+
+# Identifiants des opérations archivées (aucun sans base d'archive). Un identifiant explicite (import,
+# générateur) ne doit reprendre aucun d'eux: l'archivage suivant écraserait la copie archivée.
+def ids_operations_archivees():
+    if not os.path.exists(chemin_archive()):
+        return set()
+    conn = sqlite3.connect(chemin_archive(), timeout=BUSY_TIMEOUT_MS / 1000)
+    try:
+        return {ligne[0] for ligne in conn.execute('SELECT id FROM operations')}
+    except sqlite3.OperationalError:
+        # Base d'archive encore vide
+        return set()
+    finally:
+        conn.close()
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+import database
+import instrumentation
+
+# Une échéance tous les 30 jours à partir de la création, comme prochaine_echeance
+JOURS_PAR_ECHEANCE = database.JOURS_PAR_ECHEANCE
+
+# Tranches d'ancienneté des retards, en jours depuis l'échéance
+TRANCHES = ["0-30 j", "31-60 j", "61-90 j", "> 90 j"]
+_BORNES_TRANCHES = [-np.inf, 30, 60, 90, np.inf]
+
+
+# Échéancier complet de toutes les opérations en une passe vectorisée.
+# Une durée fractionnaire (ex. 2.5 mois) donne une dernière échéance partielle.
+# Les paiements (total_paye) sont imputés aux échéances les plus anciennes d'abord,
+# un paiement anticipé couvrant donc les échéances suivantes.
+@instrumentation.tracer
+def construire_echeancier(operations):
+    ops = operations[operations['duree_mois'] > 0]
+    duree = ops['duree_mois'].to_numpy(dtype=float)
+    montant_total = ops['montant_total'].to_numpy(dtype=float)
+    total_paye = ops['total_paye'].to_numpy(dtype=float)
+    creation = pd.to_datetime(ops['date_creation']).dt.normalize().to_numpy()
+
+    nb = np.ceil(duree).astype(int)
+    ligne = np.repeat(np.arange(len(ops)), nb)
+    # Rang de l'échéance dans son opération: 1..nb
+    rang = np.arange(nb.sum()) - np.repeat(np.cumsum(nb) - nb, nb) + 1
+
+    mensualite = (montant_total / duree)[ligne]
+    total = montant_total[ligne]
+    cumul_fin = np.minimum(rang * mensualite, total)
+    montant = cumul_fin - np.minimum((rang - 1) * mensualite, total)
+    montant_paye = np.clip(total_paye[ligne] - (cumul_fin - montant), 0, montant)
+    # Échéance couverte à l'arrondi des mensualités près, comme prochaine_echeance (database.SQL_PROCHAINE_ECHEANCE)
+    couverte = total_paye[ligne] + database.TOLERANCE_SOLDE + database.TOLERANCE_ECHEANCE * duree[ligne] >= cumul_fin
+
+    return pd.DataFrame({
+        'operation_id': ops['id'].to_numpy()[ligne],
+        'client_id': ops['client_id'].to_numpy()[ligne],
+        'rang': rang,
+        'date_echeance': creation[ligne] + pd.to_timedelta(rang * JOURS_PAR_ECHEANCE, unit='D'),
+        'montant': montant,
+        'montant_paye': montant_paye,
+        'reste': montant - montant_paye,
+        'couverte': couverte,
+    })
+
+
+# Comparer attendu et payé à la date de référence: jours de retard et tranche de chaque échéance impayée
+@instrumentation.tracer
+def analyser_echeancier(echeancier, date_reference=None):
+    date_reference = pd.Timestamp(date_reference or pd.Timestamp.now()).normalize()
+    jours = (date_reference - echeancier['date_echeance']).dt.days.to_numpy()
+    # En retard le lendemain de l'échéance, comme en_retard (prochaine_echeance < jour) du traitement de nuit
+    en_retard = (jours > 0) & ~echeancier['couverte'].to_numpy()
+
+    resultat = echeancier.assign(
+        jours_retard=np.where(en_retard, jours, 0),
+        montant_retard=np.where(en_retard, echeancier['reste'], 0.0),
+    )
+    resultat['tranche'] = pd.cut(pd.Series(jours, index=echeancier.index).where(en_retard),
+                                 _BORNES_TRANCHES, labels=TRANCHES)
+    return resultat
+
+
+# Retards par opération: montant échu impayé, retard le plus ancien et répartition par tranche
+def retards_par_operation(echeances):
+    retards = echeances[echeances['montant_retard'] > 0]
+    par_tranche = retards.pivot_table(index='operation_id', columns='tranche', values='montant_retard',
+                                      aggfunc='sum', fill_value=0.0, observed=False)
+    resume = retards.groupby('operation_id').agg(
+        client_id=('client_id', 'first'),
+        montant_retard=('montant_retard', 'sum'),
+        echeances_en_retard=('montant_retard', 'size'),
+        jours_retard=('jours_retard', 'max'),
+    )
+    return resume.join(par_tranche.reindex(columns=TRANCHES, fill_value=0.0)).reset_index()
+
+
+# Balance âgée du portefeuille: montant en retard par tranche, toutes opérations confondues
+def balance_agee(echeances):
+    retards = echeances[echeances['montant_retard'] > 0]
+    return retards.groupby('tranche', observed=False)['montant_retard'].sum().reindex(TRANCHES, fill_value=0.0)
+
+
+# Analyse des retards de toutes les opérations en cours, à la date de référence
+@instrumentation.tracer
+def analyser_portefeuille(date_reference=None):
+    operations = database.get_operations(statut='En cours')
+    echeances = analyser_echeancier(construire_echeancier(operations), date_reference)
+    retards = retards_par_operation(echeances)
+    retards = retards.merge(operations[['id', 'client_nom', 'telephone']],
+                            left_on='operation_id', right_on='id').drop(columns='id')
+    return retards.sort_values('jours_retard', ascending=False), balance_agee(echeances)
@@ -0,0 +1,117 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import database
+
+# Écriture groupée des paiements: les appels à enregistrer_paiement sont mis en file et un seul thread
+# les écrit par lots, une transaction (et une synchronisation disque) par lot au lieu d'une par paiement.
+# Activée au démarrage de l'application par VENTES_TERME_ECRITURE_GROUPEE=1.
+ACTIVE_PAR_DEFAUT = os.environ.get('VENTES_TERME_ECRITURE_GROUPEE', '') not in ('', '0')
+# Nombre maximal de paiements par lot, et attente maximale d'autres paiements après le premier d'un lot
+TAILLE_LOT = 200
+DELAI_MAX_MS = 5
+
+_FIN = object()
+
+
+class EcrivainGroupe:
+    def __init__(self, chemin=None, taille_lot=TAILLE_LOT, delai_max_ms=DELAI_MAX_MS):
+        self.chemin = chemin or database.DB_PATH
+        self.taille_lot = taille_lot
+        self.delai_max = delai_max_ms / 1000
+        self.file = queue.Queue()
+        self.thread = threading.Thread(target=self._boucle, name="ecrivain-paiements", daemon=True)
+        self.thread.start()
+
+    # Mettre un paiement en file; le Future reçoit (succès, message) une fois son lot validé sur disque
+    def soumettre(self, *paiement):
+        future = Future()
+        self.file.put((paiement, future))
+        return future
+
+    # Écrire les paiements restants puis arrêter le thread
+    def arreter(self):
+        self.file.put(_FIN)
+        self.thread.join()
+
+    def _lot_suivant(self):
+        premier = self.file.get()
+        if premier is _FIN:
+            return None, True
+        lot = [premier]
+        limite = time.monotonic() + self.delai_max
+        while len(lot) < self.taille_lot:
+            try:
+                element = self.file.get(timeout=max(0, limite - time.monotonic()))
+            except queue.Empty:
+                break
+            if element is _FIN:
+                return lot, True
+            lot.append(element)
+        return lot, False
+
+    def _boucle(self):
+        # Connexion dédiée, synchronisée sur disque à chaque validation: un paiement acquitté est durable
+        conn = database.ouvrir_connexion_dediee(self.chemin)
+        conn.execute("PRAGMA synchronous=FULL")
+        try:
+            fin = False
+            while not fin:
+                lot, fin = self._lot_suivant()
+                if lot:
+                    self._ecrire(conn, lot)
+        finally:
+            conn.close()
+
+    # Un lot = une transaction; chaque paiement dans son point de sauvegarde, pour qu'une erreur
+    # n'annule que ce paiement
+    def _ecrire(self, conn, lot):
+        def travail(conn):
+            resultats = []
+            for paiement, _ in lot:
+                conn.execute("SAVEPOINT paiement")
+                try:
+                    database.inserer_paiement(conn, *paiement)
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO paiement")
+                    resultats.append((False, f"Erreur lors de l'enregistrement: {str(e)}"))
+                else:
+                    resultats.append((True, "Paiement enregistré avec succès!"))
+                conn.execute("RELEASE paiement")
+            return resultats
+
+        try:
+            resultats = database.transaction_immediate(travail, conn=conn)
+        except Exception as e:
+            resultats = [(False, f"Erreur lors de l'enregistrement: {str(e)}")] * len(lot)
+        database.invalider_cache()
+        for (_, future), resultat in zip(lot, resultats):
+            future.set_result(resultat)
+
+
+_ecrivain = None
+_ecrivain_lock = threading.Lock()
+
+
+# Démarrer l'écrivain groupé du processus (sans effet s'il tourne déjà) et y router enregistrer_paiement
+def demarrer(taille_lot=TAILLE_LOT, delai_max_ms=DELAI_MAX_MS):
+    global _ecrivain
+    with _ecrivain_lock:
+        if _ecrivain is None:
+            _ecrivain = EcrivainGroupe(taille_lot=taille_lot, delai_max_ms=delai_max_ms)
+            database.utiliser_ecrivain(_ecrivain)
+        return _ecrivain
+
+
+# Revenir à l'écriture directe, après avoir écrit les paiements en file
+def arreter():
+    global _ecrivain
+    with _ecrivain_lock:
+        if _ecrivain is not None:
+            database.utiliser_ecrivain(None)
+            _ecrivain.arreter()
+            _ecrivain = None
@@ -0,0 +1,91 @@
+import os
+
+import pandas as pd
+
+import database
+import instrumentation
+
+# Nombre de lignes lues depuis SQLite et écrites par bloc
+TAILLE_BLOC = 50000
+
+FORMATS = ('csv', 'parquet')
+
+# Par table exportable: (table ou vue lue, requête sur {table}, colonne de date utilisée par les filtres)
+EXPORTS = {
+    'clients': ('clients', "SELECT * FROM {table} c", "c.date_creation"),
+    'operations': ('v_operations_soldes', "SELECT * FROM {table} o", "o.date_creation"),
+    'paiements': ('paiements', '''
+        SELECT p.*, c.nom AS client_nom
+        FROM {table} p
+        JOIN clients c ON p.client_id = c.id
+    ''', "p.date_paiement"),
+}
+
+
+# Lire une table par blocs de `taille_bloc` lignes (curseur SQLite, jamais la table entière en mémoire),
+# archive comprise avec avec_archive
+def iter_blocs(table, date_debut=None, date_fin=None, taille_bloc=TAILLE_BLOC, avec_archive=False):
+    source, sql, colonne_date = EXPORTS[table]
+    conditions = []
+    params = []
+    if date_debut is not None:
+        conditions.append(f"{colonne_date} >= ?")
+        params.append(str(date_debut))
+    if date_fin is not None:
+        conditions.append(f"{colonne_date} < date(?, '+1 day')")
+        params.append(str(date_fin))
+    if conditions:
+        sql += f" WHERE {' AND '.join(conditions)}"
+    sql += " ORDER BY id"
+
+    with database.connexion_lecture(source, avec_archive) as (conn, table_lue):
+        yield from pd.read_sql_query(sql.format(table=table_lue), conn, params=params, chunksize=taille_bloc)
+
+
+def _exporter_csv(blocs, destination):
+    nb_lignes = 0
+    for i, bloc in enumerate(blocs):
+        bloc.to_csv(destination, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        nb_lignes += len(bloc)
+    return nb_lignes
+
+
+# Parquet écrit bloc par bloc (un row group par bloc) avec le schéma du premier bloc
+def _exporter_parquet(blocs, destination):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    nb_lignes = 0
+    schema = None
+    writer = None
+    try:
+        for bloc in blocs:
+            table = pa.Table.from_pandas(bloc, preserve_index=False)
+            if schema is None:
+                # Colonne entièrement vide dans le premier bloc: typée texte (seules les colonnes TEXT sont nullables)
+                schema = pa.schema([champ.with_type(pa.string()) if pa.types.is_null(champ.type) else champ
+                                    for champ in table.schema])
+                writer = pq.ParquetWriter(destination, schema)
+            writer.write_table(table.cast(schema))
+            nb_lignes += len(bloc)
+    finally:
+        if writer is not None:
+            writer.close()
+    return nb_lignes
+
+
+# Exporter clients, opérations (avec soldes) ou paiements vers un fichier CSV ou Parquet;
+# renvoie le nombre de lignes écrites
+@instrumentation.tracer
+def exporter(table, destination, format=None, date_debut=None, date_fin=None, taille_bloc=TAILLE_BLOC,
+             avec_archive=False):
+    if table not in EXPORTS:
+        raise ValueError(f"Table inconnue: {table}")
+    format = format or os.path.splitext(str(destination))[1].lstrip('.').lower()
+    if format not in FORMATS:
+        raise ValueError(f"Format inconnu: {format}")
+
+    blocs = iter_blocs(table, date_debut, date_fin, taille_bloc, avec_archive)
+    if format == 'csv':
+        return _exporter_csv(blocs, destination)
+    return _exporter_parquet(blocs, destination)
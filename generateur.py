@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+import database
+
+# Tailles prédéfinies: nombre approximatif de paiements générés
+TAILLES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+
+# Proportions du registre généré: environ 6 paiements par opération, 10 opérations par client
+PAIEMENTS_PAR_OPERATION = 6
+OPERATIONS_PAR_CLIENT = 10
+# Ancienneté maximale des opérations générées
+JOURS_HISTORIQUE = 3 * 365
+
+DUREES = np.array([3, 6, 9, 12])
+TAUX = np.array([0.05, 0.07, 0.08, 0.10])
+MODES_PAIEMENT = np.array(["Espèces", "Virement", "Mobile money", "Chèque"])
+
+
+def _format_date(dates, format):
+    return pd.DatetimeIndex(dates).strftime(format).to_numpy()
+
+
+# Clients, opérations et paiements tirés d'un générateur aléatoire initialisé par `graine`:
+# une même taille et une même graine donnent toujours le même registre (à la date du jour près)
+def _tirer_registre(taille, graine, premier_client, premiere_operation):
+    rng = np.random.default_rng(graine)
+    nb_operations = max(1, taille // PAIEMENTS_PAR_OPERATION)
+    nb_clients = max(1, nb_operations // OPERATIONS_PAR_CLIENT)
+    aujourd_hui = pd.Timestamp.now().normalize()
+
+    client_ids = np.arange(premier_client, premier_client + nb_clients)
+    clients = pd.DataFrame({
+        'id': client_ids,
+        'nom': [f"Client {i:07d}" for i in client_ids],
+        'telephone': [f"+222 {n:08d}" for n in rng.integers(20_000_000, 49_999_999, nb_clients)],
+        'description': rng.choice(["Commerçant", "Fonctionnaire", "Éleveur", "Artisan", None], nb_clients),
+        'date_creation': _format_date(aujourd_hui - pd.to_timedelta(
+            rng.integers(JOURS_HISTORIQUE, JOURS_HISTORIQUE + 365, nb_clients), unit='D'), "%Y-%m-%d %H:%M:%S"),
+    })
+
+    duree = rng.choice(DUREES, nb_operations)
+    taux = rng.choice(TAUX, nb_operations)
+    valeur = np.round(rng.lognormal(11, 0.8, nb_operations), -3) + 1000
+    montant_total = valeur * (1 + taux * duree)
+    creation = aujourd_hui - pd.to_timedelta(rng.integers(0, JOURS_HISTORIQUE, nb_operations), unit='D') \
+        + pd.to_timedelta(rng.integers(8 * 3600, 18 * 3600, nb_operations), unit='s')
+
+    # Échéances déjà passées, dont une partie reste impayée (retards)
+    echues = np.minimum((aujourd_hui - creation).days.to_numpy() // 30, duree)
+    nb_paiements = np.maximum(echues - rng.choice([0, 0, 0, 1, 2], nb_operations), 0)
+    ligne = np.repeat(np.arange(nb_operations), nb_paiements)
+    rang = np.arange(nb_paiements.sum()) - np.repeat(np.cumsum(nb_paiements) - nb_paiements, nb_paiements) + 1
+    date_paiement = creation[ligne] + pd.to_timedelta(rang * 30 + rng.integers(-5, 10, len(ligne)), unit='D')
+    date_paiement = np.minimum(date_paiement, pd.Timestamp.now())
+    anticipe = rng.random(len(ligne)) < 0.05
+
+    operation_ids = np.arange(premiere_operation, premiere_operation + nb_operations)
+    operation_client = rng.choice(client_ids, nb_operations)
+    operations = pd.DataFrame({
+        'id': operation_ids,
+        'client_id': operation_client,
+        'valeur_marchandise': valeur,
+        'taux_benefice': taux,
+        'duree_mois': duree,
+        'date_creation': _format_date(creation, "%Y-%m-%d %H:%M:%S"),
+        'statut': 'En cours',
+        'montant_total': montant_total,
+        # Comme enregistrer_paiement(): première échéance non couverte, un paiement couvrant une échéance
+        'prochaine_echeance': _format_date(
+            creation + pd.to_timedelta(30 * (1 + np.minimum(nb_paiements, np.ceil(duree) - 1)), unit='D'), "%Y-%m-%d"),
+        'reste_a_payer': montant_total,
+    })
+
+    paiements = pd.DataFrame({
+        'operation_id': operation_ids[ligne],
+        'client_id': operation_client[ligne],
+        'type_paiement': np.where(anticipe, "Anticipé", "Ordinaire"),
+        'montant': (montant_total / duree)[ligne],
+        'date_paiement': _format_date(date_paiement, "%Y-%m-%d %H:%M:%S"),
+        'description': rng.choice(MODES_PAIEMENT, len(ligne)).astype(object)
+                       + " réf " + rng.integers(100_000, 999_999, len(ligne)).astype(str),
+    }).sort_values('date_paiement', kind='stable')
+    return clients, operations, paiements
+
+
+# Remplir la base avec un registre synthétique déterministe d'environ `taille` paiements,
+# ajouté aux données existantes. Renvoie (nb clients, nb opérations, nb paiements)
+@database.ecriture
+def generer(taille, graine=42):
+    with database.connexion() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        premier_client = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM clients").fetchone()[0]
+        # Après le plus grand identifiant jamais attribué (sqlite_sequence), archivées comprises
+        premiere_operation = conn.execute('''
+            SELECT MAX(COALESCE((SELECT MAX(id) FROM operations), 0),
+                       COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'operations'), 0)) + 1
+        ''').fetchone()[0]
+        clients, operations, paiements = _tirer_registre(taille, graine, premier_client, premiere_operation)
+
+        conn.executemany('''
+            INSERT INTO clients (id, nom, telephone, description, date_creation)
+            VALUES (?, ?, ?, ?, ?)
+        ''', clients.astype(object).where(clients.notna(), None).itertuples(index=False, name=None))
+        conn.executemany('''
+            INSERT INTO operations (id, client_id, valeur_marchandise, taux_benefice, duree_mois, date_creation,
+                                    statut, montant_total, prochaine_echeance, reste_a_payer)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', operations.astype(object).itertuples(index=False, name=None))
+        database.inserer_paiements_en_masse(conn, paiements.astype(object).itertuples(index=False, name=None))
+
+        # Opérations soldées: terminées à la date de leur dernier paiement
+        conn.execute('''
+            UPDATE operations SET statut = 'Terminé'
+            WHERE id >= ? AND reste_a_payer < ?
+        ''', (premiere_operation, database.TOLERANCE_SOLDE))
+        conn.execute('''
+            UPDATE operations
+            SET date_cloture = (SELECT MAX(date_paiement) FROM paiements p WHERE p.operation_id = operations.id)
+            WHERE id >= ? AND statut = 'Terminé'
+        ''', (premiere_operation,))
+        conn.commit()
+    return len(clients), len(operations), len(paiements)
+
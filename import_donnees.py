@@ -0,0 +1,252 @@
+import os
+from datetime import datetime
+
+import pandas as pd
+
+import database
+import instrumentation
+
+# Nombre de lignes validées et insérées par transaction
+TAILLE_LOT = 50000
+
+TYPES_PAIEMENT = ("Ordinaire", "Anticipé")
+
+# Colonnes attendues par type d'import (les taux sont des fractions: 0.08 pour 8%)
+COLONNES = {
+    'clients': {
+        'obligatoires': ['nom'],
+        'optionnelles': ['telephone', 'description', 'date_creation'],
+    },
+    'operations': {
+        'obligatoires': ['client', 'valeur_marchandise', 'taux_benefice', 'duree_mois'],
+        'optionnelles': ['id', 'date_creation', 'statut'],
+    },
+    'paiements': {
+        'obligatoires': ['operation_id', 'montant'],
+        'optionnelles': ['type_paiement', 'date_paiement', 'description'],
+    },
+}
+
+
+# Lire un fichier CSV ou Excel par lots de `taille_lot` lignes
+def lire_fichier(fichier, nom=None, taille_lot=TAILLE_LOT):
+    nom = nom or getattr(fichier, 'name', str(fichier))
+    extension = os.path.splitext(nom)[1].lower()
+    if extension in ('.xlsx', '.xls'):
+        df = pd.read_excel(fichier, dtype=str)
+        for debut in range(0, len(df), taille_lot):
+            yield df.iloc[debut:debut + taille_lot]
+    else:
+        yield from pd.read_csv(fichier, dtype=str, chunksize=taille_lot, skipinitialspace=True)
+
+
+# Marquer en erreur les lignes où `masque` est vrai (sans écraser une erreur déjà relevée)
+def _signaler(erreurs, masque, message):
+    erreurs[masque & erreurs.isna()] = message
+
+
+def _texte(lot, colonne):
+    if colonne not in lot:
+        return pd.Series(None, index=lot.index, dtype=object)
+    serie = lot[colonne].str.strip()
+    return serie.where(serie != "")
+
+
+def _nombre(lot, colonne, erreurs, minimum=0):
+    valeurs = pd.to_numeric(lot[colonne], errors='coerce')
+    _signaler(erreurs, valeurs.isna(), f"{colonne} invalide")
+    _signaler(erreurs, valeurs < minimum, f"{colonne} négatif")
+    return valeurs
+
+
+# Identifiants entiers: une valeur présente mais non entière (abc, 10.5) est invalide
+def _identifiant(lot, colonne, erreurs):
+    valeurs = pd.to_numeric(lot[colonne], errors='coerce')
+    _signaler(erreurs, lot[colonne].notna() & (valeurs.isna() | (valeurs % 1 != 0)), f"{colonne} invalide")
+    return valeurs.where(valeurs % 1 == 0)
+
+
+# Dates ISO (2024-01-31) ou au format jour/mois/année (31/01/2024)
+def _date(lot, colonne, erreurs, format_sortie, defaut):
+    texte = _texte(lot, colonne)
+    dates = pd.to_datetime(texte, errors='coerce', format='ISO8601')
+    autres = texte.notna() & dates.isna()
+    if autres.any():
+        dates[autres] = pd.to_datetime(texte[autres], errors='coerce', format='%d/%m/%Y')
+    _signaler(erreurs, texte.notna() & dates.isna(), f"{colonne} invalide")
+    return dates.dt.strftime(format_sortie).where(dates.notna(), defaut)
+
+
+# Validation vectorisée d'un lot de clients: renvoie les lignes valides, les erreurs sont notées dans `erreurs`
+def _preparer_clients(lot, erreurs, conn, vus):
+    nom = _texte(lot, 'nom')
+    _signaler(erreurs, nom.isna(), "nom manquant")
+
+    existants = set(r[0] for r in conn.execute("SELECT nom FROM clients"))
+    _signaler(erreurs, nom.isin(existants), "client déjà existant")
+    _signaler(erreurs, nom.isin(vus) | nom.duplicated(keep='first'), "client en double dans le fichier")
+    vus.update(nom.dropna())
+
+    maintenant = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    lignes = pd.DataFrame({
+        'nom': nom,
+        'telephone': _texte(lot, 'telephone'),
+        'description': _texte(lot, 'description'),
+        'date_creation': _date(lot, 'date_creation', erreurs, "%Y-%m-%d %H:%M:%S", maintenant),
+    })
+    return lignes[erreurs.isna()]
+
+
+def _inserer_clients(conn, lignes):
+    conn.executemany('''
+        INSERT INTO clients (nom, telephone, description, date_creation)
+        VALUES (?, ?, ?, ?)
+    ''', lignes)
+
+
+# Validation vectorisée d'un lot d'opérations: noms de clients résolus en une requête
+def _preparer_operations(lot, erreurs, conn, vus):
+    clients = dict(conn.execute("SELECT nom, id FROM clients").fetchall())
+    client = _texte(lot, 'client')
+    _signaler(erreurs, client.isna(), "client manquant")
+    client_id = client.map(clients)
+    _signaler(erreurs, client_id.isna(), "client inconnu")
+
+    valeur = _nombre(lot, 'valeur_marchandise', erreurs)
+    taux = _nombre(lot, 'taux_benefice', erreurs)
+    duree = _nombre(lot, 'duree_mois', erreurs)
+    _signaler(erreurs, duree == 0, "duree_mois nulle")
+
+    if 'id' in lot:
+        operation_id = _identifiant(lot, 'id', erreurs)
+        # Identifiants déjà pris, y compris par les opérations archivées
+        existants = set(r[0] for r in conn.execute("SELECT id FROM operations")) | database.ids_operations_archivees()
+        _signaler(erreurs, operation_id.isin(existants), "opération déjà existante")
+        _signaler(erreurs, operation_id.notna() & (operation_id.isin(vus) | operation_id.duplicated()),
+                  "id en double dans le fichier")
+        vus.update(operation_id.dropna())
+    else:
+        operation_id = pd.Series(None, index=lot.index, dtype=float)
+
+    statut = _texte(lot, 'statut').fillna('En cours')
+    _signaler(erreurs, ~statut.isin(['En cours', 'Terminé']), "statut invalide")
+
+    maintenant = datetime.now()
+    date_creation = _date(lot, 'date_creation', erreurs, "%Y-%m-%d %H:%M:%S", maintenant.strftime("%Y-%m-%d %H:%M:%S"))
+    # Première échéance: 30 jours après la création, comme creer_operation()
+    prochaine_echeance = (pd.to_datetime(date_creation)
+                          + pd.Timedelta(days=database.JOURS_PAR_ECHEANCE)).dt.strftime("%Y-%m-%d")
+    montant_total = valeur * (1 + taux * duree)
+
+    lignes = pd.DataFrame({
+        'id': operation_id,
+        'client_id': client_id,
+        'valeur_marchandise': valeur,
+        'taux_benefice': taux,
+        'duree_mois': duree,
+        'date_creation': date_creation,
+        'statut': statut,
+        'montant_total': montant_total,
+        'prochaine_echeance': prochaine_echeance,
+        'reste_a_payer': montant_total,
+        # Date de clôture inconnue pour une opération importée déjà terminée: sa date de création
+        'date_cloture': date_creation.where(statut == 'Terminé'),
+    })
+    return lignes[erreurs.isna()].astype({'id': 'Int64'})
+
+
+def _inserer_operations(conn, lignes):
+    conn.executemany('''
+        INSERT INTO operations (id, client_id, valeur_marchandise, taux_benefice, duree_mois, date_creation,
+                                statut, montant_total, prochaine_echeance, reste_a_payer, date_cloture)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', lignes)
+
+
+# Validation vectorisée d'un lot de paiements: client de chaque opération résolu en une requête
+def _preparer_paiements(lot, erreurs, conn, vus):
+    operations = pd.Series(dict(conn.execute("SELECT id, client_id FROM operations").fetchall()), dtype=object)
+    operation_id = _identifiant(lot, 'operation_id', erreurs)
+    _signaler(erreurs, operation_id.isna(), "operation_id invalide")
+    client_id = operation_id.map(operations)
+    _signaler(erreurs, client_id.isna(), "opération inconnue")
+
+    montant = _nombre(lot, 'montant', erreurs)
+    _signaler(erreurs, montant == 0, "montant nul")
+
+    type_paiement = _texte(lot, 'type_paiement').fillna('Ordinaire')
+    _signaler(erreurs, ~type_paiement.isin(TYPES_PAIEMENT), "type_paiement invalide")
+
+    maintenant = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    lignes = pd.DataFrame({
+        'operation_id': operation_id,
+        'client_id': client_id,
+        'type_paiement': type_paiement,
+        'montant': montant,
+        'date_paiement': _date(lot, 'date_paiement', erreurs, "%Y-%m-%d %H:%M:%S", maintenant),
+        'description': _texte(lot, 'description'),
+    })
+    return lignes[erreurs.isna()].astype({'operation_id': 'Int64'})
+
+
+# Effets des paiements importés sur les opérations, en une instruction ensembliste:
+# échéance d'après les échéances couvertes par le total payé, statut Terminé une fois soldée,
+# clôturée à la date du dernier paiement
+def _appliquer_paiements(conn, paiements):
+    conn.executemany(f'''
+        UPDATE operations
+        SET prochaine_echeance = COALESCE({database.SQL_PROCHAINE_ECHEANCE}, prochaine_echeance),
+            statut = CASE WHEN reste_a_payer < :tolerance THEN 'Terminé' ELSE statut END,
+            date_cloture = CASE WHEN reste_a_payer < :tolerance AND statut != 'Terminé'
+                THEN (SELECT MAX(date_paiement) FROM paiements WHERE operation_id = :operation_id)
+                ELSE date_cloture END
+        WHERE id = :operation_id
+    ''', [{'jours': database.JOURS_PAR_ECHEANCE, 'tolerance': database.TOLERANCE_SOLDE, 'operation_id': int(op_id)}
+          for op_id in paiements['operation_id'].unique()])
+
+
+# Par type d'import: (validation d'un lot, insertion des lignes valides)
+PREPARATEURS = {
+    'clients': (_preparer_clients, _inserer_clients),
+    'operations': (_preparer_operations, _inserer_operations),
+    'paiements': (_preparer_paiements, database.inserer_paiements_en_masse),
+}
+
+
+# Importer un fichier CSV/Excel de clients, d'opérations ou de paiements.
+# Chaque lot est validé en bloc puis inséré par executemany dans sa propre transaction.
+# Renvoie (nombre de lignes importées, DataFrame des erreurs: ligne, erreur)
+@database.ecriture
+@instrumentation.tracer
+def importer(type_import, fichier, nom=None, taille_lot=TAILLE_LOT):
+    if type_import not in PREPARATEURS:
+        raise ValueError(f"Type d'import inconnu: {type_import}")
+    colonnes = COLONNES[type_import]
+    preparer, inserer = PREPARATEURS[type_import]
+
+    importees = 0
+    erreurs_lots = []
+    vus = set()
+    for lot in lire_fichier(fichier, nom, taille_lot):
+        lot.columns = [str(c).strip().lower() for c in lot.columns]
+        manquantes = [c for c in colonnes['obligatoires'] if c not in lot]
+        if manquantes:
+            raise ValueError(f"Colonnes manquantes: {', '.join(manquantes)}")
+
+        erreurs = pd.Series(None, index=lot.index, dtype=object)
+        with database.connexion() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            lignes = preparer(lot, erreurs, conn, vus)
+            lignes = lignes.astype(object).where(lignes.notna(), None)
+            inserer(conn, lignes.itertuples(index=False, name=None))
+            if type_import == 'paiements':
+                _appliquer_paiements(conn, lignes)
+            conn.commit()
+
+        importees += len(lignes)
+        en_erreur = erreurs.dropna()
+        # Numéro de ligne dans le fichier (ligne 1 = en-tête)
+        erreurs_lots.append(pd.DataFrame({'ligne': en_erreur.index + 2, 'erreur': en_erreur.values}))
+
+    rapport = pd.concat(erreurs_lots, ignore_index=True) if erreurs_lots else pd.DataFrame(columns=['ligne', 'erreur'])
+    return importees, rapport
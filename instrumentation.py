@@ -0,0 +1,149 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# Instrumentation des accès aux données et du rendu des pages.
+# Activée pour tout le processus par VENTES_TERME_TRACE=1, ou pour le thread courant (une session
+# Streamlit) par activer(); désactivée, chaque appel instrumenté ne coûte qu'un test de booléen.
+ACTIF_PAR_DEFAUT = os.environ.get('VENTES_TERME_TRACE', '') not in ('', '0')
+# Journal JSON lines: une ligne par exécution instrumentée (vide: pas de journal)
+JOURNAL = os.environ.get('VENTES_TERME_JOURNAL', 'instrumentation.jsonl')
+# Instructions SQL conservées par appel (executemany en trace une par ligne); les suivantes sont seulement comptées
+MAX_SQL_PAR_APPEL = 20
+
+_etat = threading.local()
+_journal_lock = threading.Lock()
+
+
+def est_actif():
+    return getattr(_etat, 'actif', ACTIF_PAR_DEFAUT)
+
+
+def activer(actif=True):
+    _etat.actif = actif
+
+
+# Commencer une exécution instrumentée (un passage du script Streamlit, une commande)
+def demarrer(contexte=None):
+    _etat.contexte = contexte
+    _etat.evenements = []
+    _etat.pile = []
+    _etat.section = None
+
+
+def _ajouter(evenement):
+    if not hasattr(_etat, 'evenements'):
+        demarrer()
+    _etat.evenements.append(evenement)
+
+
+def _nb_lignes(resultat):
+    if hasattr(resultat, '__len__') and not isinstance(resultat, (str, tuple, dict)):
+        return len(resultat)
+    return None
+
+
+# Rappel de sqlite3.Connection.set_trace_callback: chaque instruction exécutée est rattachée
+# à l'appel instrumenté en cours
+def tracer_sql(instruction):
+    pile = getattr(_etat, 'pile', None)
+    if pile:
+        appel = pile[-1]
+        appel['nb_sql'] += 1
+        if len(appel['sql']) < MAX_SQL_PAR_APPEL:
+            appel['sql'].append(' '.join(instruction.split()))
+
+
+# Rappel de trace à installer sur une connexion au moment de l'utiliser (None si inactif)
+def rappel_sql():
+    return tracer_sql if est_actif() else None
+
+
+def _debut_appel(fonction):
+    appel = {'type': 'requete', 'nom': fonction.__qualname__, 'profondeur': len(getattr(_etat, 'pile', [])),
+             'sql': [], 'nb_sql': 0, 'debut': time.perf_counter()}
+    if not hasattr(_etat, 'pile'):
+        demarrer()
+    _etat.pile.append(appel)
+    return appel
+
+
+def _fin_appel(appel, lignes, erreur=None):
+    _etat.pile.pop()
+    appel['duree_ms'] = round((time.perf_counter() - appel.pop('debut')) * 1000, 3)
+    appel['lignes'] = lignes
+    if erreur is not None:
+        appel['erreur'] = repr(erreur)
+    _ajouter(appel)
+
+
+# Décorateur des fonctions d'accès aux données: durée, nombre de lignes renvoyées et instructions SQL
+# exécutées par l'appel. Les générateurs sont mesurés sur toute leur itération.
+def tracer(fonction):
+    if inspect.isgeneratorfunction(fonction):
+        @functools.wraps(fonction)
+        def generateur(*args, **kwargs):
+            if not est_actif():
+                yield from fonction(*args, **kwargs)
+                return
+            appel = _debut_appel(fonction)
+            nb = 0
+            try:
+                for element in fonction(*args, **kwargs):
+                    nb += _nb_lignes(element[1] if isinstance(element, tuple) else element) or 1
+                    yield element
+            except Exception as e:
+                _fin_appel(appel, nb, e)
+                raise
+            _fin_appel(appel, nb)
+        return generateur
+
+    @functools.wraps(fonction)
+    def enveloppe(*args, **kwargs):
+        if not est_actif():
+            return fonction(*args, **kwargs)
+        appel = _debut_appel(fonction)
+        try:
+            resultat = fonction(*args, **kwargs)
+        except Exception as e:
+            _fin_appel(appel, None, e)
+            raise
+        _fin_appel(appel, _nb_lignes(resultat))
+        return resultat
+    return enveloppe
+
+
+def _fermer_section():
+    section = getattr(_etat, 'section', None)
+    if section is not None:
+        section['duree_ms'] = round((time.perf_counter() - section.pop('debut')) * 1000, 3)
+        _ajouter(section)
+        _etat.section = None
+
+
+# Marquer le début d'une section de page; la section précédente se termine ici
+def section(nom):
+    if not est_actif():
+        return
+    _fermer_section()
+    _etat.section = {'type': 'section', 'nom': nom, 'debut': time.perf_counter()}
+
+
+# Terminer l'exécution: ferme la dernière section, écrit le journal et renvoie les événements
+def terminer():
+    if not est_actif():
+        return []
+    _fermer_section()
+    evenements = getattr(_etat, 'evenements', [])
+    if JOURNAL and evenements:
+        ligne = json.dumps({'date': datetime.now().isoformat(timespec='milliseconds'),
+                            'contexte': getattr(_etat, 'contexte', None), 'evenements': evenements},
+                           ensure_ascii=False)
+        with _journal_lock, open(JOURNAL, 'a', encoding='utf-8') as journal:
+            journal.write(ligne + '\n')
+    demarrer(getattr(_etat, 'contexte', None))
+    return evenements
@@ -0,0 +1,265 @@
+import functools
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import analytique
+import database
+import echeancier
+import instrumentation
+
+# Prévision des encaissements mensuels par segment (durée des contrats). Un modèle par segment, entraîné
+# sur l'historique mensuel des paiements avec pour variable explicative le montant dû selon les échéanciers
+# contractuels, prévoit les mois à venir à partir des échéances restantes des opérations en cours.
+# Prophet est utilisé s'il est installé, sinon une régression linéaire sur le dû et la tendance.
+HORIZON_MOIS = 12
+# Nouveaux paiements d'un segment à partir desquels son modèle est réajusté
+SEUIL_REAJUSTEMENT = 500
+# Temps accordé aux ajustements en parallèle; un segment non ajusté à temps est prévu par régression linéaire
+BUDGET_S = 10
+# Mois complets d'historique nécessaires pour estimer une tendance; en dessous, prévision = dû x taux encaissé
+MIN_MOIS = 6
+# Intervalle de prévision à 80 %
+Z_INTERVALLE = 1.2816
+# Format du fichier de cache des modèles
+VERSION_CACHE = 1
+COLONNES = ['mois', 'segment', 'attendu', 'prevision', 'prevision_basse', 'prevision_haute']
+
+_cache = {}
+_verrou = threading.Lock()
+
+
+def chemin_cache():
+    return os.path.splitext(database.DB_PATH)[0] + '_previsions.pkl'
+
+
+# Classe Prophet si le paquet est installé (import coûteux, fait au premier ajustement seulement)
+@functools.cache
+def _prophet():
+    # Graphiques Prophet inutilisés: pas d'erreur journalisée à l'import si plotly est absent
+    logging.getLogger('prophet.plot').setLevel(logging.CRITICAL)
+    try:
+        from prophet import Prophet
+    except ImportError:
+        return None
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    return Prophet
+
+
+def moteur():
+    return 'prophet' if _prophet() is not None else 'lineaire'
+
+
+def _ordinaux(mois):
+    return pd.PeriodIndex(mois, freq='M').asi8
+
+
+def _operations(copie, condition=None):
+    operations = copie['operations']
+    if condition is not None:
+        operations = operations.filter(condition)
+    return operations.select(['id', 'client_id', 'duree_mois', 'montant_total', 'total_paye',
+                              'date_creation']).to_pandas()
+
+
+# Échéances des opérations, avec leur segment et leur mois
+def _echeances(operations):
+    echeances = echeancier.construire_echeancier(operations)
+    echeances['segment'] = operations.set_index('id')['duree_mois'].reindex(echeances['operation_id']).to_numpy()
+    echeances['mois'] = echeances['date_echeance'].dt.to_period('M')
+    return echeances
+
+
+# Encaissé et nombre de paiements par segment et par mois, jusqu'au mois précédent (agrégation en colonnes)
+def _encaisse(copie, mois_courant):
+    paiements = copie['paiements']
+    encaisse = (pa.table({'operation_id': paiements['operation_id'],
+                          'mois': pc.utf8_slice_codeunits(paiements['date_paiement'], 0, 7),
+                          'montant': paiements['montant']})
+                .join(copie['operations'].select(['id', 'duree_mois']).rename_columns(['operation_id', 'segment']),
+                      'operation_id')
+                .group_by(['segment', 'mois']).aggregate([('montant', 'sum'), ('montant', 'count')])
+                .to_pandas()
+                .rename(columns={'montant_sum': 'encaisse', 'montant_count': 'nb_paiements'}))
+    encaisse['mois'] = pd.PeriodIndex(encaisse['mois'], freq='M')
+    return encaisse[encaisse['mois'] < mois_courant]
+
+
+# Dû restant des opérations en cours pour les `horizon` mois à venir (l'échu impayé dans le mois courant)
+def _futur(copie, mois_courant, horizon):
+    echeances = _echeances(_operations(copie, pc.equal(copie['operations']['statut'], 'En cours')))
+    restant = echeances[echeances['reste'] > database.TOLERANCE_SOLDE]
+    restant = restant.assign(mois=restant['mois'].where(restant['mois'] > mois_courant, mois_courant))
+    futur = restant.groupby(['segment', 'mois'])['reste'].sum().rename('du').reset_index()
+    return futur[futur['mois'] < mois_courant + horizon]
+
+
+# Historique d'entraînement par segment et par mois: dû selon les échéanciers de toutes les opérations
+# (y compris terminées et archivées) et encaissé
+def _historique(copie, encaisse, mois_courant):
+    echeances = _echeances(_operations(copie))
+    du = echeances.groupby(['segment', 'mois'])['montant'].sum().rename('du').reset_index()
+    historique = du.merge(encaisse, on=['segment', 'mois'], how='outer').fillna({'du': 0.0, 'encaisse': 0.0})
+    return historique[historique['mois'] < mois_courant]
+
+
+# Historique d'un segment sur tous les mois (y compris sans activité) et mois à prévoir
+def _series(historique, futur, segment, mois_courant, horizon):
+    mois_futurs = pd.period_range(mois_courant, periods=horizon, freq='M')
+    futur = (futur[futur['segment'] == segment].set_index('mois')[['du']]
+             .reindex(mois_futurs, fill_value=0.0).rename_axis('mois').reset_index())
+    historique = historique[historique['segment'] == segment]
+    if historique.empty:
+        return historique[['mois', 'du', 'encaisse']], futur
+    mois_passes = pd.period_range(historique['mois'].min(), mois_courant - 1, freq='M')
+    historique = (historique.set_index('mois')[['du', 'encaisse']]
+                  .reindex(mois_passes, fill_value=0.0).rename_axis('mois').reset_index())
+    return historique, futur
+
+
+# Régression encaissé ~ dû + tendance + constante; avec peu d'historique, taux d'encaissement du dû
+def _ajuster_lineaire(historique, futur):
+    y = historique['encaisse'].to_numpy(dtype=float)
+    du = historique['du'].to_numpy(dtype=float)
+    t = _ordinaux(historique['mois']).astype(float)
+    if len(y) >= MIN_MOIS:
+        X = np.column_stack([du, t, np.ones_like(t)])
+        coefficients = np.linalg.lstsq(X, y, rcond=None)[0]
+    else:
+        X = np.column_stack([du, np.zeros_like(t), np.zeros_like(t)])
+        coefficients = np.array([y.sum() / du.sum() if du.sum() > 0 else 1.0, 0.0, 0.0])
+    ecart = float(np.std(y - X @ coefficients)) if len(y) > 1 else 0.0
+
+    t_futur = _ordinaux(futur['mois']).astype(float)
+    prevision = np.column_stack([futur['du'].to_numpy(dtype=float), t_futur, np.ones_like(t_futur)]) @ coefficients
+    modele = {'coefficients': coefficients.tolist(), 'ecart': ecart}
+    return modele, prevision, prevision - Z_INTERVALLE * ecart, prevision + Z_INTERVALLE * ecart
+
+
+def _ajuster_prophet(Prophet, historique, futur):
+    from prophet.serialize import model_to_json
+
+    modele = Prophet(weekly_seasonality=False, daily_seasonality=False,
+                     yearly_seasonality=len(historique) >= 24, interval_width=0.8)
+    modele.add_regressor('du')
+    modele.fit(pd.DataFrame({'ds': historique['mois'].dt.to_timestamp(), 'y': historique['encaisse'],
+                             'du': historique['du']}))
+    prevision = modele.predict(pd.DataFrame({'ds': futur['mois'].dt.to_timestamp(), 'du': futur['du']}))
+    return (model_to_json(modele), prevision['yhat'].to_numpy(), prevision['yhat_lower'].to_numpy(),
+            prevision['yhat_upper'].to_numpy())
+
+
+# Ajuster le modèle d'un segment et prévoir ses mois à venir (exécuté dans un processus du pool).
+# Renvoie le moteur utilisé, le modèle sérialisable et la prévision.
+def ajuster(historique, futur, avec_prophet=True):
+    Prophet = _prophet() if avec_prophet else None
+    if Prophet is not None and len(historique) >= MIN_MOIS:
+        nom, (modele, prevision, basse, haute) = 'prophet', _ajuster_prophet(Prophet, historique, futur)
+    else:
+        nom, (modele, prevision, basse, haute) = 'lineaire', _ajuster_lineaire(historique, futur)
+    return nom, modele, futur.assign(prevision=np.clip(prevision, 0, None), prevision_basse=np.clip(basse, 0, None),
+                                     prevision_haute=np.clip(haute, 0, None))
+
+
+# Ajuster les segments de `travaux` ({segment: (historique, futur)}). Les ajustements Prophet de plusieurs
+# segments sont répartis sur un pool de processus, dans la limite de `budget_s` secondes; les segments
+# non ajustés à temps (ou en erreur) sont prévus par régression linéaire et marqués incomplets. Le pool est
+# terminé à l'échéance: aucun ajustement en cours ne survit à l'appel.
+def _ajuster_segments(travaux, processus, budget_s):
+    resultats = {}
+    en_parallele = len(travaux) > 1 and processus != 1 and _prophet() is not None
+    if en_parallele:
+        echeance = time.monotonic() + budget_s
+        with multiprocessing.Pool(processus) as pool:
+            taches = {segment: pool.apply_async(ajuster, (historique, futur))
+                      for segment, (historique, futur) in travaux.items()}
+            for segment, tache in taches.items():
+                try:
+                    resultats[segment] = tache.get(max(echeance - time.monotonic(), 0)) + (True,)
+                except Exception:
+                    # Budget dépassé (multiprocessing.TimeoutError) ou échec de l'ajustement
+                    pass
+    for segment, (historique, futur) in travaux.items():
+        if segment not in resultats:
+            resultats[segment] = ajuster(historique, futur, avec_prophet=not en_parallele) + (not en_parallele,)
+    return resultats
+
+
+def _charger_cache():
+    chemin = chemin_cache()
+    if _cache.get('chemin') != chemin:
+        _cache.clear()
+        try:
+            with open(chemin, 'rb') as fichier:
+                contenu = pickle.load(fichier)
+            if contenu.get('version') == VERSION_CACHE:
+                _cache.update(contenu)
+        except (OSError, pickle.PickleError, EOFError):
+            pass
+        _cache['chemin'] = chemin
+    return _cache.setdefault('segments', {})
+
+
+def _enregistrer_cache():
+    chemin = chemin_cache()
+    with open(chemin + '.tmp', 'wb') as fichier:
+        pickle.dump({'version': VERSION_CACHE, 'segments': _cache['segments']}, fichier)
+    os.replace(chemin + '.tmp', chemin)
+
+
+# Prévision des encaissements des `horizon` prochains mois, par segment: dû contractuel restant (à jour) et
+# prévision des modèles en cache. Un segment est réajusté quand son historique d'entraînement (mois complets)
+# a gagné ou perdu au moins SEUIL_REAJUSTEMENT paiements, au changement de mois, d'horizon ou de moteur
+# disponible, s'il n'a pas été ajusté dans le temps imparti, ou si `reajuster`. Renvoie (prévisions, bilan).
+@instrumentation.tracer
+def prevoir(horizon=HORIZON_MOIS, reajuster=False, processus=None, budget_s=BUDGET_S):
+    mois_courant = pd.Period(pd.Timestamp.now(), freq='M')
+    with _verrou:
+        analytique.rafraichir()
+        copie = analytique.tables()
+        encaisse = _encaisse(copie, mois_courant)
+        futur = _futur(copie, mois_courant, horizon)
+        segments = _charger_cache()
+        nb_paiements = encaisse.groupby('segment')['nb_paiements'].sum()
+        disponible = moteur()
+
+        a_ajuster = []
+        actifs = set(pc.unique(copie['operations']['duree_mois']).to_pylist())
+        for segment in sorted(actifs):
+            en_cache = segments.get(segment)
+            if (reajuster or en_cache is None or en_cache['mois'] != mois_courant or en_cache['horizon'] != horizon
+                    or en_cache['disponible'] != disponible or not en_cache['complet']
+                    or abs(nb_paiements.get(segment, 0) - en_cache['nb_paiements']) >= SEUIL_REAJUSTEMENT):
+                a_ajuster.append(segment)
+        travaux = {}
+        if a_ajuster:
+            historique = _historique(copie, encaisse, mois_courant)
+            travaux = {segment: _series(historique, futur, segment, mois_courant, horizon) for segment in a_ajuster}
+        for segment, (nom, modele, prevision, complet) in _ajuster_segments(travaux, processus, budget_s).items():
+            segments[segment] = {'mois': mois_courant, 'horizon': horizon, 'disponible': disponible,
+                                 'complet': complet, 'moteur': nom, 'modele': modele,
+                                 'nb_paiements': int(nb_paiements.get(segment, 0)), 'prevision': prevision}
+        retires = set(segments) - actifs
+        for segment in retires:
+            del segments[segment]
+        if travaux or retires:
+            _enregistrer_cache()
+
+        previsions = [donnees['prevision'].assign(segment=segment) for segment, donnees in segments.items()]
+        if not previsions:
+            return pd.DataFrame(columns=COLONNES), {'moteur': disponible, 'reajustes': [], 'moteurs': {}}
+        previsions = pd.concat(previsions, ignore_index=True).drop(columns='du')
+        previsions = previsions.merge(futur.rename(columns={'du': 'attendu'}), on=['segment', 'mois'], how='left')
+        previsions['attendu'] = previsions['attendu'].fillna(0.0)
+        previsions['mois'] = previsions['mois'].astype(str)
+        bilan = {'moteur': disponible, 'reajustes': sorted(travaux),
+                 'moteurs': {segment: donnees['moteur'] for segment, donnees in segments.items()}}
+        return previsions[COLONNES].sort_values(['mois', 'segment'], ignore_index=True), bilan
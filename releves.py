@@ -0,0 +1,324 @@
+import html
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+import database
+import echeancier
+import instrumentation
+
+# Relevés mensuels des clients: opérations, paiements du mois, reste à payer, prochaine échéance et retard,
+# arrêtés à la fin du mois. Les données sont lues par lots de clients (quelques requêtes ensemblistes par lot)
+# et les relevés rendus en parallèle par un pool de processus, avec un nombre borné de lots en attente.
+FORMATS = ('html', 'pdf', 'png')
+# Clients par lot, et lots en attente de rendu par processus (bornent la mémoire)
+TAILLE_LOT = 200
+LOTS_PAR_PROCESSUS = 2
+# Mise en page des relevés PDF/PNG (A4): lignes de texte par page, hauteur d'une ligne (fraction de page)
+# et largeur maximale d'une colonne (caractères)
+LIGNES_PAR_PAGE = 60
+HAUTEUR_LIGNE = 0.0125
+LARGEUR_MAX_COLONNE = 40
+
+COLONNES_OPERATIONS = [
+    ("N°", 'id'), ("Date", 'date_creation'), ("Durée", 'duree_mois'), ("Total", 'montant_total'),
+    ("Payé", 'total_paye'), ("Reste", 'reste_a_payer'), ("Échéance", 'prochaine_echeance'),
+    ("En retard", 'montant_retard'),
+]
+COLONNES_PAIEMENTS = [
+    ("Date", 'date_paiement'), ("Opération", 'operation_id'), ("Type", 'type_paiement'), ("Montant", 'montant'),
+    ("Description", 'description'),
+]
+
+# Clients ayant une opération ouverte à la fin du mois ou clôturée depuis son début
+SQL_CLIENTS = '''
+    SELECT DISTINCT client_id FROM operations
+    WHERE date_creation < :fin AND (statut = 'En cours' OR date_cloture >= :debut)
+    ORDER BY client_id
+'''
+
+SQL_OPERATIONS = '''
+    SELECT o.id, o.client_id, o.valeur_marchandise, o.duree_mois, o.montant_total, o.date_creation, o.date_cloture,
+           o.total_paye - COALESCE(apres.montant, 0) AS total_paye
+    FROM operations o
+    LEFT JOIN (
+        SELECT operation_id, SUM(montant) AS montant FROM paiements
+        WHERE client_id BETWEEN :premier AND :dernier AND date_paiement >= :fin
+        GROUP BY operation_id
+    ) apres ON apres.operation_id = o.id
+    WHERE o.client_id BETWEEN :premier AND :dernier AND o.date_creation < :fin
+      AND (o.statut = 'En cours' OR o.date_cloture >= :debut)
+'''
+
+SQL_PAIEMENTS = '''
+    SELECT client_id, operation_id, type_paiement, montant, date_paiement, description FROM paiements
+    WHERE client_id BETWEEN :premier AND :dernier AND date_paiement >= :debut AND date_paiement < :fin
+    ORDER BY client_id, date_paiement, id
+'''
+
+
+# Mois 'AAAA-MM' (par défaut le mois précédent) -> (premier jour, premier jour du mois suivant)
+def periode(mois=None):
+    mois = pd.Period(mois, freq='M') if mois else pd.Period(pd.Timestamp.now(), freq='M') - 1
+    return mois.start_time.strftime("%Y-%m-%d"), (mois + 1).start_time.strftime("%Y-%m-%d")
+
+
+def _montant(valeur):
+    return f"{valeur:,.0f}".replace(",", " ")
+
+
+def _texte(cle, valeur):
+    if valeur is None or (isinstance(valeur, float) and np.isnan(valeur)):
+        return ""
+    if cle in ('montant_total', 'total_paye', 'reste_a_payer', 'montant_retard', 'montant'):
+        return _montant(valeur)
+    if cle == 'duree_mois':
+        return f"{valeur:g} mois"
+    if cle in ('date_creation', 'date_paiement'):
+        return str(valeur)[:10]
+    return str(valeur)
+
+
+# Relevés des clients d'identifiant compris entre `premier` et `dernier`, arrêtés à `fin` (exclue):
+# soldes recalculés sans les paiements postérieurs, échéance et retard tirés de l'échéancier
+def _lire_lot(conn, premier, dernier, debut, fin):
+    parametres = {'premier': premier, 'dernier': dernier, 'debut': debut, 'fin': fin}
+    clients = pd.read_sql_query("SELECT id, nom, telephone FROM clients WHERE id BETWEEN :premier AND :dernier",
+                                conn, params=parametres).set_index('id')
+    operations = pd.read_sql_query(SQL_OPERATIONS, conn, params=parametres)
+    paiements = pd.read_sql_query(SQL_PAIEMENTS, conn, params=parametres)
+
+    operations['reste_a_payer'] = operations['montant_total'] - operations['total_paye']
+    echeances = echeancier.analyser_echeancier(echeancier.construire_echeancier(operations),
+                                               pd.Timestamp(fin) - pd.Timedelta(days=1))
+    a_venir = echeances[echeances['reste'] > database.TOLERANCE_SOLDE]
+    operations = operations.merge(
+        a_venir.groupby('operation_id')['date_echeance'].min().dt.strftime("%Y-%m-%d")
+        .rename('prochaine_echeance'), left_on='id', right_index=True, how='left')
+    operations = operations.merge(echeances.groupby('operation_id')['montant_retard'].sum(),
+                                  left_on='id', right_index=True, how='left')
+
+    # Opérations à présenter: restant dues, payées ou clôturées dans le mois
+    garder = ((operations['reste_a_payer'] > database.TOLERANCE_SOLDE)
+              | operations['id'].isin(paiements['operation_id'])
+              | ((operations['date_cloture'] >= debut) & (operations['date_cloture'] < fin)))
+    operations = operations[garder].sort_values(['client_id', 'date_creation'])
+
+    # Totaux par client en agrégations, lignes des tableaux regroupées en une passe
+    operations['reste_du'] = operations['reste_a_payer'].clip(lower=0)
+    operations['montant_retard'] = operations['montant_retard'].fillna(0.0)
+    totaux = operations.groupby('client_id').agg(reste_a_payer=('reste_du', 'sum'),
+                                                 montant_retard=('montant_retard', 'sum'),
+                                                 prochaine_echeance=('prochaine_echeance', 'min'))
+    totaux['encaisse_mois'] = paiements.groupby('client_id')['montant'].sum().reindex(totaux.index, fill_value=0.0)
+    lignes = {'operations': {}, 'paiements': {}}
+    for cle, donnees, colonnes in (('operations', operations, COLONNES_OPERATIONS),
+                                   ('paiements', paiements, COLONNES_PAIEMENTS)):
+        for ligne in donnees[['client_id'] + [c for _, c in colonnes]].to_dict('records'):
+            lignes[cle].setdefault(ligne['client_id'], []).append(ligne)
+
+    noms = clients.to_dict('index')
+    return [{
+        'client_id': int(client_id),
+        'nom': noms.get(client_id, {}).get('nom') or "",
+        'telephone': noms.get(client_id, {}).get('telephone') or "",
+        'mois': debut[:7],
+        'operations': lignes['operations'][client_id],
+        'paiements': lignes['paiements'].get(client_id, []),
+        'encaisse_mois': float(total.encaisse_mois),
+        'reste_a_payer': float(total.reste_a_payer),
+        'montant_retard': float(total.montant_retard),
+        'prochaine_echeance': total.prochaine_echeance if isinstance(total.prochaine_echeance, str) else None,
+    } for client_id, total in zip(totaux.index, totaux.itertuples())]
+
+
+def _tableau_html(colonnes, lignes):
+    entete = "".join(f"<th>{html.escape(titre)}</th>" for titre, _ in colonnes)
+    corps = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(_texte(cle, ligne[cle]))}</td>" for _, cle in colonnes) + "</tr>"
+        for ligne in lignes)
+    return f"<table><thead><tr>{entete}</tr></thead><tbody>{corps}</tbody></table>"
+
+
+def rendre_html(releve):
+    nom = html.escape(releve['nom'] or "")
+    paiements = (_tableau_html(COLONNES_PAIEMENTS, releve['paiements']) if releve['paiements']
+                 else "<p>Aucun paiement ce mois-ci.</p>")
+    return f"""<!DOCTYPE html>
+<html lang="fr"><head><meta charset="utf-8"><title>Relevé {releve['mois']} - {nom}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; color: #222; }}
+h1 {{ color: #FF6B6B; }} h2 {{ color: #4ECDC4; }}
+table {{ border-collapse: collapse; width: 100%; margin-bottom: 1.5em; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 8px; text-align: left; }}
+th {{ background: #f4f4f4; }}
+.resume td {{ border: none; font-weight: bold; }}
+</style></head><body>
+<h1>Relevé de compte — {releve['mois']}</h1>
+<p><strong>{nom}</strong> (client n° {releve['client_id']})<br>{html.escape(releve['telephone'] or "")}</p>
+<table class="resume">
+<tr><td>Encaissé ce mois-ci</td><td>{_montant(releve['encaisse_mois'])}</td></tr>
+<tr><td>Reste à payer</td><td>{_montant(releve['reste_a_payer'])}</td></tr>
+<tr><td>Dont en retard</td><td>{_montant(releve['montant_retard'])}</td></tr>
+<tr><td>Prochaine échéance</td><td>{releve['prochaine_echeance'] or "-"}</td></tr>
+</table>
+<h2>Opérations</h2>
+{_tableau_html(COLONNES_OPERATIONS, releve['operations'])}
+<h2>Paiements du mois</h2>
+{paiements}
+</body></html>
+"""
+
+
+# Tableau en texte à chasse fixe: une colonne par champ, montants alignés à droite
+def _tableau_texte(colonnes, lignes):
+    cellules = [[titre for titre, _ in colonnes]]
+    cellules += [[_texte(cle, ligne[cle])[:LARGEUR_MAX_COLONNE] for _, cle in colonnes] for ligne in lignes]
+    largeurs = [max(len(ligne[i]) for ligne in cellules) for i in range(len(colonnes))]
+    a_droite = [cle in ('montant_total', 'total_paye', 'reste_a_payer', 'montant_retard', 'montant')
+                for _, cle in colonnes]
+    return ["  ".join(c.rjust(l) if d else c.ljust(l) for c, l, d in zip(ligne, largeurs, a_droite)).rstrip()
+            for ligne in cellules]
+
+
+# Blocs à dessiner (titres de section et lignes de tableaux), coupés en pages de LIGNES_PAR_PAGE lignes;
+# un titre compte pour deux lignes
+def _pages(releve):
+    sections = [("Opérations", _tableau_texte(COLONNES_OPERATIONS, releve['operations']))]
+    if releve['paiements']:
+        sections.append(("Paiements du mois", _tableau_texte(COLONNES_PAIEMENTS, releve['paiements'])))
+    else:
+        sections.append(("Paiements du mois", ["Aucun paiement ce mois-ci."]))
+
+    pages, page, reste = [], [], LIGNES_PAR_PAGE
+    for titre, lignes in sections:
+        entete = lignes[:1] if len(lignes) > 1 else []
+        corps = lignes[1:] if entete else lignes
+        suite = False
+        while corps or not suite:
+            # Titre (2 lignes), en-tête, corps puis une ligne d'espacement
+            if reste < 3 + len(entete) + 1:
+                pages.append(page)
+                page, reste = [], LIGNES_PAR_PAGE
+            nb = min(len(corps), reste - 3 - len(entete))
+            page.append((titre + (" (suite)" if suite else ""), entete + corps[:nb]))
+            reste -= 3 + len(entete) + nb
+            corps = corps[nb:]
+            suite = True
+    pages.append(page)
+    return pages
+
+
+# Pages A4 du relevé en figures matplotlib (sans pyplot: pas d'état global, figures libérées avec le lot).
+# Chaque tableau est un seul texte à chasse fixe: le coût du rendu dépend peu du nombre de lignes.
+def figures(releve):
+    from matplotlib.figure import Figure
+
+    pages = _pages(releve)
+    for numero, blocs in enumerate(pages, 1):
+        figure = Figure(figsize=(8.27, 11.69))
+        figure.text(0.06, 0.95, f"Relevé de compte — {releve['mois']}", fontsize=16, color='#FF6B6B',
+                    weight='bold')
+        figure.text(0.06, 0.925, f"{releve['nom']} (client n° {releve['client_id']})  {releve['telephone']}",
+                    fontsize=10)
+        figure.text(0.06, 0.90, f"Encaissé ce mois-ci: {_montant(releve['encaisse_mois'])}    "
+                                f"Reste à payer: {_montant(releve['reste_a_payer'])}    "
+                                f"Dont en retard: {_montant(releve['montant_retard'])}    "
+                                f"Prochaine échéance: {releve['prochaine_echeance'] or '-'}", fontsize=8)
+        y = 0.87
+        for titre, lignes in blocs:
+            figure.text(0.06, y, titre, fontsize=11, color='#4ECDC4', weight='bold', va='top')
+            y -= 2 * HAUTEUR_LIGNE
+            figure.text(0.06, y, "\n".join(lignes), fontsize=7.5, family='monospace', va='top', linespacing=1.4)
+            y -= (len(lignes) + 1) * HAUTEUR_LIGNE
+        figure.text(0.94, 0.03, f"{numero}/{len(pages)}", fontsize=7, ha='right')
+        yield figure
+
+
+def rendre_pdf(releve, chemin):
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    with PdfPages(chemin) as pdf:
+        for figure in figures(releve):
+            pdf.savefig(figure)
+
+
+# PNG: pages rendues par matplotlib (Agg), assemblées verticalement et réduites en palette par Pillow
+def rendre_png(releve, chemin, dpi=100):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from PIL import Image
+
+    pages = []
+    for figure in figures(releve):
+        figure.set_dpi(dpi)
+        canevas = FigureCanvasAgg(figure)
+        canevas.draw()
+        pages.append(Image.frombuffer('RGBA', canevas.get_width_height(), canevas.buffer_rgba()).convert('RGB'))
+    image = Image.new('RGB', (pages[0].width, sum(page.height for page in pages)), 'white')
+    hauteur = 0
+    for page in pages:
+        image.paste(page, (0, hauteur))
+        hauteur += page.height
+    image.quantize(colors=32, method=Image.Quantize.FASTOCTREE).save(chemin)
+
+
+def nom_fichier(releve, format_releve):
+    return f"releve_{releve['mois']}_{releve['client_id']:06d}.{format_releve}"
+
+
+# Rendre un lot de relevés dans `dossier` (exécuté dans un processus du pool); renvoie le nombre de fichiers
+def rendre_lot(releves, dossier, formats):
+    nb_fichiers = 0
+    for releve in releves:
+        for format_releve in formats:
+            chemin = os.path.join(dossier, nom_fichier(releve, format_releve))
+            if format_releve == 'html':
+                with open(chemin, 'w', encoding='utf-8') as fichier:
+                    fichier.write(rendre_html(releve))
+            elif format_releve == 'pdf':
+                rendre_pdf(releve, chemin)
+            else:
+                rendre_png(releve, chemin)
+            nb_fichiers += 1
+    return nb_fichiers
+
+
+# Générer les relevés du mois `mois` ('AAAA-MM', par défaut le mois précédent) dans `dossier`,
+# aux formats demandés. Un lot est lu pendant que les précédents sont rendus; au plus
+# LOTS_PAR_PROCESSUS lots par processus attendent leur rendu. Renvoie (relevés, fichiers).
+@instrumentation.tracer
+def generer_releves(dossier, mois=None, formats=('html',), processus=None, taille_lot=TAILLE_LOT):
+    inconnus = set(formats) - set(FORMATS)
+    if inconnus:
+        raise ValueError(f"Formats inconnus: {', '.join(sorted(inconnus))}")
+    debut, fin = periode(mois)
+    os.makedirs(dossier, exist_ok=True)
+    with database.connexion() as conn:
+        clients = [ligne[0] for ligne in conn.execute(SQL_CLIENTS, {'debut': debut, 'fin': fin})]
+
+    def lots():
+        for i in range(0, len(clients), taille_lot):
+            lot = clients[i:i + taille_lot]
+            with database.connexion() as conn:
+                yield _lire_lot(conn, lot[0], lot[-1], debut, fin)
+
+    nb_releves = nb_fichiers = 0
+    if processus == 1:
+        for releves in lots():
+            nb_releves += len(releves)
+            nb_fichiers += rendre_lot(releves, dossier, formats)
+        return nb_releves, nb_fichiers
+
+    processus = processus or os.cpu_count() or 1
+    with ProcessPoolExecutor(processus) as executeur:
+        en_cours = set()
+        for releves in lots():
+            nb_releves += len(releves)
+            en_cours.add(executeur.submit(rendre_lot, releves, dossier, formats))
+            if len(en_cours) >= processus * LOTS_PAR_PROCESSUS:
+                termines, en_cours = wait(en_cours, return_when=FIRST_COMPLETED)
+                nb_fichiers += sum(future.result() for future in termines)
+        nb_fichiers += sum(future.result() for future in en_cours)
+    return nb_releves, nb_fichiers
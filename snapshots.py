@@ -0,0 +1,143 @@
+import os
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import database
+import instrumentation
+import echeancier
+
+
+# État complet du portefeuille à la fin de `jour`: parcours de tout l'historique,
+# utilisé uniquement pour le premier instantané
+def _etat_initial(conn, jour, operations='operations', paiements='paiements'):
+    fin = (jour + timedelta(days=1)).isoformat()
+    cree, nb_creees = conn.execute(
+        f"SELECT COALESCE(SUM(montant_total), 0), COUNT(*) FROM {operations} WHERE date_creation < ?",
+        (fin,)).fetchone()
+    encaisse = conn.execute(
+        f"SELECT COALESCE(SUM(montant), 0) FROM {paiements} WHERE date_paiement < ?", (fin,)).fetchone()[0]
+    nb_terminees = conn.execute(
+        f"SELECT COUNT(*) FROM {operations} WHERE date_cloture < ?", (fin,)).fetchone()[0]
+    return {
+        'encours': cree - encaisse,
+        'encaisse_cumul': encaisse,
+        'nb_ouvertes': nb_creees - nb_terminees,
+        'nb_terminees': nb_terminees,
+    }
+
+
+# Variations d'une seule journée, lues par les index sur les colonnes de date
+def _variations(conn, jour, operations='operations', paiements='paiements'):
+    debut, fin = jour.isoformat(), (jour + timedelta(days=1)).isoformat()
+    nouvelles, montant_nouvelles = conn.execute(f'''
+        SELECT COUNT(*), COALESCE(SUM(montant_total), 0) FROM {operations}
+        WHERE date_creation >= ? AND date_creation < ?
+    ''', (debut, fin)).fetchone()
+    encaisse = conn.execute(f'''
+        SELECT COALESCE(SUM(montant), 0) FROM {paiements}
+        WHERE date_paiement >= ? AND date_paiement < ?
+    ''', (debut, fin)).fetchone()[0]
+    cloturees = conn.execute(f'''
+        SELECT COUNT(*) FROM {operations}
+        WHERE date_cloture >= ? AND date_cloture < ?
+    ''', (debut, fin)).fetchone()[0]
+    return nouvelles, montant_nouvelles, encaisse, cloturees
+
+
+def _enregistrer(conn, jour, etat, montant_retard):
+    conn.execute('''
+        INSERT INTO snapshots_quotidiens (jour, encours, encaisse_jour, encaisse_cumul, nouvelles_operations,
+                                          montant_nouvelles_operations, nb_ouvertes, nb_terminees,
+                                          montant_retard, date_calcul)
+        VALUES (:jour, :encours, :encaisse_jour, :encaisse_cumul, :nouvelles_operations,
+                :montant_nouvelles_operations, :nb_ouvertes, :nb_terminees, :montant_retard, :date_calcul)
+        ON CONFLICT (jour) DO UPDATE SET
+            encours = excluded.encours,
+            encaisse_jour = excluded.encaisse_jour,
+            encaisse_cumul = excluded.encaisse_cumul,
+            nouvelles_operations = excluded.nouvelles_operations,
+            montant_nouvelles_operations = excluded.montant_nouvelles_operations,
+            nb_ouvertes = excluded.nb_ouvertes,
+            nb_terminees = excluded.nb_terminees,
+            montant_retard = COALESCE(excluded.montant_retard, snapshots_quotidiens.montant_retard),
+            date_calcul = excluded.date_calcul
+    ''', dict(etat, jour=jour.isoformat(), montant_retard=montant_retard,
+              date_calcul=datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+
+# Compléter les instantanés quotidiens jusqu'à `jusqu_au` (aujourd'hui par défaut).
+# Chaque jour est calculé à partir de la veille et des seules variations du jour; le dernier jour
+# déjà enregistré est recalculé car il a pu être pris avant la fin de la journée.
+# Le montant en retard n'est connu que pour le jour courant (échéancier à date).
+# `reconstruire` repart de zéro, par exemple après des modifications ou suppressions d'opérations.
+# Renvoie le nombre de jours écrits.
+@instrumentation.tracer
+def mettre_a_jour_snapshots(jusqu_au=None, reconstruire=False):
+    aujourd_hui = date.today()
+    jusqu_au = jusqu_au or aujourd_hui
+    montant_retard = None
+    if jusqu_au == aujourd_hui:
+        montant_retard = float(echeancier.analyser_portefeuille(aujourd_hui)[1].sum())
+
+    # Opérations et paiements archivés compris: l'historique ne change pas avec l'archivage
+    avec_archive = os.path.exists(database.chemin_archive())
+    paiements = database.VUES_ARCHIVE['paiements'] if avec_archive else 'paiements'
+    with database.connexion_lecture('operations', avec_archive) as (conn, operations):
+        conn.execute('BEGIN IMMEDIATE')
+        if reconstruire:
+            conn.execute('DELETE FROM snapshots_quotidiens')
+
+        derniers = conn.execute(
+            "SELECT * FROM snapshots_quotidiens ORDER BY jour DESC LIMIT 2").fetchall()
+        colonnes = [c[0] for c in conn.execute("SELECT * FROM snapshots_quotidiens LIMIT 0").description]
+        derniers = [dict(zip(colonnes, ligne)) for ligne in derniers]
+
+        nb_jours = 0
+        if len(derniers) == 2:
+            jour = date.fromisoformat(derniers[0]['jour'])
+            precedent = derniers[1]
+        else:
+            premiere = conn.execute(f"SELECT MIN(date_creation) FROM {operations}").fetchone()[0]
+            jour = min(date.fromisoformat(premiere[:10]), jusqu_au) if premiere else jusqu_au
+            if derniers:
+                jour = min(jour, date.fromisoformat(derniers[0]['jour']))
+            etat = _etat_initial(conn, jour, operations, paiements)
+            nouvelles, montant_nouvelles, encaisse, _ = _variations(conn, jour, operations, paiements)
+            etat.update(encaisse_jour=encaisse, nouvelles_operations=nouvelles,
+                        montant_nouvelles_operations=montant_nouvelles)
+            _enregistrer(conn, jour, etat, montant_retard if jour == aujourd_hui else None)
+            precedent = etat
+            jour += timedelta(days=1)
+            nb_jours += 1
+
+        while jour <= jusqu_au:
+            nouvelles, montant_nouvelles, encaisse, cloturees = _variations(conn, jour, operations, paiements)
+            etat = {
+                'encours': precedent['encours'] + montant_nouvelles - encaisse,
+                'encaisse_jour': encaisse,
+                'encaisse_cumul': precedent['encaisse_cumul'] + encaisse,
+                'nouvelles_operations': nouvelles,
+                'montant_nouvelles_operations': montant_nouvelles,
+                'nb_ouvertes': precedent['nb_ouvertes'] + nouvelles - cloturees,
+                'nb_terminees': precedent['nb_terminees'] + cloturees,
+            }
+            _enregistrer(conn, jour, etat, montant_retard if jour == aujourd_hui else None)
+            precedent = etat
+            jour += timedelta(days=1)
+            nb_jours += 1
+
+        conn.commit()
+    return nb_jours
+
+
+# Instantanés pré-agrégés pour les graphiques de tendance
+@instrumentation.tracer
+def get_snapshots(depuis=None):
+    sql = "SELECT * FROM snapshots_quotidiens"
+    params = []
+    if depuis is not None:
+        sql += " WHERE jour >= ?"
+        params.append(str(depuis))
+    with database.connexion() as conn:
+        return pd.read_sql_query(sql + " ORDER BY jour", conn, params=params, parse_dates=['jour'])
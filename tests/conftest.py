@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# Modules de l'application à la racine du dépôt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+# Base neuve migrée dans un répertoire temporaire (archive comprise)
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    monkeypatch.setenv('VENTES_TERME_ARCHIVE', str(tmp_path / 'test_archive.db'))
+    database.configurer_db(str(tmp_path / 'test.db'))
+    database.init_db()
+    yield tmp_path
+    database.fermer_connexions()
@@ -0,0 +1,92 @@
+import analytique
+import database
+
+
+# Contenu des tables de la copie, triées par identifiant, comparable d'un rafraîchissement à l'autre
+def _contenu(copie):
+    return {table: copie[table].sort_by('id').to_pylist() for table in analytique.SCHEMAS}
+
+
+def _client(nom):
+    database.ajouter_client(nom, "", "")
+    with database.connexion() as conn:
+        return conn.execute("SELECT id FROM clients WHERE nom = ?", (nom,)).fetchone()[0]
+
+
+# Rafraîchissement incrémental après ajouts, modification, suppression et archivage: même copie
+# qu'une reconstruction complète
+def test_rafraichissement_incremental_egal_reconstruction(base):
+    client_id = _client("Alpha")
+    operations = [database.creer_operation(client_id, 100 * (i + 1), 0.1, 2)[0] for i in range(4)]
+    for operation_id in operations:
+        database.enregistrer_paiement(operation_id, client_id, "Ordinaire", 10)
+    bilan = analytique.rafraichir()
+    assert bilan['reconstruction'] and bilan['operations'] == 4 and bilan['paiements'] == 4
+
+    autre_id = _client("Beta")
+    nouvelle, _ = database.creer_operation(autre_id, 80, 0.1, 1)
+    database.enregistrer_paiement(nouvelle, autre_id, "Anticipé", 88)
+    database.enregistrer_paiement(operations[0], client_id, "Ordinaire", 20)
+    database.modifier_operation(operations[1], 150, 0.2, 3)
+    database.supprimer_operation(operations[2])
+    with database.connexion() as conn:
+        conn.execute("UPDATE operations SET date_cloture = '2020-01-01 00:00:00' WHERE id = ?", (nouvelle,))
+        conn.commit()
+    assert database.archiver(age_jours=30) == (1, 1)
+
+    bilan = analytique.rafraichir()
+    assert not bilan['reconstruction']
+    assert bilan['operations_supprimees'] == 1 and bilan['paiements_supprimes'] == 1
+    incrementale = _contenu(analytique.tables())
+
+    analytique.rafraichir(reconstruire=True)
+    assert incrementale == _contenu(analytique.tables())
+    assert len(incrementale['operations']) == 4 and len(incrementale['paiements']) == 5
+    assert analytique.indicateurs()['encaisse'] == 10 * 3 + 20 + 88
+
+
+# Un autre processus rafraîchit le même répertoire: la copie en mémoire, périmée, est relue du disque
+def test_copie_rafraichie_par_un_autre_processus(base):
+    client_id = _client("Alpha")
+    database.creer_operation(client_id, 100, 0.1, 2)
+    analytique.rafraichir()
+    copie_a = dict(analytique._copie)
+
+    # Processus B, sans copie en mémoire
+    analytique._copie.clear()
+    operation_id, _ = database.creer_operation(client_id, 50, 0.1, 2)
+    database.enregistrer_paiement(operation_id, client_id, "Ordinaire", 5)
+    analytique.rafraichir()
+
+    # Retour au processus A
+    analytique._copie.clear()
+    analytique._copie.update(copie_a)
+    assert len(analytique.tables()['operations']) == 2
+    analytique._copie.clear()
+    analytique._copie.update(copie_a)
+    analytique.rafraichir()
+    incrementale = _contenu(analytique.tables())
+
+    operations = {o['id']: o for o in incrementale['operations']}
+    assert operations[operation_id]['total_paye'] == 5
+    analytique.rafraichir(reconstruire=True)
+    assert incrementale == _contenu(analytique.tables())
+
+
+# Écart du nombre d'opérations qui ne s'explique pas par des suppressions: tout est relu
+def test_operations_manquantes_relues(base):
+    client_id = _client("Alpha")
+    for _ in range(3):
+        database.creer_operation(client_id, 100, 0.1, 2)
+    # Modifications antérieures à la lecture: le rafraîchissement suivant ne les relit pas
+    with database.connexion() as conn:
+        conn.execute("UPDATE operations SET date_modification = '2020-01-01 00:00:00'")
+        conn.commit()
+    analytique.rafraichir()
+    copie = analytique.tables()
+    copie['operations'] = copie['operations'].slice(1)
+
+    bilan = analytique.rafraichir()
+
+    assert bilan['reconstruction']
+    assert len(analytique.tables()['operations']) == 3
@@ -0,0 +1,53 @@
+import database
+
+
+def _compter(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+# Une opération soldée clôturée le `date_cloture`, une en cours, chacune avec deux paiements
+def _portefeuille():
+    database.ajouter_client("Alpha", "", "")
+    soldee, _ = database.creer_operation(1, 100, 0.0, 2)
+    en_cours, _ = database.creer_operation(1, 100, 0.0, 2)
+    for operation_id, montant in ((soldee, 50), (en_cours, 10)):
+        for _ in range(2):
+            database.enregistrer_paiement(operation_id, 1, "Ordinaire", montant)
+    with database.connexion() as conn:
+        conn.execute("UPDATE operations SET date_cloture = '2020-01-01 00:00:00' WHERE id = ?", (soldee,))
+        conn.commit()
+    return soldee, en_cours
+
+
+# Opérations terminées anciennes déplacées avec leurs paiements; les vues réunissent base et archive
+def test_archiver_et_vues_reunies(base):
+    soldee, en_cours = _portefeuille()
+    assert database.compter_operations(statut='Terminé') == 1
+
+    assert database.archiver(age_jours=30) == (1, 2)
+
+    with database.connexion() as conn:
+        assert [r[0] for r in conn.execute("SELECT id FROM operations")] == [en_cours]
+        assert _compter(conn, 'paiements') == 2
+    with database.connexion_archive() as conn:
+        assert [r[0] for r in conn.execute("SELECT id FROM archive.operations")] == [soldee]
+        assert _compter(conn, 'archive.paiements') == 2
+        assert _compter(conn, 'toutes_operations') == 2
+        assert _compter(conn, 'tous_paiements') == 4
+        solde = conn.execute("SELECT statut, total_paye, reste_a_payer, client_nom FROM v_toutes_operations_soldes "
+                             "WHERE id = ?", (soldee,)).fetchone()
+        assert solde == ('Terminé', 100, 0, 'Alpha')
+
+    assert database.compter_operations() == 1
+    assert database.compter_operations(avec_archive=True) == 2
+    assert database.compter_paiements(avec_archive=True) == 4
+    assert database.ids_operations_archivees() == {soldee}
+    assert database.archiver(age_jours=30) == (0, 0)
+
+
+# Clôture plus récente que l'âge d'archivage: l'opération reste dans la base
+def test_archiver_garde_les_clotures_recentes(base):
+    _portefeuille()
+    assert database.archiver(age_jours=365 * 100) == (0, 0)
+    assert database.compter_operations() == 2
+    assert database.ids_operations_archivees() == set()
@@ -0,0 +1,5 @@
+import database
+
+
+def test_requetes_critiques_sans_parcours_complet(base):
+    assert database.verifier_plans_requetes() == {}
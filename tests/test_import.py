@@ -0,0 +1,74 @@
+import io
+
+import database
+import import_donnees
+
+
+def _importer(type_import, contenu):
+    return import_donnees.importer(type_import, io.StringIO(contenu), nom=f'{type_import}.csv')
+
+
+def _operation(operation_id):
+    with database.connexion() as conn:
+        return conn.execute(
+            "SELECT statut, reste_a_payer, date_cloture FROM operations WHERE id = ?", (operation_id,)).fetchone()
+
+
+# Opération soldée par des paiements historiques: clôturée au dernier paiement, pas au jour de l'import
+def test_import_paiements_cloture_au_dernier_paiement(base):
+    _importer('clients', "nom\nAlpha\n")
+    _importer('operations', "id,client,valeur_marchandise,taux_benefice,duree_mois,date_creation\n"
+                            "1,Alpha,1000,0.2,2,2023-01-01\n")
+
+    importees, rapport = _importer('paiements', "operation_id,montant,date_paiement\n"
+                                                "1,700,2023-01-31 10:00:00\n"
+                                                "1,700,2023-03-02 09:30:00\n")
+
+    assert importees == 2 and rapport.empty
+    statut, reste, date_cloture = _operation(1)
+    assert statut == 'Terminé'
+    assert reste == 0
+    assert date_cloture == '2023-03-02 09:30:00'
+
+
+def _erreurs(rapport):
+    return dict(zip(rapport['ligne'], rapport['erreur']))
+
+
+# Lignes invalides écartées et signalées par leur numéro de ligne dans le fichier, les autres importées
+def test_import_rapport_des_lignes_invalides(base):
+    importees, rapport = _importer('clients', "nom,telephone\nAlpha,1\n,2\nAlpha,3\nBeta,4\n")
+    assert importees == 2
+    assert _erreurs(rapport) == {3: "nom manquant", 4: "client en double dans le fichier"}
+
+    importees, rapport = _importer('operations', "id,client,valeur_marchandise,taux_benefice,duree_mois\n"
+                                                 "1,Alpha,1000,0.1,3\n"
+                                                 "2,Gamma,1000,0.1,3\n"
+                                                 "3,Beta,1000,0.1,0\n"
+                                                 "1,Beta,1000,0.1,3\n"
+                                                 ",Beta,500,0.1,2\n")
+    assert importees == 2
+    assert _erreurs(rapport) == {3: "client inconnu", 4: "duree_mois nulle", 5: "id en double dans le fichier"}
+
+    importees, rapport = _importer('paiements', "operation_id,montant,type_paiement\n"
+                                                "1,100,\n"
+                                                "9,100,\n"
+                                                "1,0,\n"
+                                                "1,50,Cadeau\n"
+                                                "1,200,Anticipé\n")
+    assert importees == 2
+    assert _erreurs(rapport) == {3: "opération inconnue", 4: "montant nul", 5: "type_paiement invalide"}
+    assert _operation(1)[:2] == ('En cours', 1000)
+
+
+# Identifiant d'une opération archivée: refusé, l'archivage suivant écraserait la copie archivée
+def test_import_refuse_les_ids_archives(base):
+    _importer('clients', "nom\nAlpha\n")
+    _importer('operations', "id,client,valeur_marchandise,taux_benefice,duree_mois,date_creation,statut\n"
+                            "7,Alpha,1000,0.1,3,2020-01-01,Terminé\n")
+    assert database.archiver(age_jours=0) == (1, 0)
+
+    importees, rapport = _importer('operations', "id,client,valeur_marchandise,taux_benefice,duree_mois\n"
+                                                 "7,Alpha,1000,0.1,3\n")
+    assert importees == 0
+    assert _erreurs(rapport) == {2: "opération déjà existante"}
@@ -0,0 +1,53 @@
+import math
+from datetime import date, timedelta
+
+import pytest
+
+import database
+import echeancier
+import traitement_nuit
+
+
+def _operation(operation_id):
+    with database.connexion() as conn:
+        return dict(zip(('date_creation', 'prochaine_echeance', 'en_retard', 'total_paye', 'statut'), conn.execute(
+            "SELECT date_creation, prochaine_echeance, en_retard, total_paye, statut FROM operations WHERE id = ?",
+            (operation_id,)).fetchone()))
+
+
+# Paiements ordinaires ponctuels de la mensualité arrondie à l'unité (1 480 000 sur 6 mois: 246 666,67):
+# l'échéance avance d'une mensualité à chaque paiement et l'opération n'est jamais en retard
+@pytest.mark.parametrize('arrondi', [math.floor, math.ceil])
+def test_paiements_ordinaires_avancent_echeance(base, arrondi):
+    database.ajouter_client("Client", None, "")
+    database.creer_operation(1, 1000000, 0.08, 6)
+    creation = date.fromisoformat(_operation(1)['date_creation'][:10])
+    mensualite = arrondi(1480000 / 6)
+
+    for n in range(1, 6):
+        database.transaction_immediate(lambda conn: database.inserer_paiement(
+            conn, 1, 1, "Ordinaire", mensualite, "", f"{creation + timedelta(days=30 * n)} 10:00:00"))
+        lendemain = creation + timedelta(days=30 * n + 1)
+        traitement_nuit.executer(lendemain)
+
+        operation = _operation(1)
+        assert operation['prochaine_echeance'] == (creation + timedelta(days=30 * (n + 1))).isoformat()
+        assert operation['en_retard'] == 0
+        echeances = echeancier.analyser_echeancier(
+            echeancier.construire_echeancier(database.get_operations()), lendemain)
+        assert echeances['montant_retard'].sum() == 0
+
+
+# Un paiement partiel ne couvre pas l'échéance: en retard le lendemain de celle-ci, pas le jour même
+def test_paiement_partiel_en_retard(base):
+    database.ajouter_client("Client", None, "")
+    database.creer_operation(1, 1000000, 0.08, 6)
+    creation = date.fromisoformat(_operation(1)['date_creation'][:10])
+    database.enregistrer_paiement(1, 1, "Ordinaire", 100000)
+
+    traitement_nuit.executer(creation + timedelta(days=30))
+    assert _operation(1)['en_retard'] == 0
+    traitement_nuit.executer(creation + timedelta(days=31))
+    operation = _operation(1)
+    assert operation['prochaine_echeance'] == (creation + timedelta(days=30)).isoformat()
+    assert operation['en_retard'] == 1
@@ -0,0 +1,73 @@
+import database
+
+
+def _operation_payee(montants):
+    database.ajouter_client("Alpha", "", "")
+    operation_id, _ = database.creer_operation(1, 1000, 0.1, 3)
+    for montant in montants:
+        database.enregistrer_paiement(operation_id, 1, "Ordinaire", montant)
+    return operation_id
+
+
+def _soldes(operation_id):
+    with database.connexion() as conn:
+        return conn.execute(
+            "SELECT total_paye, reste_a_payer FROM operations WHERE id = ?", (operation_id,)).fetchone()
+
+
+def _executer(sql, parametres=()):
+    with database.connexion() as conn:
+        conn.execute(sql, parametres)
+        conn.commit()
+
+
+def _fixer_soldes(operation_id, total_paye, reste_a_payer):
+    _executer("UPDATE operations SET total_paye = ?, reste_a_payer = ? WHERE id = ?",
+              (total_paye, reste_a_payer, operation_id))
+
+
+# Soldes tenus par les triggers à l'ajout, la modification, le déplacement et la suppression d'un paiement
+def test_soldes_tenus_par_les_triggers(base):
+    operation_id = _operation_payee([100, 200])
+    assert _soldes(operation_id) == (300, 1000)
+
+    _executer("UPDATE paiements SET montant = 150 WHERE id = 1")
+    assert _soldes(operation_id) == (350, 950)
+
+    autre_id, _ = database.creer_operation(1, 500, 0.1, 2)
+    _executer("UPDATE paiements SET operation_id = ? WHERE id = 2", (autre_id,))
+    assert _soldes(operation_id) == (150, 1150)
+    assert _soldes(autre_id) == (200, 400)
+
+    _executer("DELETE FROM paiements WHERE id = 1")
+    assert _soldes(operation_id) == (0, 1300)
+    assert database.reconcilier_soldes() == 0
+
+
+# Insertion en masse (triggers retirés le temps de l'insertion): mêmes soldes, triggers rétablis
+def test_soldes_insertion_en_masse(base):
+    operation_id = _operation_payee([100])
+    lignes = [(operation_id, 1, "Ordinaire", 50, "2024-01-01 10:00:00", "") for _ in range(4)]
+    database.transaction_immediate(lambda conn: database.inserer_paiements_en_masse(conn, lignes))
+    assert _soldes(operation_id) == (300, 1000)
+
+    database.enregistrer_paiement(operation_id, 1, "Ordinaire", 100)
+    assert _soldes(operation_id) == (400, 900)
+    assert database.reconcilier_soldes() == 0
+
+
+# Écart d'arrondi flottant: rien à corriger
+def test_reconcilier_ignore_les_arrondis(base):
+    operation_id = _operation_payee([100.1, 200.2])
+    _fixer_soldes(operation_id, 300.3 + 1e-9, 1300 - 300.3 - 1e-9)
+
+    assert database.reconcilier_soldes() == 0
+
+
+# Écart réel: soldes recalculés depuis les paiements
+def test_reconcilier_corrige_les_ecarts(base):
+    operation_id = _operation_payee([100, 200])
+    _fixer_soldes(operation_id, 250, 1050)
+
+    assert database.reconcilier_soldes() == 1
+    assert _soldes(operation_id) == (300, 1000)
@@ -0,0 +1,42 @@
+from datetime import date
+
+import database
+import traitement_nuit
+
+
+def _executer(sql, parametres=()):
+    with database.connexion() as conn:
+        conn.execute(sql, parametres)
+        conn.commit()
+
+
+def _operation(operation_id):
+    with database.connexion() as conn:
+        return conn.execute("SELECT total_paye, statut, prochaine_echeance, en_retard FROM operations WHERE id = ?",
+                            (operation_id,)).fetchone()
+
+
+# Chaque étape corrige ce qui s'écarte de sa règle, puis un second passage n'a plus rien à modifier
+def test_etapes_du_traitement_de_nuit(base):
+    database.ajouter_client("Alpha", "", "")
+    # Une échéance sur quatre payée, solde et échéance faussés
+    en_retard, _ = database.creer_operation(1, 1000, 0.0, 4)
+    database.enregistrer_paiement(en_retard, 1, "Ordinaire", 250)
+    _executer("UPDATE operations SET date_creation = '2024-01-01 10:00:00', prochaine_echeance = '2024-01-31', "
+              "total_paye = 0, reste_a_payer = 1000 WHERE id = ?", (en_retard,))
+    # Soldée mais restée En cours
+    soldee, _ = database.creer_operation(1, 200, 0.0, 2)
+    database.enregistrer_paiement(soldee, 1, "Ordinaire", 200)
+    _executer("UPDATE operations SET statut = 'En cours' WHERE id = ?", (soldee,))
+    # Marquée en retard avant sa première échéance
+    a_jour, _ = database.creer_operation(1, 300, 0.0, 3)
+    _executer("UPDATE operations SET en_retard = 1 WHERE id = ?", (a_jour,))
+
+    bilan = traitement_nuit.executer(date(2024, 3, 15), taille_lot=2)
+
+    assert bilan == {'soldes': 1, 'statuts': 1, 'echeances': 1, 'retards': 2}
+    assert _operation(en_retard) == (250, 'En cours', '2024-03-01', 1)
+    assert _operation(soldee)[1] == 'Terminé'
+    assert _operation(a_jour)[3] == 0
+    assert traitement_nuit.executer(date(2024, 3, 15)) == dict.fromkeys(traitement_nuit.ETAPES, 0)
+
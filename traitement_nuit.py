@@ -0,0 +1,74 @@
+from datetime import date
+
+import database
+import instrumentation
+
+# Nombre d'opérations (plage d'identifiants) traitées par transaction
+TAILLE_LOT = 10000
+
+# Instructions ensemblistes appliquées à chaque plage d'opérations [debut, fin), dans l'ordre:
+# les soldes d'abord, dont dépendent statut, échéance et retard
+ETAPES = {
+    # total_paye et reste_a_payer recalculés depuis les paiements
+    'soldes': '''
+        UPDATE operations
+        SET total_paye = totaux.total, reste_a_payer = operations.montant_total - totaux.total
+        FROM (
+            SELECT o.id, COALESCE(SUM(p.montant), 0) AS total
+            FROM operations o
+            LEFT JOIN paiements p ON p.operation_id = o.id
+            WHERE o.id >= :debut AND o.id < :fin
+            GROUP BY o.id
+        ) AS totaux
+        WHERE totaux.id = operations.id
+          AND (ABS(operations.total_paye - totaux.total) > :tolerance
+               OR ABS(operations.reste_a_payer - (operations.montant_total - totaux.total)) > :tolerance)
+    ''',
+    # Terminé une fois soldée (y compris par paiements anticipés), de nouveau En cours sinon
+    'statuts': '''
+        UPDATE operations
+        SET statut = CASE WHEN reste_a_payer < :tolerance THEN 'Terminé' ELSE 'En cours' END
+        WHERE id >= :debut AND id < :fin
+          AND statut != CASE WHEN reste_a_payer < :tolerance THEN 'Terminé' ELSE 'En cours' END
+    ''',
+    # Prochaine échéance = première échéance non couverte par les montants payés (database.SQL_PROCHAINE_ECHEANCE),
+    # corrigée dans les deux sens: fait foi pour en_retard
+    'echeances': f'''
+        UPDATE operations
+        SET prochaine_echeance = {database.SQL_PROCHAINE_ECHEANCE}
+        WHERE id >= :debut AND id < :fin AND statut = 'En cours' AND montant_total > 0 AND duree_mois > 0
+          AND prochaine_echeance IS NOT {database.SQL_PROCHAINE_ECHEANCE}
+    ''',
+    # En retard: en cours et échéance dépassée à la date de référence
+    'retards': '''
+        UPDATE operations
+        SET en_retard = COALESCE(statut = 'En cours' AND prochaine_echeance < :jour, 0)
+        WHERE id >= :debut AND id < :fin
+          AND en_retard != COALESCE(statut = 'En cours' AND prochaine_echeance < :jour, 0)
+    ''',
+}
+
+
+def _traiter_plage(conn, parametres):
+    return {etape: conn.execute(sql, parametres).rowcount for etape, sql in ETAPES.items()}
+
+
+# Traitement de nuit de toutes les opérations, par plages de `taille_lot` identifiants,
+# une transaction par plage. Renvoie le nombre d'opérations modifiées par étape.
+@database.ecriture
+@instrumentation.tracer
+def executer(date_reference=None, taille_lot=TAILLE_LOT):
+    jour = (date_reference or date.today()).isoformat()
+    with database.connexion() as conn:
+        premier, dernier = conn.execute("SELECT MIN(id), MAX(id) FROM operations").fetchone()
+
+    totaux = dict.fromkeys(ETAPES, 0)
+    if premier is None:
+        return totaux
+    for debut in range(premier, dernier + 1, taille_lot):
+        parametres = {'debut': debut, 'fin': debut + taille_lot, 'jour': jour,
+                      'tolerance': database.TOLERANCE_SOLDE, 'jours': database.JOURS_PAR_ECHEANCE}
+        modifiees = database.transaction_immediate(lambda conn: _traiter_plage(conn, parametres))
+        for etape, nb in modifiees.items():
+            totaux[etape] += nb
+    return totaux